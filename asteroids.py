@@ -4,22 +4,60 @@
 # by Brett and David Smith
 # 12/14/2018
 
+import time
+_STARTUP_T0 = time.perf_counter()       # Start of the --time-startup report
+
+import argparse
 import math
+import os
+import numpy as np
 import pygame as pg
 import pygame.display as pgd
 import random
-import time
+import threading
 
 #from spaceobjects import *
 from spaceobjects.Spaceobjects import *
+from spaceobjects.Ecs import find_distances, find_impacts, find_in_view, find_overlaps
+from spaceobjects.Spritecache import ScaledSpriteCache
+from profiler import FrameProfiler
+from lod import LodScheduler
+from particles import ParticleSystem
+from world import ChunkedWorld
+from parallel import ParallelChunkedWorld
+from spawn import SpawnPlacer
+from background import BackgroundLayer
+from capture import FrameCapture, LiveInput, ReplayInput, CAPTURE_FORMAT_CHUNKS, CAPTURE_FORMAT_IMAGES
+from metrics import MetricsLog, METRICS_FORMAT_NDJSON, METRICS_FORMAT_CSV
+from telemetry import TelemetryServer, TELEMETRY_DEFAULT_PORT, int_range, parse_bool
+from pacing import FramePacer, PACING_ADAPTIVE, PACING_HYBRID, PACING_SLEEP, PACING_SPIN
 
 # Constants
 SCREEN_WIDTH = 800
 SCREEN_HEIGHT = 600
 GAMESPEED_FPS = 30
-
-LEVEL_WIDTH = 4*SCREEN_WIDTH
-LEVEL_HEIGHT = 3*SCREEN_HEIGHT
+ANIMATION_TICK_SECS = 1 / GAMESPEED_FPS     # Simulation time per tick used to play animations
+
+LEVEL_SCREENS_X = 4
+LEVEL_SCREENS_Y = 3
+LEVEL_WIDTH = LEVEL_SCREENS_X*SCREEN_WIDTH
+LEVEL_HEIGHT = LEVEL_SCREENS_Y*SCREEN_HEIGHT
+
+# Chunked world: only chunks around the camera are simulated; distant asteroids sleep as compact arrays.
+# Enable for very large levels (e.g. 100x100 screens).
+WORLD_CHUNKING_ENABLED = False
+WORLD_CHUNK_WIDTH = SCREEN_WIDTH
+WORLD_CHUNK_HEIGHT = SCREEN_HEIGHT
+WORLD_ACTIVE_RADIUS = 1                 # Chunks around the camera's chunk that are resident
+WORLD_MAX_RESIDENT_CHUNKS = 16          # Memory budget of resident chunks
+WORLD_RESIDENCY_INTERVAL = 10           # Ticks between chunk activation updates
+WORLD_PARALLEL = False                  # Simulate sleeping asteroids every tick, in bands on worker processes
+WORLD_WORKERS = 4                       # Worker processes of the parallel world (0 simulates in the main process)
+WORLD_SHARED_ROWS = 131072              # Sleeping asteroids (and weapons) the parallel world's workers can hold
+
+# Stress mode (--stress): a huge level full of asteroids in the parallel chunked world
+STRESS_LEVEL_SCREENS = 100              # Level size in screens along each axis
+STRESS_ASTEROID_COUNT = 50000
 
 CAMERA_X_DECEL_DIST = SCREEN_WIDTH // 4
 CAMERA_Y_DECEL_DIST = SCREEN_HEIGHT // 4
@@ -28,13 +66,87 @@ SHIP_START_LOCATION = (LEVEL_WIDTH//2, LEVEL_HEIGHT//2)
 
 ASTEROID_STARTING_COUNT = 10
 
+# Spawn placement
+SPAWN_MIN_SEPARATION = 60               # Distance between asteroids spawned for a level
+SPAWN_SHIP_CLEARANCE = 250              # Level spawns keep this far from the ship and its start location
+SPAWN_FRAGMENT_SHIP_CLEARANCE = 48      # Fragments of a broken asteroid keep this far from the ship
+SPAWN_MAX_ATTEMPTS = 30                 # Candidate points tried per asteroid
+
 DRAW_LEVEL_BORDER = True        # Show border around the level
-HUDMAP_SCALING_FACTOR = 0.05
+BACKGROUND_TILE_SIZE = 256      # Background layers are pre-rendered in tiles of this size
+BACKGROUND_MAX_TILES = 128      # Rendered tiles cached per background layer
+BACKGROUND_STARS_PER_TILE = 0   # Stars in the level's background (0 for plain black)
+BACKGROUND_PARALLAX_STARS_PER_TILE = 0     # Stars in a distant, slower scrolling layer (0 for no parallax layer)
+BACKGROUND_PARALLAX_FACTOR = 0.5
+HUDMAP_SCALING_FACTOR = min(0.05, 160 / LEVEL_WIDTH)
 
 GAME_FONT = "unispacebold"
 
+RENDER_BACKEND = RENDER_BACKEND_SPRITE      # RENDER_BACKEND_SPRITE (PNG bitmaps) or RENDER_BACKEND_VECTOR (polygons)
+SPRITE_ATLAS_ENABLED = True                 # Pack sprites and pre-rotated variants into an atlas at startup
+SPRITE_ATLAS_ROTATION_STEPS = 120
+
 SCORE_ASTEROID_HIT = 10
 
+WEAPON_SWEPT_COLLISIONS = True  # Sweep weapons along their movement each tick, so fast shots can't pass through asteroids
+
+LOD_ENABLED = True              # Update asteroids far from the action at a reduced rate
+LOD_REDUCED_RATE_TICKS = 8
+LOD_VIEWPORT_MARGIN = 100
+LOD_ACTIVE_RADIUS = 200
+
+PARTICLES_MAX = 20000           # Particle ring buffer capacity
+PARTICLES_PER_HIT = 12          # Debris particles per asteroid size step when an asteroid is hit
+PARTICLE_LIFE_TICKS = 25
+
+RENDER_SCALE = 1.0              # Fraction of the screen resolution the game world is rendered at before upscaling
+RENDER_SCALE_DYNAMIC = False    # Lower/raise the render scale to hold GAMESPEED_FPS
+RENDER_SCALE_MIN = 0.5
+RENDER_SCALE_STEP = 0.125
+SCALED_SPRITE_CACHE_SIZE = 4096 # Scaled sprites kept for reduced render scales and camera zoom levels
+
+CAMERA_ZOOM_LEVELS = [1.0, 0.75, 0.5, 0.35]     # Zoom levels selected with <-> and <=> (1.0 = no zoom)
+
+# View layouts: viewports on parts of the display showing the same world.  The first view follows the ship; the
+# others are spectator views zoomed out as far as the level allows.
+VIEW_LAYOUT_SINGLE = "single"
+VIEW_LAYOUT_SPECTATOR = "spectator"     # Ship view with a spectator view inset in the corner
+VIEW_LAYOUT_SPLIT = "split"             # Ship view and spectator view side by side (split screen)
+VIEW_LAYOUT = VIEW_LAYOUT_SINGLE
+VIEW_LAYOUTS = [VIEW_LAYOUT_SINGLE, VIEW_LAYOUT_SPECTATOR, VIEW_LAYOUT_SPLIT]     # Cycled with <F5>
+SPECTATOR_INSET_SIZE = (200, 150)
+VIEW_FRAME_COLOR = (128, 128, 128)
+
+# Images loaded by the background asset loading thread during startup
+ASSET_IMAGES = ["asteroid0.png", "asteroid1.png", "asteroid2.png", "plasma.png", "ship.png",
+                "explosion0.png", "explosion1.png", "explosion2.png", "explosion3.png", "explosion4.png"]
+
+# Keys handled while held down (key repeat).  Their state is recorded with the rest of the input for replays.
+HELD_KEYS = [pg.K_LEFT, pg.K_RIGHT, pg.K_LSHIFT]
+
+CAPTURE_QUEUE_FRAMES = 16       # Frames waiting for the capture writer before frames are dropped
+CAPTURE_CHUNK_FRAMES = 30       # Frames compressed together in the capture file
+
+METRICS_MAX_BYTES = 64 * 2**20  # Size at which the metrics log is rotated
+METRICS_BACKUP_COUNT = 5        # Rotated metrics logs kept
+METRICS_QUEUE_LINES = 1024      # Lines waiting for the metrics writer before lines are dropped
+
+TELEMETRY_STREAM_INTERVAL = 0.1 # Seconds between frame stats sent to telemetry clients
+TELEMETRY_MAX_SPAWN = 5000      # Most asteroids a spawn command adds, and most waiting to be spawned
+TELEMETRY_SPAWN_PER_TICK = 100  # Asteroids spawned per tick; larger spawns are spread over the following ticks
+
+# Telemetry commands: runtime knobs and the parser of their value.  Applied by apply_command() at a tick boundary.
+TELEMETRY_COMMANDS = {"fps": int, "lod_enabled": parse_bool, "lod_reduced_rate_ticks": int,
+                      "lod_viewport_margin": int, "lod_active_radius": int, "sprite_cache_size": int,
+                      "background_max_tiles": int, "spawn": int_range(0, TELEMETRY_MAX_SPAWN)}
+
+FRAME_PACING = PACING_ADAPTIVE  # PACING_SLEEP, PACING_HYBRID, PACING_SPIN or PACING_ADAPTIVE (see pacing.py)
+FRAME_PACING_SPIN_MARGIN = 0.002    # Seconds spun before each frame deadline with PACING_HYBRID
+
+PROFILER_ENABLED = False        # Record per-stage frame times from startup (otherwise from when F3 first shows the overlay)
+PROFILER_HISTORY_SECS = 10      # Seconds of frame history kept for the profiler overlay and trace export
+PROFILER_TRACE_FILENAME = "trace_{}.json"
+
 
 class Viewport:
 
@@ -52,8 +164,37 @@ class Viewport:
             self.x = cam_x
             self.y = cam_y
 
+            # Zoom (below 1 shows more of the level) and the viewport's render scale.  Their product is the number of
+            # display pixels per world pixel.
+            self.zoom = 1
+            self.render_scale = 1
+            self.scale = 1
+
+            # Size of the camera's view in world pixels
+            self.view_width = display_width
+            self.view_height = display_height
+
             # Stores camera tracking limit coords
-            self.cam_limit = {"left": self.display_width//2, "right": self.level_width - self.display_width//2, "top": self.display_height//2, "bottom": self.level_height - self.display_height//2}
+            self.cam_limit = {"left": self.view_width//2, "right": self.level_width - self.view_width//2, "top": self.view_height//2, "bottom": self.level_height - self.view_height//2}
+
+
+        def set_zoom(self, zoom):
+            """
+            Set the camera zoom.  Zooming out is limited so that the view never exceeds the level.
+            :param zoom: Zoom factor (1 = no zoom, 0.5 = twice as much of the level in each direction).
+            :return: None
+            """
+            self.zoom = max(zoom, self.display_width / self.level_width, self.display_height / self.level_height)
+            self.view_width = int(round(self.display_width / self.zoom))
+            self.view_height = int(round(self.display_height / self.zoom))
+            self.cam_limit = {"left": self.view_width//2, "right": self.level_width - self.view_width//2, "top": self.view_height//2, "bottom": self.level_height - self.view_height//2}
+            self.scale = self.render_scale * self.zoom
+            self._abrupt_update(self.x, self.y)
+
+
+        def set_render_scale(self, render_scale):
+            self.render_scale = render_scale
+            self.scale = self.render_scale * self.zoom
 
 
         def apply(self, x, y):
@@ -65,11 +206,25 @@ class Viewport:
             :return: Object's camera display coordinates. (Translated by the camera from world coordinates.)
             """
             # Convert cam's center coords to upper left coord
-            cam_left_corner = self.x - self.display_width // 2
-            cam_top_corner = self.y - self.display_height // 2
+            cam_left_corner = self.x - self.view_width // 2
+            cam_top_corner = self.y - self.view_height // 2
 
             # Translate x,y by cam coords
-            return (x - cam_left_corner, y - cam_top_corner)
+            if self.scale == 1:
+                return (x - cam_left_corner, y - cam_top_corner)
+            return ((x - cam_left_corner) * self.scale, (y - cam_top_corner) * self.scale)
+
+
+        def is_in_view(self, x, y, margin=0):
+            """
+            Test whether a world coordinate is within the camera's view.
+            :param x: World x coordinate.
+            :param y: World y coordinate.
+            :param margin: Distance outside the view that still counts as in view.
+            :return: True or False
+            """
+            return (abs(x - self.x) <= self.view_width // 2 + margin and
+                    abs(y - self.y) <= self.view_height // 2 + margin)
 
 
         def update(self, type_string, new_x, new_y, *args):
@@ -95,10 +250,10 @@ class Viewport:
             :param new_y: Next desired y position for camera center.
             :return: None
             """
-            camtracklimit_right = self.level_width - self.display_width//2
-            camtracklimit_left = self.display_width//2
-            camtracklimit_top = self.display_height//2
-            camtracklimit_bottom = self.level_height - self.display_height//2
+            camtracklimit_right = self.level_width - self.view_width//2
+            camtracklimit_left = self.view_width//2
+            camtracklimit_top = self.view_height//2
+            camtracklimit_bottom = self.level_height - self.view_height//2
 
             # Allow camera tracking until 1/2 screen width/height from edge
             self.x = min(max(new_x, camtracklimit_left), camtracklimit_right)
@@ -181,21 +336,82 @@ class Viewport:
                     self.y = min(new_y, scaled_y)
 
 
-    def __init__(self, viewport_width, viewport_height, level_width=None, level_height=None):
+    def __init__(self, viewport_width, viewport_height, level_width=None, level_height=None, render_scale=1.0,
+                 display=None, display_rect=None, sprite_cache=None, offscreen=False):
+        """
+        :param viewport_width: Width of the viewport on the display.
+        :param viewport_height: Height of the viewport on the display.
+        :param level_width: Level width (defaults to the viewport width).
+        :param level_height: Level height (defaults to the viewport height).
+        :param render_scale: Fraction of the viewport resolution the world is rendered at.
+        :param display: Display surface shared with other viewports (None creates the main pygame display).
+        :param display_rect: Part of the display this viewport draws on (None for all of it).
+        :param sprite_cache: ScaledSpriteCache shared with other viewports (None creates one).
+        :param offscreen: True/False - Always draw on a separate surface that present() copies to the display.  For
+                          viewports inset over another viewport, which would otherwise draw over them.
+        """
         self.width = viewport_width
         self.height = viewport_height
         self.level_width = level_width if level_width is not None else viewport_width
         self.level_height = level_height if level_height is not None else viewport_height
 
         # Create main pygame display
-        self.display = pg.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+        self.display = display if display is not None else pg.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+
+        # Part of the display the viewport covers
+        self.rect = pg.Rect(display_rect) if display_rect is not None else self.display.get_rect()
+        self.target = self.display if display_rect is None else self.display.subsurface(self.rect)
 
         # Start with no camera
         self.camera = None
 
+        # Sprites scaled to the render scale
+        self.sprite_cache = sprite_cache if sprite_cache is not None else ScaledSpriteCache(SCALED_SPRITE_CACHE_SIZE)
+
+        # Surface the game world is drawn on.  The viewport's part of the display unless rendering at a reduced scale
+        # or offscreen.
+        self.offscreen = offscreen
+        self.surface = self.target
+        self.render_scale = 1.0
+        self.set_render_scale(render_scale)
+
 
     def create_camera(self, cam_x, cam_y):
         self.camera = Viewport.Camera(self.width, self.height, self.level_width, self.level_height, cam_x, cam_y)
+        self.camera.set_render_scale(self.render_scale)
+
+
+    def set_render_scale(self, render_scale):
+        """
+        Set the resolution the game world is rendered at, as a fraction of the display resolution.  Below 1 the world
+        is drawn on a smaller surface and upscaled to the display by present().
+        :param render_scale: Fraction of the display resolution (0 < render_scale <= 1).
+        :return: None
+        """
+        render_scale = min(render_scale, 1.0)
+        if render_scale == 1 and not self.offscreen:
+            self.surface = self.target
+        elif render_scale != self.render_scale or self.surface is self.target:
+            w, h = self.target.get_size()
+            self.surface = pg.Surface((max(int(w * render_scale), 1), max(int(h * render_scale), 1))).convert()
+
+        self.render_scale = render_scale
+        if self.camera is not None:
+            self.camera.set_render_scale(render_scale)
+
+
+    def present(self):
+        """
+        Upscale the world surface to the viewport's part of the display.  Call after drawing the world and before
+        drawing the HUD.
+        :return: None
+        """
+        if self.surface is self.target:
+            return
+        if self.surface.get_size() == self.target.get_size():
+            self.target.blit(self.surface, (0, 0))
+        else:
+            pg.transform.scale(self.surface, self.target.get_size(), self.target)
 
 
 
@@ -203,15 +419,56 @@ class Viewport:
         if sprite is None:
             return
 
+        if self.camera is not None and self.camera.scale != 1:
+            sprite = self.sprite_cache.get(sprite, self.camera.scale)
+            x, y = self.camera.apply(x, y)
+            self.surface.blit(sprite, (x - Viewport._half_w(sprite), y - Viewport._half_h(sprite)))
+            return
+
         # Calc upper left coord of sprite
         x_temp = x - Viewport._half_w(sprite)
         y_temp = y - Viewport._half_h(sprite)
 
         if self.camera is None:
-            self.display.blit(sprite, (x_temp, y_temp))
+            self.surface.blit(sprite, (x_temp, y_temp))
         else:
             translated_to_cam_x, translated_to_cam_y = self.camera.apply(x_temp, y_temp)
-            self.display.blit(sprite, (translated_to_cam_x, translated_to_cam_y))
+            self.surface.blit(sprite, (translated_to_cam_x, translated_to_cam_y))
+
+
+    def render_batch(self, items):
+        """
+        Render many sprites with a single blits call.  Sprites from the sprite atlas are blitted as sub-rects of their
+        atlas page.  At a camera scale other than 1 (reduced render scale or zoom), sprites come from the scaled
+        sprite cache, so no sprite is scaled per draw.
+        :param items: Iterable of (sprite, x, y) with x, y the world coordinates of the sprite center.
+        :return: None
+        """
+        scale = self.camera.scale if self.camera is not None else 1
+        blit_list = []
+        for sprite, x, y in items:
+            if sprite is None:
+                continue
+
+            if scale != 1:
+                sprite = self.sprite_cache.get(sprite, scale)
+                w, h = sprite.get_size()
+                x, y = self.camera.apply(x, y)
+                blit_list.append((sprite, (x - w//2, y - h//2)))
+                continue
+
+            w, h = sprite.get_size()
+            dest = (x - w//2, y - h//2)
+            if self.camera is not None:
+                dest = self.camera.apply(*dest)
+
+            region = sprite_atlas_region(sprite)
+            if region is None:
+                blit_list.append((sprite, dest))
+            else:
+                blit_list.append((region[0], dest, region[1]))
+
+        self.surface.blits(blit_list, doreturn=False)
 
 
     @staticmethod
@@ -225,6 +482,142 @@ class Viewport:
 
 
 
+class RenderQueue:
+    """
+    Sprites to draw on the viewports that show one world (split screen, spectator views).  Each sprite is culled
+    against every viewport's camera in one pass, and an object's sprite is resolved (animation frame selected and
+    rotated) only once per frame, however many viewports show it.
+    """
+
+    def __init__(self, viewports):
+        """
+        :param viewports: List of Viewport to draw on.
+        """
+        self.viewports = viewports
+        self._queues = [[] for viewport in viewports]
+
+        # Sprites resolved, and draws that reused a sprite already resolved for another viewport
+        self.resolved = 0
+        self.shared = 0
+
+
+    def add(self, sprite, x, y):
+        """
+        Queue an already resolved sprite.
+        :param sprite: Sprite (None draws nothing).
+        :param x: World x coordinate of the sprite center.
+        :param y: World y coordinate of the sprite center.
+        :return: None
+        """
+        if sprite is None:
+            return
+        margin = max(sprite.get_size()) // 2
+        for queue, viewport in zip(self._queues, self.viewports):
+            if viewport.camera.is_in_view(x, y, margin):
+                queue.append((sprite, x, y))
+
+
+    def add_objects(self, objects):
+        """
+        Queue the sprites of space objects.  Objects are culled against each view in one batch, and objects outside
+        every view are not resolved.
+        :param objects: Sequence of space objects.
+        :return: None
+        """
+        registry = get_registry()
+        columns = registry.columns
+        rows = entity_rows(objects)
+        margins = np.maximum(columns["sprite_width"][rows], columns["sprite_height"][rows])
+        shown = [find_in_view(registry, rows, viewport.camera, margins) for viewport in self.viewports]
+        xs = columns["coord_x"][rows].tolist()
+        ys = columns["coord_y"][rows].tolist()
+
+        for i in np.flatnonzero(np.logical_or.reduce(shown)).tolist():
+            sprite = None
+            for queue, in_view in zip(self._queues, shown):
+                if not in_view[i]:
+                    continue
+                if sprite is None:
+                    sprite = objects[i].render()
+                    if sprite is None:
+                        break
+                    self.resolved += 1
+                else:
+                    self.shared += 1
+                queue.append((sprite, xs[i], ys[i]))
+
+
+    def flush(self):
+        """
+        Draw the queued sprites on each viewport with one batch per viewport and empty the queue.
+        :return: None
+        """
+        for queue, viewport in zip(self._queues, self.viewports):
+            if queue:
+                viewport.render_batch(queue)
+                queue.clear()
+
+
+
+class DynamicResolution:
+    """
+    Holds the frame rate by lowering the viewports' render scale when frames take longer than the frame budget and
+    raising it again when there is enough headroom.
+    """
+
+    def __init__(self, viewports, target_fps, min_scale=0.5, step=0.125, cooldown_frames=30):
+        """
+        :param viewports: List of Viewport whose render scale is controlled (all are kept at the same scale).
+        :param target_fps: Frame rate to hold.  0 (no frame rate limit) holds none and leaves the scale as it is.
+        :param min_scale: Lowest render scale.
+        :param step: Render scale change per adjustment.
+        :param cooldown_frames: Frames to wait after an adjustment before the next one.
+        """
+        self.viewports = viewports
+        self.min_scale = min_scale
+        self.step = step
+        self.cooldown_frames = cooldown_frames
+
+        self.average_secs = 0
+        self.set_target_fps(target_fps)
+
+
+    def set_target_fps(self, target_fps):
+        """
+        Change the frame rate to hold.  The next adjustment waits a cooldown so it is based on frames at the new rate.
+        :param target_fps: Frame rate to hold (0 for none).
+        :return: None
+        """
+        self.budget_secs = 1 / target_fps if target_fps else None
+        self._cooldown = self.cooldown_frames
+
+
+    def update(self, frame_secs):
+        """
+        :param frame_secs: Time the last frame took, excluding frame rate limiting wait.
+        :return: None
+        """
+        self.average_secs += (frame_secs - self.average_secs) * 0.1
+        self._cooldown -= 1
+        if self._cooldown > 0 or self.budget_secs is None:
+            return
+
+        scale = self.viewports[0].render_scale
+        if self.average_secs > self.budget_secs * 0.9 and scale > self.min_scale:
+            scale = max(scale - self.step, self.min_scale)
+        elif scale < 1:
+            # Fill cost grows with the square of the scale; only raise when the larger frame would still fit
+            raised = min(scale + self.step, 1.0)
+            if self.average_secs * (raised / scale) ** 2 < self.budget_secs * 0.8:
+                scale = raised
+
+        if scale != self.viewports[0].render_scale:
+            for viewport in self.viewports:
+                viewport.set_render_scale(scale)
+            self._cooldown = self.cooldown_frames
+
+
+
 class GameData:
     high_score = 0
 
@@ -243,7 +636,7 @@ class GameData:
 
 
 
-def render_map(map_surface, ship, asteroids_list, scaling_factor=0.1, transparent_background=True):
+def render_map(map_surface, ship, asteroids_list, scaling_factor=0.1, transparent_background=True, sleeping=None):
     def scale_xy(x, y, scaling_factor):
         x = int(x * scaling_factor)
         y = int(y * scaling_factor)
@@ -263,28 +656,44 @@ def render_map(map_surface, ship, asteroids_list, scaling_factor=0.1, transparen
     # Draw map border
     pg.draw.rect(map_surface, colormap["blue"], (0, 0, w, h), 1)
 
-    # "Overlay" a pixel array on the surface to allow x,y access to pixels
-    map_pa = pg.PixelArray(map_surface)
+    # "Overlay" a pixel array on the surface to allow x,y access to pixels (and drawing many at once)
+    map_pa = pg.surfarray.pixels2d(map_surface)
 
     # Ship position
     x, y = scale_xy(ship.coord_x, ship.coord_y, scaling_factor)
     if (x >= 0 and x < w) and (y >= 0 and y < h) and ship.is_alive:
-        map_pa[x, y] = colormap["red"]
+        map_pa[x, y] = map_surface.map_rgb(colormap["red"])
+
+    # Asteroid positions, scaled in one batch from the component arrays and the sleeping asteroids' positions
+    columns = get_registry().columns
+    rows = entity_rows(asteroids_list)
+    xs = columns["coord_x"][rows]
+    ys = columns["coord_y"][rows]
+    if sleeping is not None and len(sleeping):
+        xs = np.concatenate((xs, sleeping[:, 0]))
+        ys = np.concatenate((ys, sleeping[:, 1]))
+    xs = (xs * scaling_factor).astype(int)
+    ys = (ys * scaling_factor).astype(int)
+    on_map = (xs >= 0) & (xs < w) & (ys >= 0) & (ys < h)
+    map_pa[xs[on_map], ys[on_map]] = map_surface.map_rgb(colormap["white"])
+
+    del map_pa                          # Unlock the surface
+    return
 
-    # Asteroid positions
-    for rock in asteroids_list:
-        x, y = scale_xy(rock.coord_x, rock.coord_y, scaling_factor)
-        if (x >= 0 and x < w) and (y >= 0 and y < h):
-            map_pa[x, y] = colormap["white"]
-        else:
-            continue
 
-    map_pa.close()
-    return
+# Installed font names (pygame enumerates system fonts again on every get_fonts() call where it finds none)
+_available_fonts = None
+
+
+def available_fonts():
+    global _available_fonts
+    if _available_fonts is None:
+        _available_fonts = pg.font.get_fonts()
+    return _available_fonts
 
 
 def choose_font(fonts, size):
-    available = pg.font.get_fonts()
+    available = available_fonts()
     # get_fonts() returns a list of lowercase spaceless font names
     choices = map(lambda x:x.lower().replace(' ', ''), fonts)
 
@@ -295,19 +704,38 @@ def choose_font(fonts, size):
 
 
 
-def render_hud(hud_surface, map_surface, ship, asteroids, game_data):
+def create_hud_assets():
+    """
+    Create the fonts and images used by the HUD and game over screen.  Called once so that nothing is loaded or
+    constructed per frame.
+    :return: Dict of HUD assets.
+    """
+    # Fonts that look good: unispacebold, impact, couriernew,
+    assets = {"gamefont": choose_font([GAME_FONT], 24),
+              "gameover_font": choose_font([GAME_FONT], 50),
+              "restart_font": choose_font([GAME_FONT], 25)}
+
+    # Ship image used to show lives remaining
+    ship_display = Ship(0, 0, 0, 0)
+    assets["ship_image"] = ship_display.render()
+
+    assets["lives_txt"] = assets["gamefont"].render("Lives: ", False, colormap["white"])
+    assets["gameover_txt"] = assets["gameover_font"].render("GAME OVER", False, colormap["white"])
+    assets["restart_txt"] = assets["restart_font"].render("(Press 'Enter' to Play Again)", False, colormap["white"])
+
+    return assets
+
+
+def render_hud(hud_surface, map_surface, ship, asteroids, game_data, sleeping=None):
     a, b, w, h = hud_surface.get_rect()
 
 
     # Update the map
-    render_map(map_surface, ship, asteroids, HUDMAP_SCALING_FACTOR, transparent_background=True)
+    render_map(map_surface, ship, asteroids, HUDMAP_SCALING_FACTOR, transparent_background=True, sleeping=sleeping)
 
-    #### WORKING HERE
-    # ** MUST IMPROVE BY MOVING SOME OF THIS OUT SO IT DOESN't GET COMPUTED EVERY TIME**
     # Display score
-    # Fonts that look good: unispacebold, impact, couriernew,
     HUD_SCORE_LOCATION = (int(w*.85), 5)
-    gamefont = choose_font(GAME_FONT, 24)
+    gamefont = hud_assets["gamefont"]
     score_txt = gamefont.render("Score: " + str(game_data.score), False, colormap["white"])
     highscore_txt = gamefont.render("High Score: " + str(GameData.high_score), False, colormap["white"])
 
@@ -318,11 +746,10 @@ def render_hud(hud_surface, map_surface, ship, asteroids, game_data):
 
     # Display lives remaining
     HUD_LIVES_LOCATION = (int(w*.05), 5)
-    lives_txt = gamefont.render("Lives: ", False, colormap["white"])
+    lives_txt = hud_assets["lives_txt"]
     lives_txt_width = lives_txt.get_rect().width
     hud_surface.blit(lives_txt, HUD_LIVES_LOCATION)
-    ship_display = Ship(0, 0, 0, 0)
-    ship_image = ship_display.render()
+    ship_image = hud_assets["ship_image"]
     for i in range(game_data.lives):
         ship_x_offset = i * (ship_image.get_rect().width + 2)
         hud_surface.blit(ship_image, ((lives_txt_width + 10 + HUD_LIVES_LOCATION[0]) + ship_x_offset, 5))
@@ -335,11 +762,19 @@ def render_hud(hud_surface, map_surface, ship, asteroids, game_data):
     SCREEN_WIDTH - LEVEL_WIDTH * HUDMAP_SCALING_FACTOR - 5, SCREEN_HEIGHT - LEVEL_HEIGHT * HUDMAP_SCALING_FACTOR - 5))
 
 
-def create_asteroids(number):
+def create_asteroids(number, keep_out=(), occupied=()):
+    """
+    Create asteroids spread over the level, apart from each other and clear of the ship's start location.
+    :param number: Number of asteroids.
+    :param keep_out: Other (x, y) points to keep clear, such as the ship's current position.
+    :param occupied: (x, y) positions of the asteroids already in the level, which the new ones are placed apart from.
+    :return: List of asteroids.
+    """
     _asteroids = []
 
-    for i in range(number):
-        a = Asteroid(random.randint(0, LEVEL_WIDTH), random.randint(0, LEVEL_HEIGHT), random.randint(-5, 5), random.randint(-5, 5))
+    clear = [(x, y, SPAWN_SHIP_CLEARANCE) for x, y in [SHIP_START_LOCATION] + list(keep_out)]
+    for x, y in spawner.place(number, SPAWN_MIN_SEPARATION, clear, occupied=occupied):
+        a = Asteroid(x, y, random.randint(-5, 5), random.randint(-5, 5))
         a.set_move_bounds(LEVEL_WIDTH, LEVEL_HEIGHT, edge_bounce=False)
         a.rotate(random.randint(0, 360))
         a.select_size(random.randint(0, Asteroid.MAX_SIZE))
@@ -347,20 +782,222 @@ def create_asteroids(number):
     return _asteroids
 
 
-def init_game():
-    global gamedata, screen, viewport, hud_surface, map_surface
+def create_background_layers():
+    """
+    Create the background layers, furthest first.  The first layer is opaque and replaces clearing the screen.
+    :return: List of BackgroundLayer.
+    """
+    layers = []
+    if BACKGROUND_PARALLAX_STARS_PER_TILE:
+        width = int(SCREEN_WIDTH + (LEVEL_WIDTH - SCREEN_WIDTH) * BACKGROUND_PARALLAX_FACTOR)
+        height = int(SCREEN_HEIGHT + (LEVEL_HEIGHT - SCREEN_HEIGHT) * BACKGROUND_PARALLAX_FACTOR)
+        layers.append(BackgroundLayer(width, height, BACKGROUND_TILE_SIZE, BACKGROUND_PARALLAX_FACTOR,
+                                      stars_per_tile=BACKGROUND_PARALLAX_STARS_PER_TILE, seed=1,
+                                      max_tiles=BACKGROUND_MAX_TILES))
+
+    # Level layer with the border
+    layers.append(BackgroundLayer(LEVEL_WIDTH, LEVEL_HEIGHT, BACKGROUND_TILE_SIZE, opaque=not layers,
+                                  background_color=colormap["black"],
+                                  border_color=colormap["red"] if DRAW_LEVEL_BORDER else None,
+                                  stars_per_tile=BACKGROUND_STARS_PER_TILE, max_tiles=BACKGROUND_MAX_TILES))
+    return layers
+
+
+def create_viewports(layout, base_viewport, camera=None):
+    """
+    Create the viewports of a view layout on the display of a base viewport.  The viewports share the base viewport's
+    scaled sprite cache.
+    :param layout: VIEW_LAYOUT_SINGLE, VIEW_LAYOUT_SPECTATOR or VIEW_LAYOUT_SPLIT.
+    :param base_viewport: Viewport covering the whole display.  It is the ship view of layouts with a full screen
+                          ship view.
+    :param camera: Camera whose position and zoom the ship view takes (None for the base viewport's camera).
+    :return: List of Viewport.  The first is the ship view, the others are spectator views.
+    """
+    camera = camera if camera is not None else base_viewport.camera
+    w, h = base_viewport.display.get_size()
+
+    # (display rect, offscreen) of each view; None for the base viewport
+    if layout == VIEW_LAYOUT_SPLIT:
+        views = [((0, 0, w // 2, h), False), ((w // 2, 0, w - w // 2, h), False)]
+    elif layout == VIEW_LAYOUT_SPECTATOR:
+        inset_w, inset_h = SPECTATOR_INSET_SIZE
+        views = [None, ((5, h - inset_h - 5, inset_w, inset_h), True)]
+    else:
+        views = [None]
 
-    # Initialize pygame
-    pg.init()
+    viewports = []
+    for view in views:
+        if view is None:
+            viewport = base_viewport
+        else:
+            rect, offscreen = view
+            viewport = Viewport(rect[2], rect[3], base_viewport.level_width, base_viewport.level_height,
+                                base_viewport.render_scale, base_viewport.display, rect, base_viewport.sprite_cache,
+                                offscreen)
+            viewport.create_camera(camera.x, camera.y)
+        viewports.append(viewport)
+
+    ship_camera = viewports[0].camera
+    ship_camera.set_zoom(camera.zoom)
+    ship_camera.update(Viewport.Camera.UPDATETYPE_SIMPLE, camera.x, camera.y)
+    for spectator in viewports[1:]:
+        spectator.camera.set_zoom(0)
+    return viewports
+
+
+# (stage name, time) marks of startup, reported by --time-startup
+startup_marks = [("start", _STARTUP_T0)]
+
+
+def mark_startup(stage_name):
+    startup_marks.append((stage_name, time.perf_counter()))
+
+
+def startup_report():
+    """
+    :return: List of text lines with the time of each startup stage and the total time to the last mark.
+    """
+    lines = []
+    for (name, t), (previous_name, previous_t) in zip(startup_marks[1:], startup_marks):
+        lines.append("{:<20} {:8.1f} ms".format(name, (t - previous_t) * 1000))
+    lines.append("{:<20} {:8.1f} ms".format("total", (startup_marks[-1][1] - startup_marks[0][1]) * 1000))
+    return lines
+
+
+def load_assets(errors):
+    """
+    Load asset files and enumerate fonts.  Runs on the asset loading thread.
+    :param errors: List to which an exception raised while loading is appended.
+    :return: None
+    """
+    try:
+        for filename in ASSET_IMAGES:
+            load_image(filename)
+        available_fonts()
+    except Exception as e:
+        errors.append(e)
+
+
+def show_splash(surface):
+    """
+    Show a loading frame.  Uses pygame's built-in font so nothing has to be enumerated or loaded first.
+    :param surface: Display surface.
+    :return: None
+    """
+    surface.fill(colormap["black"])
+    loading_txt = pg.font.Font(None, 36).render("Loading...", True, colormap["white"])
+    surface.blit(loading_txt, ((surface.get_width() - loading_txt.get_width()) // 2,
+                               (surface.get_height() - loading_txt.get_height()) // 2))
+    pg.display.flip()
+
+
+def find_weapon_hits(weapons, rocks):
+    """
+    Find the asteroids hit by weapons this tick.  The weapons must already have moved this tick.  Each weapon hits at
+    most one asteroid and each asteroid is hit by at most one weapon.  With WEAPON_SWEPT_COLLISIONS the weapons are
+    swept along their movement and hits are taken in order of time of impact, so a weapon hits the first asteroid in
+    its path; otherwise only the hitboxes at the end of the tick are tested, in asteroid order.
+    :param weapons: Weapons (list or WeaponSlots).
+    :param rocks: List of candidate asteroids (such as the near asteroids).
+    :return: List of (weapon, asteroid index) hits.
+    """
+    weapons = list(weapons)
+    registry = get_registry()
+    weapon_rows = entity_rows(weapons)
+    rock_rows = entity_rows(rocks)
+    if WEAPON_SWEPT_COLLISIONS:
+        impacts = find_impacts(registry, weapon_rows, rock_rows)
+    else:
+        impacts = np.where(find_overlaps(registry, weapon_rows, rock_rows), 0.0, np.inf)
+
+    weapon_index, rock_index = np.nonzero(np.isfinite(impacts))
+    order = np.lexsort((weapon_index, rock_index, impacts[weapon_index, rock_index]))
+
+    hits = []
+    weapons_used = set()
+    rocks_used = set()
+    for j, i in zip(weapon_index[order].tolist(), rock_index[order].tolist()):
+        if j not in weapons_used and i not in rocks_used:
+            weapons_used.add(j)
+            rocks_used.add(i)
+            hits.append((weapons[j], i))
+    return hits
+
+
+def break_asteroid(rock, keep_out=(), rocks=()):
+    """
+    Create the smaller asteroids an asteroid breaks into when hit.
+    :param rock: Asteroid that was hit.
+    :param keep_out: (x, y) points the fragments are placed clear of, such as the ship.
+    :param rocks: Other asteroids the fragments are placed apart from (dead ones, such as the rock, are ignored).
+    :return: List of new asteroids (empty for the smallest size).
+    """
+    fragments = []
+    if rock.size > 0:
+        for i in range(Asteroid.MAX_SIZE - rock.size + 2):
+            a = Asteroid(rock.coord_x, rock.coord_y, random.randint(-5, 5), random.randint(-5, 5))
+            a.select_size(rock.size-1)
+            a.set_move_bounds(LEVEL_WIDTH, LEVEL_HEIGHT, edge_bounce=False)
+            a.rotate(random.randint(0, 360))
+            fragments.append(a)
+
+        # Spread the fragments over the broken asteroid without overlapping each other
+        separation = max(fragments[0].sprite_width, fragments[0].sprite_height)
+        area = (rock.coord_x, rock.coord_y, max(rock.sprite_width, rock.sprite_height))
+        clear = [(x, y, SPAWN_FRAGMENT_SHIP_CLEARANCE) for x, y in keep_out]
+        occupied = [(other.coord_x, other.coord_y) for other in rocks if other.is_alive and other is not rock]
+        for a, (x, y) in zip(fragments, spawner.place(len(fragments), separation, clear, area, occupied)):
+            a.coord_x = x
+            a.coord_y = y
+    return fragments
+
+
+def init_game(show_splash_frame=False):
+    global gamedata, screen, viewport, viewports, hud_surface, map_surface, hud_assets, profiler, vector_renderer, \
+        background_layers, spawner
+
+    # Initialize only the pygame subsystems the game uses (no audio or joystick)
+    pg.display.init()
+    pg.font.init()
+    mark_startup("pygame init")
+
+    # Select how space objects are drawn
+    set_render_backend(RENDER_BACKEND)
+    vector_renderer = None
+    if RENDER_BACKEND == RENDER_BACKEND_VECTOR:
+        from spaceobjects.Vectorrenderer import VectorRenderer
+        vector_renderer = VectorRenderer()
 
 
     # Globals
     gamedata = GameData()
+    spawner = SpawnPlacer(LEVEL_WIDTH, LEVEL_HEIGHT, SPAWN_MAX_ATTEMPTS)
 
     # Create viewport to control display
-    viewport = Viewport(SCREEN_WIDTH, SCREEN_HEIGHT, LEVEL_WIDTH, LEVEL_HEIGHT)
+    viewport = Viewport(SCREEN_WIDTH, SCREEN_HEIGHT, LEVEL_WIDTH, LEVEL_HEIGHT, RENDER_SCALE)
     viewport.create_camera(LEVEL_WIDTH//2, LEVEL_HEIGHT//2)
+    viewports = create_viewports(VIEW_LAYOUT, viewport)
     screen = viewport.display
+    mark_startup("display")
+
+    # Load assets in the background while the splash frame is shown
+    errors = []
+    loader = threading.Thread(target=load_assets, args=(errors,), daemon=True)
+    loader.start()
+    if show_splash_frame:
+        show_splash(screen)
+    while loader.is_alive():
+        pg.event.pump()                 # Keep the window responsive
+        loader.join(0.02)
+    if errors:
+        raise errors[0]
+    mark_startup("assets")
+
+    # Pack sprites into an atlas (needs the display to exist so the atlas can be converted to its format)
+    atlas = None
+    if SPRITE_ATLAS_ENABLED:
+        atlas = build_sprite_atlas([Asteroid, Plasma_weapon, Ship], SPRITE_ATLAS_ROTATION_STEPS)
+    mark_startup("sprite atlas")
 
     # Create a HUD overlay
     hud_surface = pg.Surface((SCREEN_WIDTH, SCREEN_HEIGHT))
@@ -368,109 +1005,268 @@ def init_game():
 
     map_surface = pg.Surface((LEVEL_WIDTH*HUDMAP_SCALING_FACTOR, LEVEL_HEIGHT*HUDMAP_SCALING_FACTOR))
 
-
-def game_loop():
-
-    clock = pg.time.Clock()
-
-    weapons = []
+    # Fonts and images for the HUD
+    hud_assets = create_hud_assets()
+
+    # Pre-rendered background (level border, stars)
+    background_layers = create_background_layers()
+
+    # Per-stage frame profiler (F3 toggles overlay, F4 exports trace)
+    profiler = FrameProfiler(PROFILER_HISTORY_SECS, round(1 / ANIMATION_TICK_SECS), PROFILER_ENABLED)
+    if atlas:
+        profiler.add_counter_source("atlas rotation", lambda: (atlas.hits, atlas.misses))
+    for i, layer in enumerate(background_layers):
+        profiler.add_counter_source("background tiles {}".format(i), lambda layer=layer: (layer.hits, layer.misses))
+    profiler.add_counter_source("scaled sprites", lambda: (viewport.sprite_cache.hits, viewport.sprite_cache.misses))
+    mark_startup("hud and background")
+
+
+def cached_surface_count():
+    """
+    :return: Number of surfaces held in the scaled sprite and background tile caches.
+    """
+    return len(viewport.sprite_cache) + sum(len(layer) for layer in background_layers)
+
+
+def apply_command(name, value, lod, resolution):
+    """
+    Apply a telemetry command (see TELEMETRY_COMMANDS) between ticks.
+    :param name: Command name.
+    :param value: Parsed value.
+    :param lod: The game's LodScheduler.
+    :param resolution: The game's DynamicResolution (None if the render scale is fixed).
+    :return: Number of asteroids to spawn (added over the following ticks by the game loop).
+    """
+    global GAMESPEED_FPS
+
+    if name == "fps":
+        GAMESPEED_FPS = max(value, 0)
+        if resolution:
+            resolution.set_target_fps(GAMESPEED_FPS)
+    elif name == "lod_enabled":
+        lod.enabled = value
+    elif name == "lod_reduced_rate_ticks":
+        lod.reduced_rate_ticks = max(value, 1)
+    elif name == "lod_viewport_margin":
+        lod.viewport_margin = max(value, 0)
+    elif name == "lod_active_radius":
+        lod.active_radius = max(value, 0)
+    elif name == "sprite_cache_size":
+        # The cache only evicts when adding, so a smaller cache starts over
+        cache = viewport.sprite_cache
+        cache.max_entries = max(value, 1)
+        if len(cache) > cache.max_entries:
+            cache.clear()
+    elif name == "background_max_tiles":
+        for layer in background_layers:
+            layer.max_tiles = max(value, 1)
+    elif name == "spawn":
+        return value
+    return 0
+
+
+def game_loop(max_frames=None, input_source=None, capture=None, metrics=None, telemetry=None):
+    """
+    Run the game until the window is closed or the player restarts after game over.
+    :param max_frames: Stop after this many frames (used for headless runs).  None runs until quit.
+    :param input_source: LiveInput or ReplayInput the player's input is read from (None reads live input).
+    :param capture: FrameCapture that each frame is captured to (None to not capture).
+    :param metrics: MetricsLog that each tick's metrics are recorded to (None to not record).
+    :param telemetry: TelemetryServer that frame stats are streamed to and commands are taken from (None for none).
+    :return: True if the game should be restarted, otherwise False.
+    """
+    # Frame pacing, with jitter histograms shown on the profiler overlay
+    pacer = FramePacer(GAMESPEED_FPS, FRAME_PACING, FRAME_PACING_SPIN_MARGIN,
+                       int(PROFILER_HISTORY_SECS / ANIMATION_TICK_SECS))
+    profiler.add_report_source("frame pacing", pacer.report_lines)
+    if input_source is None:
+        input_source = LiveInput(HELD_KEYS)
+
+    # Weapons in flight.  Respawned ships take over the slots, so shots fired before respawning keep counting.
+    weapons = WeaponSlots(Ship.WEAPON_PLASMA_MAXLIVE)
     dead_objects = []
-    asteroids = create_asteroids(ASTEROID_STARTING_COUNT)
+    lod = LodScheduler(LOD_REDUCED_RATE_TICKS, LOD_VIEWPORT_MARGIN, LOD_ACTIVE_RADIUS, LOD_ENABLED)
 
-    ship = Ship(SHIP_START_LOCATION[0], SHIP_START_LOCATION[1], 0, 0)
+    # The world owns the asteroids.  'asteroids' is its list of active asteroids.
+    if WORLD_PARALLEL:
+        world = ParallelChunkedWorld(LEVEL_WIDTH, LEVEL_HEIGHT, WORLD_CHUNK_WIDTH, WORLD_CHUNK_HEIGHT,
+                                     WORLD_ACTIVE_RADIUS, WORLD_MAX_RESIDENT_CHUNKS, WORLD_WORKERS, WORLD_SHARED_ROWS)
+    else:
+        world = ChunkedWorld(LEVEL_WIDTH, LEVEL_HEIGHT, WORLD_CHUNK_WIDTH, WORLD_CHUNK_HEIGHT, WORLD_ACTIVE_RADIUS,
+                             WORLD_MAX_RESIDENT_CHUNKS, WORLD_CHUNKING_ENABLED)
+    layout = VIEW_LAYOUT
+    views = viewports
+    world.update_residency([view.camera for view in views], lod.tick)
+    world.extend(create_asteroids(ASTEROID_STARTING_COUNT), lod.tick)
+    asteroids = world.active
+    particles = ParticleSystem(PARTICLES_MAX, random.getrandbits(32))
+
+    ship = Ship(SHIP_START_LOCATION[0], SHIP_START_LOCATION[1], 0, 0, weapon_slots=weapons)
     ship.set_move_bounds(LEVEL_WIDTH, LEVEL_HEIGHT, edge_bounce=True)
+    animator = get_animator()
 
+    # Sprites for all views are culled and resolved once per frame
+    render_queue = RenderQueue(views)
+    profiler.add_counter_source("render queue sprites", lambda: (render_queue.shared, render_queue.resolved))
+    if capture:
+        profiler.add_counter_source("captured frames", lambda: (capture.frames_captured, capture.frames_dropped))
 
+    resolution = None
+    if RENDER_SCALE_DYNAMIC:
+        resolution = DynamicResolution(views, GAMESPEED_FPS, RENDER_SCALE_MIN, RENDER_SCALE_STEP)
+
+
+    frame_count = 0
+    spawn_pending = 0               # Asteroids asked for by telemetry spawn commands, not yet spawned
     is_done = False
     while not is_done:
-        # Check for pygame events
-        for event in pg.event.get():
-            if event.type == pg.QUIT:
-                is_done = True
-
-            # Event-based key handling
-            # If key pressed, take action
-            if event.type == pg.KEYDOWN:
-                if event.key == pg.K_SPACE:
-                    # Shoot plasma
-                    weapon = ship.shoot("plasma")
-                    if weapon:
-                        weapon.set_move_bounds(edge_bounce=False)
-                        weapon.animation_config(.05)
-                        weapon.animation_start()
-                        weapons.append(weapon)
-                elif event.key == pg.K_d:
-                    # Shoot deathblossom
-                    ship.shoot("deathblossom")
-
-                elif gamedata.is_gameover and (event.key == pg.K_RETURN):
-                    # Record session high score
-                    if gamedata.score > GameData.high_score:
-                        GameData.high_score = gamedata.score
-
-                    # Reset state and restart game
-                    gamedata.reset()
-                    return True
+        profiler.begin_frame()
+        frame_start = time.perf_counter()
+
+        frame_count += 1
+        if max_frames is not None and frame_count > max_frames:
+            break
+
+        # Apply telemetry commands at the tick boundary
+        if telemetry:
+            for name, value in telemetry.poll():
+                spawn_pending += apply_command(name, value, lod, resolution)
+            spawn_pending = min(spawn_pending, TELEMETRY_MAX_SPAWN)
+            if spawn_pending:
+                spawn_count = min(spawn_pending, TELEMETRY_SPAWN_PER_TICK)
+                world.extend(create_asteroids(spawn_count, [(ship.coord_x, ship.coord_y)], world.positions(lod.tick)),
+                             lod.tick)
+                spawn_pending -= spawn_count
+
+        # Read player input (live or replayed)
+        frame_input = input_source.read()
+        if frame_input.quit:
+            is_done = True
+
+        # Event-based key handling
+        # If key pressed, take action
+        for key in frame_input.keys_down:
+            if key == pg.K_SPACE:
+                # Shoot plasma
+                weapon = ship.shoot("plasma")
+                if weapon:
+                    weapon.set_move_bounds(edge_bounce=False)
+                    weapon.animation_config(.05)
+                    weapon.animation_start()
+            elif key == pg.K_d:
+                # Shoot deathblossom
+                ship.shoot("deathblossom")
+
+            elif key in (pg.K_MINUS, pg.K_EQUALS):
+                # Zoom the ship view's camera out/in through the zoom levels
+                camera = views[0].camera
+                level = min(range(len(CAMERA_ZOOM_LEVELS)), key=lambda i: abs(CAMERA_ZOOM_LEVELS[i] - camera.zoom))
+                level += 1 if key == pg.K_MINUS else -1
+                camera.set_zoom(CAMERA_ZOOM_LEVELS[min(max(level, 0), len(CAMERA_ZOOM_LEVELS) - 1)])
+
+            elif key == pg.K_F5:
+                # Next view layout
+                layout = VIEW_LAYOUTS[(VIEW_LAYOUTS.index(layout) + 1) % len(VIEW_LAYOUTS)]
+                views = create_viewports(layout, viewport, views[0].camera)
+                render_queue = RenderQueue(views)
+                if resolution:
+                    resolution.viewports = views
+
+            elif key == pg.K_F3:
+                # Show/hide profiler overlay (the first show turns recording on)
+                profiler.toggle_overlay()
+
+            elif key == pg.K_F4:
+                # Export profiler trace
+                if profiler.frames:
+                    profiler.export_trace(PROFILER_TRACE_FILENAME.format(time.strftime("%Y%m%d_%H%M%S")))
+
+            elif gamedata.is_gameover and (key == pg.K_RETURN):
+                # Record session high score
+                if gamedata.score > GameData.high_score:
+                    GameData.high_score = gamedata.score
+
+                # Reset state and restart game
+                gamedata.reset()
+                world.close()
+                return True
 
         # Handle key press with key repeat
-        key = pg.key.get_pressed()
-        if key[pg.K_LEFT] and not key[pg.K_RIGHT]:
+        held = frame_input.keys_held
+        if pg.K_LEFT in held and pg.K_RIGHT not in held:
             ship.rotate(6)
-        elif key[pg.K_RIGHT] and not key[pg.K_LEFT]:
+        elif pg.K_RIGHT in held and pg.K_LEFT not in held:
             ship.rotate(-6)
-        if key[pg.K_LSHIFT]:
+        if pg.K_LSHIFT in held:
             ship.thrust(.5)
-
-
-
-        # Erase screen
-        screen.fill(colormap["black"])
-
-
-        # Draw border for level
-        if DRAW_LEVEL_BORDER:
-            screen_rect = pg.Rect(0, 0, LEVEL_WIDTH, LEVEL_HEIGHT)
-            screen_rect.x = -(viewport.camera.x - SCREEN_WIDTH//2)
-            screen_rect.y = -(viewport.camera.y - SCREEN_HEIGHT//2)
-            pg.draw.rect(screen, colormap["red"], screen_rect, 8)
-
-
-        # Handle asteroids
-        for rock in asteroids:
-            rock.update()
-
-            # Check and handle weapon hit
-            for weapon in weapons:
-                if weapon.is_collision(rock):
-                    gamedata.score += SCORE_ASTEROID_HIT
-                    rock.is_alive = False
-                    weapon.is_alive = False
-
-                    # Add to list to be deleted
-                    dead_objects.append(rock)
-                    dead_objects.append(weapon)
-
-                    # Break asteroid into smaller ones
-                    if rock.size > 0:
-                        for i in range(Asteroid.MAX_SIZE - rock.size + 2):
-                            # NEED TO PICK NEW COORDS BETTER
-                            a = Asteroid(rock.coord_x - 20 + i*10, rock.coord_y - 20 + i*10, random.randint(-5, 5), random.randint(-5, 5))
-                            a.select_size(rock.size-1)
-                            a.set_move_bounds(LEVEL_WIDTH, LEVEL_HEIGHT, edge_bounce=False)
-                            a.rotate(random.randint(0, 360))
-                            asteroids.append(a)
-
-                    # If one weapon destroys the asteroid, don't allow others to hit
-                    break
+        profiler.mark("events")
+
+
+        # Erase screen and draw the background (level border, stars) from pre-rendered tiles
+        for view in views:
+            for layer in background_layers:
+                layer.render(view.surface, view.camera)
+        profiler.mark("clear")
+
+
+        # Wake and sleep world chunks as the cameras of the views move
+        if frame_count % WORLD_RESIDENCY_INTERVAL == 0:
+            world.update_residency([view.camera for view in views], lod.tick)
+
+        # Update asteroids.  Only those near a camera, the ship or weapons are fully simulated and drawn.
+        near_asteroids = lod.update(asteroids, [view.camera for view in views], [ship, *weapons])
+        profiler.mark("asteroids_update")
+
+        # Update weapon positions and life.  The world simulates its sleeping asteroids while the frame goes on.
+        update_batch(weapons)
+        world.begin_tick(weapons, lod.tick)
+
+        # Handle weapon hits in order of impact
+        for weapon, i in find_weapon_hits(weapons, near_asteroids):
+            rock = near_asteroids[i]
+            gamedata.score += SCORE_ASTEROID_HIT
+            rock.is_alive = False
+            weapon.is_alive = False
+
+            # Add to list to be deleted
+            dead_objects.append(rock)
+
+            # Debris
+            particles.spawn(rock.coord_x, rock.coord_y, PARTICLES_PER_HIT * (rock.size + 1), 3.0,
+                            PARTICLE_LIFE_TICKS, (200, 200, 200), (rock.speed_x, rock.speed_y))
+
+            # Break asteroid into smaller ones
+            asteroids.extend(break_asteroid(rock, [(ship.coord_x, ship.coord_y)], asteroids))
+
+        # Handle the other asteroid collisions.  Hitboxes are tested for all near asteroids in one batch, then the
+        # hits are handled in asteroid order.
+        registry = get_registry()
+        rock_rows = entity_rows(near_asteroids)
+        ship_hits = find_overlaps(registry, rock_rows, entity_rows([ship]))[:, 0]
+        hits = ship_hits.copy()
+        blossom_hits = None
+        if ship.is_firing_deathblossom:
+            columns = registry.columns
+            reach = ship.deathblossom_radius + np.minimum(columns["sprite_width"][rock_rows] // 2,
+                                                          columns["sprite_height"][rock_rows] // 2)
+            blossom_hits = find_distances(registry, rock_rows, ship.coord_x, ship.coord_y) <= reach
+            hits |= blossom_hits
+
+        for i in np.flatnonzero(hits).tolist():
+            rock = near_asteroids[i]
 
             # Check and handle deathblossom hit
-            if ship.is_firing_deathblossom and (rock.distance_to(ship) <= ship.deathblossom_radius + min(rock.sprite_width // 2, rock.sprite_height // 2)):
+            if blossom_hits is not None and blossom_hits[i]:
                 gamedata.score += SCORE_ASTEROID_HIT
                 rock.is_alive = False
 
                 # Add to list to be deleted
                 dead_objects.append(rock)
 
+                # Debris
+                particles.spawn(rock.coord_x, rock.coord_y, PARTICLES_PER_HIT * (rock.size + 1), 4.0,
+                                PARTICLE_LIFE_TICKS, colormap["orange"], (rock.speed_x, rock.speed_y))
+
 
             # # Check for collisions
             # for other in asteroids:
@@ -478,53 +1274,74 @@ def game_loop():
             #        other.make_bounce(rock)
 
             # Test for collision with ship
-            if rock.is_collision(ship):
+            if ship_hits[i] and rock.is_alive and ship.is_alive:
                 ship.animation_config(ship.ANIMATION_BOOM_FRAME_TIME, "boom", False)
                 ship.animation_start()
                 ship.is_alive = False
 
                 RESPAWN_DELAY_SECS = 4
-                gamedata.respawn_timestamp = time.time() + RESPAWN_DELAY_SECS
-
+                gamedata.respawn_timestamp = animator.time + RESPAWN_DELAY_SECS
 
-        # Update weapon positions
-        for weapon in weapons:
-            weapon.update()
-            if not weapon.is_alive:
-                dead_objects.append(weapon)
+        profiler.mark("collision")
 
 
-        # Cleanup lists - remove "dead" objects
+        # Cleanup lists - remove "dead" objects and release their entity rows
         for dead_object in dead_objects:
             try:
-                if isinstance(dead_object, Asteroid):
-                    asteroids.remove(dead_object)
-                elif isinstance(dead_object, Plasma_weapon):
-                    weapons.remove(dead_object)
-
+                asteroids.remove(dead_object)
             except ValueError:
                 pass
+            dead_object.release()
+        if dead_objects:
+            near_asteroids = [rock for rock in near_asteroids if rock.is_alive]
         dead_objects = []
+        weapons.release_dead()
+        profiler.mark("cleanup")
 
         # Draw asteroids
-        for rock in asteroids:
-            if rock.is_alive:
-                viewport.render(rock.render(), rock.coord_x, rock.coord_y)
+        if vector_renderer:
+            vector_renderer.draw_views([(view.surface, view.camera) for view in views], near_asteroids)
+        else:
+            render_queue.add_objects(near_asteroids)
+            render_queue.flush()
+        profiler.mark("asteroids_draw")
 
         # Draw weapons
-        for weapon in weapons:
-            viewport.render(weapon.render(), weapon.coord_x, weapon.coord_y)
+        shots = list(weapons)
+        if vector_renderer:
+            vector_renderer.draw_views([(view.surface, view.camera) for view in views], shots)
+        else:
+            render_queue.add_objects(shots)
+            render_queue.flush()
+        profiler.mark("weapons_draw")
+
+        # Update and draw debris
+        particles.update()
+        for view in views:
+            particles.render(view.surface, view.camera)
+        profiler.mark("particles")
+
+        # Weapon hits on sleeping asteroids (out of view, so without debris)
+        for weapon, rock in world.end_tick():
+            gamedata.score += SCORE_ASTEROID_HIT
+            world.extend(break_asteroid(rock, [(ship.coord_x, ship.coord_y)]), lod.tick)
+            rock.release()
+        profiler.mark("world")
 
         # Update ship and camera
         ship.update()
+        animator.advance(ANIMATION_TICK_SECS)
         if ship.is_alive or (not ship.is_alive and ship.animation_complete is False):
-            viewport.camera.update(Viewport.Camera.UPDATETYPE_SMOOTH_EXP, ship.coord_x, ship.coord_y,
+            views[0].camera.update(Viewport.Camera.UPDATETYPE_SMOOTH_EXP, ship.coord_x, ship.coord_y,
                                    CAMERA_X_DECEL_DIST, CAMERA_X_DECEL_DIST)
+            for spectator in views[1:]:
+                spectator.camera.update(Viewport.Camera.UPDATETYPE_SIMPLE, ship.coord_x, ship.coord_y)
         else:
             # Respawn if more lives
             if gamedata.lives > 0:
-                if time.time() > gamedata.respawn_timestamp:
-                    ship = Ship(SHIP_START_LOCATION[0], SHIP_START_LOCATION[1], 0, 0)
+                if animator.time > gamedata.respawn_timestamp:
+                    ship.release()
+                    ship = Ship(SHIP_START_LOCATION[0], SHIP_START_LOCATION[1], 0, 0, weapon_slots=weapons)
                     ship.set_move_bounds(LEVEL_WIDTH, LEVEL_HEIGHT, edge_bounce=True)
                     gamedata.lives -= 1
             else:
@@ -535,16 +1352,8 @@ def game_loop():
                 if gamedata.score > GameData.high_score:
                     GameData.high_score = gamedata.score
 
-                gameover_font = choose_font(GAME_FONT, 50)
-                gameover_txt = gameover_font.render("GAME OVER", False, colormap["white"])
-                screen.blit(gameover_txt, ((SCREEN_WIDTH - gameover_txt.get_rect().width)/2, (SCREEN_HEIGHT - gameover_txt.get_rect().height)/2))
-
-                restart_font = choose_font(GAME_FONT, 25)
-                restart_txt = restart_font.render("(Press 'Enter' to Play Again)", False, colormap["white"])
-                screen.blit(restart_txt, ((SCREEN_WIDTH - restart_txt.get_rect().width)/2, (SCREEN_HEIGHT + gameover_txt.get_rect().height + 12 - restart_txt.get_rect().height)/2))
-
         # Detect when all asteroids destroyed and increase level
-        if not asteroids:
+        if not asteroids and world.count() == 0:
             if not gamedata.is_levelup_delay:
                 # Increase level and get extra life
                 gamedata.level += 1
@@ -553,36 +1362,201 @@ def game_loop():
 
                 LEVELUP_DELAY_SECS = 4
                 gamedata.is_levelup_delay = True
-                gamedata.levelup_delay_timestamp = time.time() + LEVELUP_DELAY_SECS
+                gamedata.levelup_delay_timestamp = animator.time + LEVELUP_DELAY_SECS
             else:
-                if time.time() > gamedata.levelup_delay_timestamp:
+                if animator.time > gamedata.levelup_delay_timestamp:
                     # Spawn more asteroids
-                    asteroids = create_asteroids(ASTEROID_STARTING_COUNT + (gamedata.level - 1)*5)
+                    world.extend(create_asteroids(ASTEROID_STARTING_COUNT + (gamedata.level - 1)*5,
+                                                  [(ship.coord_x, ship.coord_y)]), lod.tick)
                     gamedata.is_levelup_delay = False
 
-        # Draw ship
-        viewport.render(ship.render(), ship.coord_x, ship.coord_y)
+        # Draw ship (and the deathblossom effect underneath it)
+        ship_sprite = ship.render()
+        render_queue.add(ship.render_effect(), ship.coord_x, ship.coord_y)
+        render_queue.add(ship_sprite, ship.coord_x, ship.coord_y)
+        render_queue.flush()
+        profiler.mark("ship_camera")
+
+        # Copy the views to the screen (upscaling them if rendering at reduced scale) and frame the spectator views
+        for view in views:
+            view.present()
+        for spectator in views[1:]:
+            pg.draw.rect(screen, VIEW_FRAME_COLOR, spectator.rect.inflate(2, 2), 1)
+
+        # Game over text is drawn at full resolution like the HUD
+        if gamedata.is_gameover:
+            gameover_txt = hud_assets["gameover_txt"]
+            screen.blit(gameover_txt, ((SCREEN_WIDTH - gameover_txt.get_rect().width)/2, (SCREEN_HEIGHT - gameover_txt.get_rect().height)/2))
+
+            restart_txt = hud_assets["restart_txt"]
+            screen.blit(restart_txt, ((SCREEN_WIDTH - restart_txt.get_rect().width)/2, (SCREEN_HEIGHT + gameover_txt.get_rect().height + 12 - restart_txt.get_rect().height)/2))
 
         # Draw HUD:
-        render_hud(hud_surface, map_surface, ship, asteroids, gamedata)
+        render_hud(hud_surface, map_surface, ship, asteroids, gamedata, world.sleeping_positions(lod.tick))
         screen.blit(hud_surface, (0, 0))
+        profiler.render_overlay(screen)
 
         # Make newly drawn things visible
         pg.display.flip()
-        clock.tick(GAMESPEED_FPS)
-
+        pacer.presented()
+        profiler.mark("hud_flip")
+
+        # Hand the frame to the capture writer thread
+        if capture:
+            capture.capture(screen)
+            profiler.mark("capture")
+        if frame_count == 1:
+            mark_startup("first frame")
+
+        if resolution:
+            resolution.update(time.perf_counter() - frame_start)
+
+        pacer.wait(GAMESPEED_FPS)
+        profiler.mark("tick_wait")
+        counts = dict(asteroids=len(asteroids), asteroids_sleeping=world.sleeping_count(), asteroids_near=lod.near_count,
+                      weapons=len(weapons), particles=particles.live_count)
+        profiler.end_frame(**counts)
+        if metrics:
+            metrics.record(time.perf_counter() - frame_start, **counts)
+        if telemetry:
+            telemetry.publish(dict(counts, tick=lod.tick, frame_ms=round((time.perf_counter() - frame_start) * 1000, 3),
+                                   fps=GAMESPEED_FPS))
+
+    world.close()
     return False
 
 
 
-def main():
-    init_game()
-
-    startgame = True
-    while startgame:
-        startgame = game_loop()
+def configure_stress_mode(workers=WORLD_WORKERS):
+    """
+    Switch to the stress mode: a level of STRESS_LEVEL_SCREENS screens along each axis with STRESS_ASTEROID_COUNT
+    asteroids, in a chunked world whose sleeping asteroids are simulated in bands on worker processes.  Call before
+    init_game().
+    :param workers: Number of worker processes (0 simulates the sleeping asteroids in the main process).
+    :return: None
+    """
+    global LEVEL_WIDTH, LEVEL_HEIGHT, SHIP_START_LOCATION, HUDMAP_SCALING_FACTOR, ASTEROID_STARTING_COUNT, \
+        WORLD_CHUNKING_ENABLED, WORLD_PARALLEL, WORLD_WORKERS
+
+    LEVEL_WIDTH = STRESS_LEVEL_SCREENS * SCREEN_WIDTH
+    LEVEL_HEIGHT = STRESS_LEVEL_SCREENS * SCREEN_HEIGHT
+    SHIP_START_LOCATION = (LEVEL_WIDTH//2, LEVEL_HEIGHT//2)
+    HUDMAP_SCALING_FACTOR = min(0.05, 160 / LEVEL_WIDTH)
+    ASTEROID_STARTING_COUNT = STRESS_ASTEROID_COUNT
+    WORLD_CHUNKING_ENABLED = True
+    WORLD_PARALLEL = True
+    WORLD_WORKERS = workers
+
+
+def main(time_startup=False, record_path=None, replay_path=None, capture_path=None,
+         capture_format=CAPTURE_FORMAT_CHUNKS, headless=False, metrics_path=None, metrics_format=METRICS_FORMAT_NDJSON,
+         telemetry_port=None):
+    """
+    :param time_startup: True/False - Report the time taken by each startup stage up to the first frame, then exit.
+    :param record_path: Save the session's input to this file so it can be replayed (None to not record).
+    :param replay_path: Play back the input recorded in this file instead of reading live input.
+    :param capture_path: Capture every frame to this file (chunks format) or directory (images format).
+    :param capture_format: CAPTURE_FORMAT_CHUNKS or CAPTURE_FORMAT_IMAGES.
+    :param headless: True/False - Run without a window or frame rate limit, e.g. to render a replay faster than
+                     real time.
+    :param metrics_path: Write a metrics log of every tick to this file (None to not log).
+    :param metrics_format: METRICS_FORMAT_NDJSON or METRICS_FORMAT_CSV.
+    :param telemetry_port: Serve live telemetry and control on this local TCP port (None for no endpoint).
+    :return: None
+    """
+    global GAMESPEED_FPS
+
+    if headless:
+        os.environ["SDL_VIDEODRIVER"] = "dummy"
+        GAMESPEED_FPS = 0
+
+    mark_startup("imports")
+    init_game(show_splash_frame=not headless)
+
+    if time_startup:
+        # Run to the first frame and report where the time went
+        game_loop(max_frames=1)
+        for line in startup_report():
+            print(line)
+        return
+
+    # The random seed is part of a recording, so a replay starts from the same asteroids
+    if replay_path:
+        input_source = ReplayInput(replay_path)
+    else:
+        input_source = LiveInput(HELD_KEYS, random.randrange(2**32), record=record_path is not None)
+    random.seed(input_source.seed)
+
+    # Replays are rendered without dropping frames; live capture drops frames rather than slow the game down
+    capture = None
+    if capture_path:
+        capture = FrameCapture(capture_path, capture_format, int(round(1 / ANIMATION_TICK_SECS)), CAPTURE_QUEUE_FRAMES,
+                               CAPTURE_CHUNK_FRAMES, block=replay_path is not None)
+
+    # Metrics for soak runs.  Cache hit rates come from the caches registered with the profiler.
+    metrics = None
+    if metrics_path:
+        metrics = MetricsLog(metrics_path, metrics_format, METRICS_MAX_BYTES, METRICS_BACKUP_COUNT, METRICS_QUEUE_LINES,
+                             profiler.counter_sources)
+        metrics.add_gauge("surfaces", cached_surface_count)
+
+    telemetry = None
+    if telemetry_port is not None:
+        telemetry = TelemetryServer(TELEMETRY_COMMANDS, telemetry_port, stream_interval=TELEMETRY_STREAM_INTERVAL)
+        print("Telemetry on port {}".format(telemetry.port))
+
+    t0 = time.perf_counter()
+    try:
+        startgame = True
+        while startgame:
+            startgame = game_loop(input_source=input_source, capture=capture, metrics=metrics, telemetry=telemetry)
+    finally:
+        if telemetry:
+            telemetry.close()
+
+        if record_path:
+            input_source.save(record_path)
+
+        if metrics:
+            metrics.close()
+            print("{} metrics lines written, {} dropped, {} rotations".format(
+                metrics.lines_written, metrics.lines_dropped, metrics.rotations))
+
+        if capture:
+            capture.close()
+            secs = time.perf_counter() - t0
+            print("{} frames captured, {} dropped (queue peak {} frames), {:.1f} MB written in {:.1f} s ({:.0f} fps)"
+                  .format(capture.frames_captured, capture.frames_dropped, capture.max_queue_depth,
+                          capture.bytes_written / 2**20, secs, capture.frames_captured / secs))
 
 
 # MAIN ENTRY POINT
-main()
-exit(0)
\ No newline at end of file
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Asteroids")
+    parser.add_argument("--time-startup", action="store_true",
+                        help="Report the time taken by each startup stage up to the first frame, then exit.")
+    parser.add_argument("--record", metavar="FILE", help="Record the session's input to FILE for replay.")
+    parser.add_argument("--replay", metavar="FILE", help="Replay input recorded with --record.")
+    parser.add_argument("--capture", metavar="PATH", help="Capture every frame to PATH (see --capture-format).")
+    parser.add_argument("--capture-format", choices=[CAPTURE_FORMAT_CHUNKS, CAPTURE_FORMAT_IMAGES],
+                        default=CAPTURE_FORMAT_CHUNKS,
+                        help="'chunks': compressed capture file; 'images': directory of PNG frames.")
+    parser.add_argument("--headless", action="store_true",
+                        help="No window and no frame rate limit (render a replay faster than real time).")
+    parser.add_argument("--metrics", metavar="FILE", help="Write a metrics log of every tick to FILE (soak runs).")
+    parser.add_argument("--metrics-format", choices=[METRICS_FORMAT_NDJSON, METRICS_FORMAT_CSV],
+                        default=METRICS_FORMAT_NDJSON,
+                        help="'ndjson': one JSON object per line; 'csv': CSV with a header line.")
+    parser.add_argument("--telemetry", type=int, metavar="PORT", nargs="?", const=TELEMETRY_DEFAULT_PORT,
+                        help="Serve live frame stats and runtime knobs on a local TCP port (see telemetry.py).")
+    parser.add_argument("--stress", action="store_true",
+                        help="Huge level full of asteroids, with sleeping asteroids simulated on worker processes.")
+    parser.add_argument("--workers", type=int, default=WORLD_WORKERS,
+                        help="Worker processes of --stress (0 simulates in the main process).")
+    args = parser.parse_args()
+
+    if args.stress:
+        configure_stress_mode(args.workers)
+    main(args.time_startup, args.record, args.replay, args.capture, args.capture_format, args.headless, args.metrics,
+         args.metrics_format, args.telemetry)
+    exit(0)
@@ -0,0 +1,279 @@
+# Background layers
+#
+# Pre-rendered background tiles (level border, starfields).  Tiles are rendered once and cached, and each frame only
+# the tiles that intersect the camera's view are blitted.
+
+import math
+from collections import OrderedDict
+
+import numpy as np
+import pygame as pg
+
+
+class BackgroundLayer:
+    """
+    A background split into square tiles.  Tiles are rendered the first time they are seen and kept in an LRU cache,
+    so layers as large as the level cost no more per frame than the tiles on screen.  Tiles with nothing on them are
+    not stored.
+
+    A layer with a parallax factor below 1 scrolls slower than the camera and only needs to be
+    display + (level - display) * parallax pixels in size.
+
+    Views zoomed out so far that they would need more than half the cached tiles (overview and spectator views)
+    draw the layer from a single overview image at the view's scale instead.  The overview is kept apart from the
+    tile cache, is drawn a few tiles per frame so switching to an overview never stalls a frame, and is limited in
+    size: beyond max_overview_pixels it is drawn at a lower scale and the visible part is scaled up.
+    """
+
+    def __init__(self, width, height, tile_size=256, parallax=1.0, opaque=True, background_color=(0, 0, 0),
+                 border_color=None, border_width=8, stars_per_tile=0, seed=0, max_tiles=48,
+                 max_overview_pixels=2 * 2**20, overview_tiles_per_frame=32):
+        """
+        :param width: Width of the layer.
+        :param height: Height of the layer.
+        :param tile_size: Width and height of a tile.
+        :param parallax: Camera movement multiplier (1 moves with the level, smaller values appear further away).
+        :param opaque: True/False - True fills the view with the background color, so the screen need not be cleared
+                       first.  False draws only the layer's content over what is already there.
+        :param background_color: Fill color of opaque layers.  (Also the colorkey of transparent layers.)
+        :param border_color: Color of a border drawn around the edge of the layer (None for no border).
+        :param border_width: Width of the border.
+        :param stars_per_tile: Number of single pixel stars in each tile.
+        :param seed: Random seed for star positions.  Each tile's stars are derived from it, so evicted tiles are
+                     rebuilt identically.
+        :param max_tiles: Number of rendered tiles to keep cached.
+        :param max_overview_pixels: Largest overview image, in pixels.
+        :param overview_tiles_per_frame: Tiles' stars drawn into the overview image per frame while it is built.
+        """
+        self.width = width
+        self.height = height
+        self.tile_size = tile_size
+        self.parallax = parallax
+        self.opaque = opaque
+        self.background_color = background_color
+        self.border_color = border_color
+        self.border_width = border_width
+        self.stars_per_tile = stars_per_tile
+        self.seed = seed
+        self.max_tiles = max_tiles
+        self.max_overview_pixels = max_overview_pixels
+        self.overview_tiles_per_frame = overview_tiles_per_frame
+
+        self.tiles_x = -(-width // tile_size)
+        self.tiles_y = -(-height // tile_size)
+
+        # (tile x, tile y, scale): tile surface, or None if the tile is empty
+        self._tiles = OrderedDict()
+
+        # Overview image of the whole layer for the most recent overview scale: view scale it was made for, scale it
+        # is drawn at, surface, and the index of the next tile to draw into it (tiles_x * tiles_y when complete)
+        self._overview_view_scale = None
+        self._overview_scale = None
+        self._overview = None
+        self._overview_next_tile = 0
+
+        # Tile cache statistics
+        self.hits = 0
+        self.misses = 0
+
+
+    def __len__(self):
+        return len(self._tiles)
+
+
+    def _tile_rect(self, tx, ty):
+        left = tx * self.tile_size
+        top = ty * self.tile_size
+        return pg.Rect(left, top, min(self.tile_size, self.width - left), min(self.tile_size, self.height - top))
+
+
+    def _touches_border(self, rect):
+        inner = pg.Rect(self.border_width, self.border_width,
+                        self.width - 2 * self.border_width, self.height - 2 * self.border_width)
+        return not inner.contains(rect)
+
+
+    def _render_tile(self, tx, ty):
+        """
+        Render one tile.
+        :return: Tile surface, or None if the tile has nothing on it.
+        """
+        rect = self._tile_rect(tx, ty)
+        has_border = self.border_color is not None and self._touches_border(rect)
+        if not has_border and not self.stars_per_tile:
+            return None
+
+        tile = pg.Surface(rect.size)
+        tile.fill(self.background_color)
+        if not self.opaque:
+            tile.set_colorkey(self.background_color)
+
+        if self.stars_per_tile:
+            rng = np.random.default_rng((self.seed, tx, ty))
+            xs = rng.integers(0, rect.width, self.stars_per_tile)
+            ys = rng.integers(0, rect.height, self.stars_per_tile)
+            brightness = rng.integers(60, 256, self.stars_per_tile)
+            for x, y, b in zip(xs.tolist(), ys.tolist(), brightness.tolist()):
+                tile.set_at((x, y), (b, b, b))
+
+        if has_border:
+            pg.draw.rect(tile, self.border_color, (-rect.x, -rect.y, self.width, self.height), self.border_width)
+
+        if pg.display.get_surface() is not None:
+            tile = tile.convert()
+        return tile
+
+
+    def _scaled_tile(self, tx, ty, scale):
+        """
+        Scale a tile so that its edges land on the same display pixels as the neighbouring tiles' edges.
+        """
+        tile = self._tile(tx, ty)
+        if tile is None:
+            return None
+        rect = self._tile_rect(tx, ty)
+        w = int(round(rect.right * scale)) - int(round(rect.x * scale))
+        h = int(round(rect.bottom * scale)) - int(round(rect.y * scale))
+        return pg.transform.scale(tile, (max(w, 1), max(h, 1)))
+
+
+    def _update_overview(self, view_scale):
+        """
+        Start the overview image for a view scale, or continue building it.
+        :return: Overview surface.
+        """
+        if self._overview_view_scale != view_scale:
+            scale = min(view_scale, math.sqrt(self.max_overview_pixels / (self.width * self.height)))
+            overview = pg.Surface((max(int(round(self.width * scale)), 1), max(int(round(self.height * scale)), 1)))
+            overview.fill(self.background_color)
+            if not self.opaque:
+                overview.set_colorkey(self.background_color)
+            if pg.display.get_surface() is not None:
+                overview = overview.convert()
+            self._overview_view_scale = view_scale
+            self._overview_scale = scale
+            self._overview = overview
+            self._overview_next_tile = 0 if self.stars_per_tile else self.tiles_x * self.tiles_y
+            self._draw_overview_border()
+
+        tile_count = self.tiles_x * self.tiles_y
+        if self._overview_next_tile < tile_count:
+            last = min(self._overview_next_tile + self.overview_tiles_per_frame, tile_count)
+            for i in range(self._overview_next_tile, last):
+                self._draw_overview_stars(i % self.tiles_x, i // self.tiles_x)
+            self._overview_next_tile = last
+            if last == tile_count:
+                self._draw_overview_border()
+        return self._overview
+
+
+    def _draw_overview_stars(self, tx, ty):
+        """
+        Draw one tile's stars straight into the overview image.  They are the tile's stars, thinned to the density a
+        tile scaled down to the overview's scale would show.
+        """
+        rect = self._tile_rect(tx, ty)
+        rng = np.random.default_rng((self.seed, tx, ty))
+        xs = rng.integers(0, rect.width, self.stars_per_tile)
+        ys = rng.integers(0, rect.height, self.stars_per_tile)
+        brightness = rng.integers(60, 256, self.stars_per_tile)
+        scale = self._overview_scale
+        shown = rng.random(self.stars_per_tile) < scale * scale
+        xs = ((xs[shown] + rect.x) * scale).astype(int)
+        ys = ((ys[shown] + rect.y) * scale).astype(int)
+        brightness = brightness[shown]
+        for x, y, b in zip(xs.tolist(), ys.tolist(), brightness.tolist()):
+            self._overview.set_at((x, y), (b, b, b))
+
+
+    def _draw_overview_border(self):
+        # Keep the border visible at scales where scaling would drop it
+        if self.border_color is not None:
+            pg.draw.rect(self._overview, self.border_color, self._overview.get_rect(),
+                         max(int(round(self.border_width * self._overview_scale)), 1))
+
+
+    def _render_overview(self, surface, scale, left, top):
+        """
+        Draw the view from the overview image.
+        :param left: Layer x coordinate at the view's left edge.
+        :param top: Layer y coordinate at the view's top edge.
+        """
+        overview = self._update_overview(scale)
+        left_px = int(round(left * scale))
+        top_px = int(round(top * scale))
+        if self._overview_scale == scale:
+            surface.blit(overview, (-left_px, -top_px))
+            return
+
+        # Scale up the part of the overview in view
+        ratio = scale / self._overview_scale
+        source = pg.Rect(int(left * self._overview_scale), int(top * self._overview_scale),
+                         math.ceil(surface.get_width() / ratio) + 2, math.ceil(surface.get_height() / ratio) + 2)
+        source = source.clip(overview.get_rect())
+        if not source.width or not source.height:
+            return
+        dest_x = int(round(source.x * ratio)) - left_px
+        dest_y = int(round(source.y * ratio)) - top_px
+        size = (int(round(source.right * ratio)) - int(round(source.x * ratio)),
+                int(round(source.bottom * ratio)) - int(round(source.y * ratio)))
+        part = pg.transform.scale(overview.subsurface(source), size)
+        if not self.opaque:
+            part.set_colorkey(self.background_color)
+        surface.blit(part, (dest_x, dest_y))
+
+
+    def _tile(self, tx, ty, scale=1):
+        key = (tx, ty, scale)
+        if key in self._tiles:
+            self.hits += 1
+            self._tiles.move_to_end(key)
+            return self._tiles[key]
+
+        self.misses += 1
+        if scale == 1:
+            tile = self._render_tile(tx, ty)
+        else:
+            tile = self._scaled_tile(tx, ty, scale)
+        self._tiles[key] = tile
+        if len(self._tiles) > self.max_tiles:
+            self._tiles.popitem(last=False)
+        return tile
+
+
+    def render(self, surface, camera):
+        """
+        Draw the part of the layer in the camera's view.
+        :param surface: Surface on which to draw.
+        :param camera: Viewport.Camera
+        :return: None
+        """
+        scale = camera.scale
+        view_w = math.ceil(surface.get_width() / scale)
+        view_h = math.ceil(surface.get_height() / scale)
+        left = int((camera.x - camera.view_width // 2) * self.parallax)
+        top = int((camera.y - camera.view_height // 2) * self.parallax)
+        left_px = int(round(left * scale))
+        top_px = int(round(top * scale))
+
+        if self.opaque:
+            surface.fill(self.background_color)
+
+        first_tx = max(left // self.tile_size, 0)
+        first_ty = max(top // self.tile_size, 0)
+        last_tx = min((left + view_w - 1) // self.tile_size, self.tiles_x - 1)
+        last_ty = min((top + view_h - 1) // self.tile_size, self.tiles_y - 1)
+
+        if (last_tx - first_tx + 1) * (last_ty - first_ty + 1) > self.max_tiles // 2:
+            self._render_overview(surface, scale, left, top)
+            return
+
+        blit_list = []
+        for ty in range(first_ty, last_ty + 1):
+            for tx in range(first_tx, last_tx + 1):
+                tile = self._tile(tx, ty, scale)
+                if tile is not None:
+                    dest = (int(round(tx * self.tile_size * scale)) - left_px,
+                            int(round(ty * self.tile_size * scale)) - top_px)
+                    blit_list.append((tile, dest))
+        surface.blits(blit_list, doreturn=False)
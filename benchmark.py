@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# Rendering benchmark
+#
+# Runs headless and reports the time per frame to update and draw increasing numbers of on-screen asteroids with
+# each render backend, then the frame and present jitter and CPU use of each frame pacing strategy.
+#
+# Usage: python benchmark.py [rock_count ...]
+
+import os
+import random
+import sys
+import time
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import numpy as np
+import pygame as pg
+
+import asteroids
+from pacing import FramePacer, JITTER_BINS_MS, PACING_STRATEGIES
+from spaceobjects.Spaceobjects import *
+from spaceobjects.Vectorrenderer import VectorRenderer
+
+BENCHMARK_ROCK_COUNTS = [100, 500, 2000, 5000]
+BENCHMARK_FRAMES = 60
+
+BENCHMARK_PACING_FPS = 60
+BENCHMARK_PACING_FRAMES = 600       # Enough frames for a 99th percentile that isn't just the worst few frames
+BENCHMARK_PACING_ROCKS = 100        # Asteroids updated and drawn each frame while pacing
+
+
+def create_onscreen_asteroids(number, camera):
+    """
+    Create asteroids spread over the camera's view so none are culled.
+    :param number: Number of asteroids.
+    :param camera: Viewport.Camera
+    :return: List of asteroids.
+    """
+    left = camera.x - camera.display_width // 2
+    top = camera.y - camera.display_height // 2
+    rocks = []
+    for i in range(number):
+        a = Asteroid(left + random.randint(0, camera.display_width), top + random.randint(0, camera.display_height),
+                     random.randint(-5, 5), random.randint(-5, 5))
+        a.set_move_bounds(camera.display_width, camera.display_height, left, top, edge_bounce=False)
+        a.rotate(random.randint(0, 360))
+        a.select_size(random.randint(0, Asteroid.MAX_SIZE))
+        rocks.append(a)
+    return rocks
+
+
+# (column name, render backend, use sprite atlas)
+BENCHMARK_CONFIGS = [("sprite", RENDER_BACKEND_SPRITE, False),
+                     ("sprite+atlas", RENDER_BACKEND_SPRITE, True),
+                     ("vector", RENDER_BACKEND_VECTOR, False)]
+
+
+def benchmark_backend(backend, use_atlas, rock_count):
+    """
+    Time update and draw of on-screen asteroids.
+    :param backend: Render backend name.
+    :param use_atlas: True/False - Build the sprite atlas.
+    :param rock_count: Number of asteroids.
+    :return: Average milliseconds per frame.
+    """
+    viewport = asteroids.viewport
+    screen = viewport.display
+    set_render_backend(backend)
+    if use_atlas:
+        build_sprite_atlas([Asteroid, Plasma_weapon, Ship], asteroids.SPRITE_ATLAS_ROTATION_STEPS)
+    vector_renderer = VectorRenderer() if backend == RENDER_BACKEND_VECTOR else None
+
+    random.seed(rock_count)
+    rocks = create_onscreen_asteroids(rock_count, viewport.camera)
+
+    t0 = time.perf_counter()
+    for frame in range(BENCHMARK_FRAMES):
+        screen.fill(colormap["black"])
+        update_batch(rocks)
+        if vector_renderer:
+            vector_renderer.draw(screen, viewport.camera, rocks)
+        else:
+            viewport.render_batch((rock.render(), rock.coord_x, rock.coord_y) for rock in rocks)
+    elapsed = time.perf_counter() - t0
+
+    set_render_backend(RENDER_BACKEND_SPRITE)
+    return elapsed * 1000 / BENCHMARK_FRAMES
+
+
+def benchmark_pacing(strategy):
+    """
+    Pace frames that update and draw asteroids.
+    :param strategy: Pacing strategy.
+    :return: (FramePacer, CPU time as a fraction of wall time)
+    """
+    viewport = asteroids.viewport
+    screen = viewport.display
+    random.seed(BENCHMARK_PACING_ROCKS)
+    rocks = create_onscreen_asteroids(BENCHMARK_PACING_ROCKS, viewport.camera)
+    pacer = FramePacer(BENCHMARK_PACING_FPS, strategy, asteroids.FRAME_PACING_SPIN_MARGIN, BENCHMARK_PACING_FRAMES)
+
+    t0 = time.perf_counter()
+    cpu0 = time.process_time()
+    for frame in range(BENCHMARK_PACING_FRAMES + 1):
+        screen.fill(colormap["black"])
+        update_batch(rocks)
+        viewport.render_batch((rock.render(), rock.coord_x, rock.coord_y) for rock in rocks)
+        pg.display.flip()
+        pacer.presented()
+        pacer.wait()
+    return pacer, (time.process_time() - cpu0) / (time.perf_counter() - t0)
+
+
+def main(rock_counts):
+    asteroids.init_game()
+
+    # Times are milliseconds per frame; speedups are relative to the first configuration
+    print("{:>8}".format("rocks") + "".join("{:>16}".format(name + " ms") for name, backend, use_atlas in BENCHMARK_CONFIGS))
+    for rock_count in rock_counts:
+        results = [benchmark_backend(backend, use_atlas, rock_count) for name, backend, use_atlas in BENCHMARK_CONFIGS]
+        print("{:>8}".format(rock_count) + "".join("{:>9.2f} ({:.1f}x)".format(ms, results[0] / ms) for ms in results))
+
+    # Frame pacing: frames per jitter bin (distance of the frame-to-frame and present-to-present intervals from the
+    # target frame time)
+    results = [(strategy,) + benchmark_pacing(strategy) for strategy in PACING_STRATEGIES]
+    for name, interval_name in (("frame", "frame_intervals"), ("present", "present_intervals")):
+        print()
+        print("pacing at {} fps, {} asteroids: {} intervals per jitter bin (ms)".format(
+            BENCHMARK_PACING_FPS, BENCHMARK_PACING_ROCKS, name))
+        print("{:>10}{:>7}{:>9}".format("strategy", "cpu", "p99 ms") +
+              "".join("{:>7}".format("<{:g}".format(edge)) for edge in JITTER_BINS_MS) + "{:>7}".format("more"))
+        for strategy, pacer, cpu in results:
+            intervals = getattr(pacer, interval_name)
+            print("{:>10}{:>6.0f}%{:>9.2f}".format(strategy, cpu * 100, np.percentile(pacer.jitter_ms(intervals), 99)) +
+                  "".join("{:>7}".format(count) for count in pacer.jitter_histogram(intervals)))
+
+if __name__ == "__main__":
+    main([int(n) for n in sys.argv[1:]] or BENCHMARK_ROCK_COUNTS)
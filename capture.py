@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+# Gameplay capture
+#
+# Records sessions for QA.  The game grabs the display as a raw RGB buffer after each flip and hands it to a writer
+# thread through a bounded queue, so compressing and writing frames never stalls the game loop.  When the writer
+# falls behind, frames are dropped and counted.  Frames are stored as zlib-compressed chunks in one capture file, or
+# as a PNG image sequence.
+#
+# Player input can be recorded and replayed, so a session can be rendered to a capture again later, headless and
+# faster than real time.
+#
+# Usage: python capture.py CAPTURE_FILE [--images DIR] [--video FILE]
+
+import argparse
+import json
+import os
+import queue
+import shutil
+import struct
+import subprocess
+import sys
+import threading
+import time
+import zlib
+
+import pygame as pg
+
+CAPTURE_FORMAT_CHUNKS = "chunks"        # zlib-compressed chunks of frames in one capture file
+CAPTURE_FORMAT_IMAGES = "images"        # One PNG per frame in a directory
+
+CAPTURE_MAGIC = b"ACAP"
+HEADER_FORMAT = struct.Struct("<4sHHH")     # magic, width, height, frames per second
+CHUNK_FORMAT = struct.Struct("<HI")         # frame count, compressed size.  Followed by the frame indexes (uint32).
+
+IMAGE_FILENAME = "frame_{:06d}.png"
+
+
+class FrameCapture:
+    """
+    Captures frames of a surface to disk on a writer thread.  capture() only copies the surface's pixels and queues
+    them.  If the queue is full the frame is dropped (or, when blocking, capture() waits for the writer).
+    """
+
+    def __init__(self, path, capture_format=CAPTURE_FORMAT_CHUNKS, fps=30, queue_frames=16, chunk_frames=30,
+                 compress_level=1, block=False):
+        """
+        :param path: Capture file (chunks format) or directory (images format) to write.
+        :param capture_format: CAPTURE_FORMAT_CHUNKS or CAPTURE_FORMAT_IMAGES.
+        :param fps: Frame rate stored in the capture file for playback and video encoding.
+        :param queue_frames: Frames that can wait for the writer before frames are dropped.
+        :param chunk_frames: Frames compressed together per chunk.
+        :param compress_level: zlib compression level (1 is fastest).
+        :param block: True/False - Wait for the writer instead of dropping frames (for offline rendering).
+        """
+        if capture_format not in (CAPTURE_FORMAT_CHUNKS, CAPTURE_FORMAT_IMAGES):
+            raise ValueError("Unknown capture format: {}".format(capture_format))
+
+        self.path = path
+        self.capture_format = capture_format
+        self.fps = fps
+        self.chunk_frames = chunk_frames
+        self.compress_level = compress_level
+        self.block = block
+
+        # Statistics
+        self.frames_captured = 0
+        self.frames_dropped = 0
+        self.frames_written = 0
+        self.bytes_written = 0
+        self.max_queue_depth = 0
+
+        self._size = None
+        self._file = None
+        self._error = None
+        self._queue = queue.Queue(maxsize=queue_frames)
+        self._thread = threading.Thread(target=self._writer, name="capture writer", daemon=True)
+        self._thread.start()
+
+
+    def capture(self, surface):
+        """
+        Queue a copy of a surface's pixels.  All frames must be the same size.  Frames are numbered in the order they
+        are captured, counting dropped frames, so gaps in a capture file show where frames were dropped.
+        :param surface: Surface to capture (usually the display).
+        :return: True if the frame was queued, False if it was dropped.
+        """
+        if self._error is not None:
+            raise self._error
+
+        size = surface.get_size()
+        if self._size is None:
+            self._size = size
+        elif size != self._size:
+            raise ValueError("Captured frames must all be {}x{}.".format(*self._size))
+
+        frame = (self.frames_captured + self.frames_dropped, pg.image.tobytes(surface, "RGB"))
+        if self.block:
+            self._queue.put(frame)
+        else:
+            try:
+                self._queue.put_nowait(frame)
+            except queue.Full:
+                self.frames_dropped += 1
+                return False
+
+        self.frames_captured += 1
+        self.max_queue_depth = max(self.max_queue_depth, self._queue.qsize())
+        return True
+
+
+    def close(self):
+        """
+        Write the queued frames and stop the writer.
+        :return: None
+        """
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        if self._error is not None:
+            raise self._error
+
+
+    def _writer(self):
+        """
+        Writer thread: compress and write frames until the end marker (None) is queued.
+        """
+        chunk = []
+        try:
+            while True:
+                frame = self._queue.get()
+                if frame is None:
+                    break
+
+                if self.capture_format == CAPTURE_FORMAT_IMAGES:
+                    self._write_image(*frame)
+                    continue
+
+                chunk.append(frame)
+                if len(chunk) >= self.chunk_frames:
+                    self._write_chunk(chunk)
+                    chunk = []
+
+            if chunk:
+                self._write_chunk(chunk)
+        except Exception as e:
+            self._error = e
+
+            # Keep draining so a blocked capture() can't wait forever
+            while self._queue.get() is not None:
+                pass
+        finally:
+            if self._file is not None:
+                self._file.close()
+
+
+    def _write_chunk(self, frames):
+        if self._file is None:
+            self._file = open(self.path, "wb")
+            self._file.write(HEADER_FORMAT.pack(CAPTURE_MAGIC, self._size[0], self._size[1], self.fps))
+            self.bytes_written += HEADER_FORMAT.size
+
+        data = zlib.compress(b"".join(pixels for index, pixels in frames), self.compress_level)
+        indexes = struct.pack("<{}I".format(len(frames)), *(index for index, pixels in frames))
+        self._file.write(CHUNK_FORMAT.pack(len(frames), len(data)))
+        self._file.write(indexes)
+        self._file.write(data)
+        self.bytes_written += CHUNK_FORMAT.size + len(indexes) + len(data)
+        self.frames_written += len(frames)
+
+
+    def _write_image(self, frame_index, pixels):
+        os.makedirs(self.path, exist_ok=True)
+        filename = os.path.join(self.path, IMAGE_FILENAME.format(frame_index))
+        pg.image.save(pg.image.frombytes(pixels, self._size, "RGB"), filename)
+        self.bytes_written += os.path.getsize(filename)
+        self.frames_written += 1
+
+
+def read_capture(path):
+    """
+    Read a chunks format capture file.
+    :param path: Capture file.
+    :return: ((width, height), fps, generator of (frame index, RGB bytes))
+    """
+    f = open(path, "rb")
+    magic, width, height, fps = HEADER_FORMAT.unpack(f.read(HEADER_FORMAT.size))
+    if magic != CAPTURE_MAGIC:
+        f.close()
+        raise ValueError("{} is not a capture file.".format(path))
+    frame_bytes = width * height * 3
+
+    def frames():
+        with f:
+            while True:
+                header = f.read(CHUNK_FORMAT.size)
+                if len(header) < CHUNK_FORMAT.size:
+                    return
+                count, data_size = CHUNK_FORMAT.unpack(header)
+                indexes = struct.unpack("<{}I".format(count), f.read(4 * count))
+                data = zlib.decompress(f.read(data_size))
+                for i, index in enumerate(indexes):
+                    yield index, data[i * frame_bytes:(i + 1) * frame_bytes]
+
+    return (width, height), fps, frames()
+
+
+def export_images(path, directory):
+    """
+    Write the frames of a capture file as a PNG image sequence.
+    :return: Number of images written.
+    """
+    size, fps, frames = read_capture(path)
+    os.makedirs(directory, exist_ok=True)
+    count = 0
+    for index, pixels in frames:
+        pg.image.save(pg.image.frombytes(pixels, size, "RGB"), os.path.join(directory, IMAGE_FILENAME.format(index)))
+        count += 1
+    return count
+
+
+def encode_video(path, video_path):
+    """
+    Encode a capture file to a video file with ffmpeg (which must be on the PATH).
+    :return: Number of frames encoded.
+    """
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg is None:
+        raise RuntimeError("ffmpeg was not found; use --images to export an image sequence instead.")
+
+    (width, height), fps, frames = read_capture(path)
+    encoder = subprocess.Popen([ffmpeg, "-y", "-loglevel", "error", "-f", "rawvideo", "-pix_fmt", "rgb24",
+                                "-s", "{}x{}".format(width, height), "-r", str(fps), "-i", "-",
+                                "-pix_fmt", "yuv420p", video_path], stdin=subprocess.PIPE)
+    count = 0
+    with encoder.stdin:
+        for index, pixels in frames:
+            encoder.stdin.write(pixels)
+            count += 1
+    if encoder.wait() != 0:
+        raise RuntimeError("ffmpeg failed with exit code {}.".format(encoder.returncode))
+    return count
+
+
+class FrameInput:
+    """
+    Player input of one frame.
+    """
+    __slots__ = ("quit", "keys_down", "keys_held")
+
+    def __init__(self, quit=False, keys_down=(), keys_held=()):
+        self.quit = quit
+        self.keys_down = keys_down      # Keys pressed this frame, in order
+        self.keys_held = keys_held      # Keys held down this frame (the keys handled with key repeat)
+
+
+class LiveInput:
+    """
+    Reads player input from pygame, optionally recording it for replay.
+    """
+
+    def __init__(self, held_keys, seed=None, record=False):
+        """
+        :param held_keys: Keys whose held state the game reads each frame.
+        :param seed: Random seed the session was started with (stored with the recording).
+        :param record: True/False - Keep the input of every frame for save().
+        """
+        self.held_keys = held_keys
+        self.seed = seed
+        self.frames = [] if record else None
+
+
+    def read(self):
+        """
+        :return: FrameInput for this frame.
+        """
+        quit = False
+        keys_down = []
+        for event in pg.event.get():
+            if event.type == pg.QUIT:
+                quit = True
+            elif event.type == pg.KEYDOWN:
+                keys_down.append(event.key)
+
+        pressed = pg.key.get_pressed()
+        keys_held = [key for key in self.held_keys if pressed[key]]
+
+        if self.frames is not None:
+            self.frames.append((quit, keys_down, keys_held))
+        return FrameInput(quit, keys_down, keys_held)
+
+
+    def save(self, path):
+        """
+        Save the recorded input.
+        :param path: Recording file (JSON).
+        :return: None
+        """
+        with open(path, "w") as f:
+            json.dump({"seed": self.seed, "frames": self.frames}, f)
+
+
+class ReplayInput:
+    """
+    Plays back recorded input.  Reports quit after the last recorded frame.
+    """
+
+    def __init__(self, path):
+        """
+        :param path: Recording file saved by LiveInput.save().
+        """
+        with open(path) as f:
+            recording = json.load(f)
+        self.seed = recording["seed"]
+        self.frames = recording["frames"]
+        self.position = 0
+
+
+    def read(self):
+        # Keep the window responsive when replaying on a display
+        pg.event.pump()
+
+        if self.position >= len(self.frames):
+            return FrameInput(quit=True)
+        quit, keys_down, keys_held = self.frames[self.position]
+        self.position += 1
+        return FrameInput(quit, keys_down, keys_held)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export a gameplay capture file.")
+    parser.add_argument("capture_file")
+    parser.add_argument("--images", metavar="DIR", help="Write the frames as a PNG image sequence.")
+    parser.add_argument("--video", metavar="FILE", help="Encode the frames to a video file with ffmpeg.")
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    if args.images:
+        count = export_images(args.capture_file, args.images)
+        print("{} images written to {}".format(count, args.images))
+    if args.video:
+        try:
+            count = encode_video(args.capture_file, args.video)
+        except RuntimeError as e:
+            print(e)
+            sys.exit(1)
+        print("{} frames encoded to {}".format(count, args.video))
+    if not args.images and not args.video:
+        (width, height), fps, frames = read_capture(args.capture_file)
+        indexes = [index for index, pixels in frames]
+        missing = indexes[-1] - indexes[0] + 1 - len(indexes) if indexes else 0
+        print("{}x{} at {} fps: {} frames, {} dropped".format(width, height, fps, len(indexes), missing))
+    print("{:.1f} s".format(time.perf_counter() - t0))
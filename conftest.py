@@ -0,0 +1,39 @@
+# Shared pytest fixtures
+#
+# Tests run headless: the display and audio use SDL's dummy drivers.  Tests marked "perf" check wall clock budgets,
+# which depend on the machine, and only run with --perf.
+
+import os
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import pytest
+
+
+def pytest_addoption(parser):
+    parser.addoption("--perf", action="store_true", help="Also run the wall clock budgets (tests marked perf).")
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "perf: wall clock budget, only run with --perf")
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption("--perf"):
+        return
+    skip_perf = pytest.mark.skip(reason="wall clock budget, run with --perf")
+    for item in items:
+        if "perf" in item.keywords:
+            item.add_marker(skip_perf)
+
+
+@pytest.fixture(scope="session")
+def game():
+    """
+    The game initialized once per test session, without a window.
+    :return: The asteroids module.
+    """
+    import asteroids
+    asteroids.init_game()
+    return asteroids
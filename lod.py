@@ -0,0 +1,100 @@
+# Simulation level of detail
+#
+# Asteroids far from every camera and from any active object (ship, weapons) are updated at a reduced rate.
+
+import numpy as np
+
+from spaceobjects.Ecs import LOD_TICK_NONE, advance_movement, find_in_view, update_spin
+from spaceobjects.Spaceobjects import entity_rows, get_registry, update_sprites
+
+
+class LodScheduler:
+    """
+    Schedules asteroid updates by distance.  Near asteroids are updated every tick.  Far asteroids are advanced
+    every 'reduced_rate_ticks' ticks by the number of ticks that passed, using the analytic position update, and skip
+    sprite rotation entirely.  A far asteroid that comes near the viewport or an active object is caught up to the
+    current tick before its normal update, so positions match the full-rate simulation.
+    """
+
+    def __init__(self, reduced_rate_ticks=8, viewport_margin=100, active_radius=200, enabled=True):
+        """
+        :param reduced_rate_ticks: Number of ticks between updates of far asteroids.
+        :param viewport_margin: Distance outside the camera view within which asteroids are updated at full rate.
+        Should be larger than the distance an asteroid can travel in 'reduced_rate_ticks' ticks.
+        :param active_radius: Distance from an active object within which asteroids are updated at full rate.
+        :param enabled: True/False - If False every asteroid is updated every tick.
+        """
+        self.reduced_rate_ticks = reduced_rate_ticks
+        self.viewport_margin = viewport_margin
+        self.active_radius = active_radius
+        self.enabled = enabled
+        self.tick = 0
+
+        # Number of asteroids updated at full and reduced rate on the last tick
+        self.near_count = 0
+        self.far_count = 0
+
+
+    def _near_mask(self, rows, cameras, active_objects):
+        """
+        Find the asteroids that should be simulated at full rate.
+        :param rows: Index array of the asteroids' entity rows.
+        :param cameras: List of Viewport.Camera (one per viewport showing the world).
+        :param active_objects: List of active objects (ship, weapons).
+        :return: Boolean array, True for the near asteroids.
+        """
+        registry = get_registry()
+        near = np.zeros(len(rows), dtype=bool)
+        for camera in cameras:
+            near |= find_in_view(registry, rows, camera, self.viewport_margin)
+
+        x = registry.columns["coord_x"][rows]
+        y = registry.columns["coord_y"][rows]
+        radius_sq = self.active_radius * self.active_radius
+        for other in active_objects:
+            dx = other.coord_x - x
+            dy = other.coord_y - y
+            near |= dx*dx + dy*dy <= radius_sq
+
+        return near
+
+
+    def update(self, asteroids, cameras, active_objects):
+        """
+        Update the asteroids for one tick.  Movement and spin of all due asteroids are advanced in one batch.
+        :param asteroids: List of asteroids.
+        :param cameras: List of Viewport.Camera used to find the views.  Asteroids in any view are updated at full rate.
+        :param active_objects: List of active objects (ship, weapons).  Asteroids near them are updated at full rate.
+        :return: List of asteroids updated at full rate this tick.  Only these need collision checks and drawing.
+        """
+        self.tick += 1
+        tick = self.tick
+
+        registry = get_registry()
+        lod_ticks = registry.columns["lod_tick"]
+        rows = entity_rows(asteroids)
+
+        # Newly created asteroids start out up to date
+        new_rows = rows[lod_ticks[rows] == LOD_TICK_NONE]
+        lod_ticks[new_rows] = tick - 1
+        elapsed = tick - lod_ticks[rows]
+
+        if self.enabled:
+            near = self._near_mask(rows, cameras, active_objects)
+        else:
+            near = np.ones(len(rows), dtype=bool)
+
+        # Near asteroids catch up any skipped ticks along with the current one.  Far asteroids are only advanced
+        # every 'reduced_rate_ticks' ticks.
+        due = near | (elapsed >= self.reduced_rate_ticks)
+        due_rows = rows[due]
+        advance_movement(registry, due_rows, elapsed[due])
+        update_spin(registry, due_rows, elapsed[due])
+        lod_ticks[due_rows] = tick
+
+        near_asteroids = [asteroids[i] for i in np.flatnonzero(near).tolist()]
+        update_sprites(near_asteroids, rows[near])
+
+        self.near_count = len(near_asteroids)
+        self.far_count = len(asteroids) - self.near_count
+        return near_asteroids
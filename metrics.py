@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+# Metrics log
+#
+# Streams per-tick metrics (frame time, object counts, cached surfaces, memory, garbage collector and cache hit
+# rates) to a log file for long soak runs.  The game loop only samples a few counters and queues them; a writer
+# thread formats the lines (NDJSON or CSV), writes them in batches and rotates the file when it reaches a size
+# limit.  If the writer falls behind, lines are dropped and counted rather than slowing the game.
+#
+# Run as a script to summarize how the metrics drifted over a run.
+#
+# Usage: python metrics.py LOG_FILE [--window MINUTES]
+
+import argparse
+import csv
+import gc
+import io
+import json
+import os
+import queue
+import sys
+import threading
+import time
+
+import numpy as np
+
+METRICS_FORMAT_NDJSON = "ndjson"        # One JSON object per line
+METRICS_FORMAT_CSV = "csv"              # Header line, then one row per tick.  Each rotated file has its own header.
+
+if sys.platform.startswith("linux"):
+    _PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+else:
+    _PAGE_SIZE = None
+
+
+def rss_bytes():
+    """
+    :return: Resident set size of the process in bytes, or None where it can't be read.
+    """
+    if _PAGE_SIZE is None:
+        return None
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except OSError:
+        return None
+
+
+class MetricsLog:
+    """
+    Writes one line of metrics per tick on a writer thread.  record() samples the garbage collector, gauges and cache
+    counters and queues the values; formatting, the resident set size and writing are left to the writer thread.
+    Cache hit rates are computed over each line's tick, from the change in the (hits, misses) counters.
+    """
+
+    def __init__(self, path, metrics_format=METRICS_FORMAT_NDJSON, max_bytes=64 * 2**20, backup_count=5,
+                 queue_lines=1024, counter_sources=None):
+        """
+        :param path: Log file.  Rotated files are named path.1 (newest) to path.<backup_count> (oldest).
+        :param metrics_format: METRICS_FORMAT_NDJSON or METRICS_FORMAT_CSV.
+        :param max_bytes: Size at which the log file is rotated.
+        :param backup_count: Number of rotated files kept.
+        :param queue_lines: Lines that can wait for the writer before lines are dropped.
+        :param counter_sources: Dict of cache name -> function returning (hits, misses), such as the profiler's
+        counter_sources.  Sources added to the dict later are picked up (CSV logs only take those present at the
+        first line).
+        """
+        if metrics_format not in (METRICS_FORMAT_NDJSON, METRICS_FORMAT_CSV):
+            raise ValueError("Unknown metrics format: {}".format(metrics_format))
+
+        self.path = path
+        self.metrics_format = metrics_format
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.counter_sources = counter_sources if counter_sources is not None else {}
+
+        # Gauges (name -> function returning a number) sampled every tick
+        self.gauges = {}
+
+        # Statistics
+        self.tick = 0
+        self.lines_written = 0
+        self.lines_dropped = 0
+        self.bytes_written = 0
+        self.rotations = 0
+
+        self._file = None
+        self._csv_columns = None
+        self._last_counters = {}
+        self._error = None
+        self._queue = queue.Queue(maxsize=queue_lines)
+        self._thread = threading.Thread(target=self._writer, name="metrics writer", daemon=True)
+        self._thread.start()
+
+
+    def add_gauge(self, name, gauge_function):
+        """
+        Register a value to sample every tick.
+        :param name: Field name in the log.
+        :param gauge_function: Function returning a number.
+        :return: None
+        """
+        self.gauges[name] = gauge_function
+
+
+    def record(self, frame_secs, **counts):
+        """
+        Queue the metrics of one tick.
+        :param frame_secs: Time since the start of the previous tick.
+        :param counts: Object counts (e.g. asteroids=10, weapons=2).
+        :return: True if the line was queued, False if it was dropped.
+        """
+        if self._error is not None:
+            raise self._error
+
+        self.tick += 1
+        gauges = {name: gauge() for name, gauge in self.gauges.items()}
+        counters = {name: source() for name, source in self.counter_sources.items()}
+        gc_collections = [generation["collections"] for generation in gc.get_stats()]
+        try:
+            self._queue.put_nowait((self.tick, time.time(), frame_secs, counts, gauges, counters, gc.get_count(),
+                                    gc_collections))
+        except queue.Full:
+            self.lines_dropped += 1
+            return False
+        return True
+
+
+    def close(self):
+        """
+        Write the queued lines and stop the writer.
+        :return: None
+        """
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        if self._error is not None:
+            raise self._error
+
+
+    def _writer(self):
+        """
+        Writer thread: format and write lines until the end marker (None) is queued.  Lines waiting in the queue are
+        written together.
+        """
+        try:
+            is_done = False
+            while not is_done:
+                lines = []
+                item = self._queue.get()
+                while item is not None:
+                    lines.append(self._format(self._fields(*item)))
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                is_done = item is None
+                if lines:
+                    self._write("".join(lines), len(lines))
+        except Exception as e:
+            self._error = e
+
+            # Keep draining so close() can't wait forever
+            while self._queue.get() is not None:
+                pass
+        finally:
+            if self._file is not None:
+                self._file.close()
+
+
+    def _fields(self, tick, timestamp, frame_secs, counts, gauges, counters, gc_counts, gc_collections):
+        """
+        :return: Dict of the fields of one line.
+        """
+        fields = {"tick": tick, "time": round(timestamp, 3), "frame_ms": round(frame_secs * 1000, 3)}
+        fields.update(counts)
+        fields.update(gauges)
+        fields["rss_bytes"] = rss_bytes()
+        for generation, (count, collections) in enumerate(zip(gc_counts, gc_collections)):
+            fields["gc{}_count".format(generation)] = count
+            fields["gc{}_collections".format(generation)] = collections
+
+        for name, (hits, misses) in counters.items():
+            last_hits, last_misses = self._last_counters.get(name, (0, 0))
+            lookups = (hits - last_hits) + (misses - last_misses)
+            fields["hit_rate " + name] = round((hits - last_hits) / lookups, 4) if lookups > 0 else None
+        self._last_counters = counters
+        return fields
+
+
+    def _format(self, fields):
+        if self.metrics_format == METRICS_FORMAT_NDJSON:
+            return json.dumps(fields, separators=(",", ":")) + "\n"
+
+        if self._csv_columns is None:
+            self._csv_columns = list(fields)
+        line = io.StringIO()
+        csv.writer(line, lineterminator="\n").writerow([fields.get(column, "") for column in self._csv_columns])
+        return line.getvalue()
+
+
+    def _write(self, text, line_count):
+        if self._file is None:
+            self._open()
+        self._file.write(text)
+        self._file.flush()
+        self.bytes_written += len(text)
+        self.lines_written += line_count
+        if self._file.tell() >= self.max_bytes:
+            self._rotate()
+
+
+    def _open(self):
+        self._file = open(self.path, "w", newline="")
+        if self.metrics_format == METRICS_FORMAT_CSV and self._csv_columns is not None:
+            line = io.StringIO()
+            csv.writer(line, lineterminator="\n").writerow(self._csv_columns)
+            self._file.write(line.getvalue())
+
+
+    def _rotate(self):
+        """
+        Move the log file to path.1, shifting older files up and deleting the oldest, and start a new log file.
+        """
+        self._file.close()
+        self._file = None
+        if self.backup_count > 0:
+            for i in range(self.backup_count - 1, 0, -1):
+                older = "{}.{}".format(self.path, i)
+                if os.path.exists(older):
+                    os.replace(older, "{}.{}".format(self.path, i + 1))
+            os.replace(self.path, self.path + ".1")
+        self.rotations += 1
+        self._open()
+
+
+
+def log_files(path):
+    """
+    :return: The log file and its rotated files that exist, oldest first.
+    """
+    rotated = []
+    i = 1
+    while os.path.exists("{}.{}".format(path, i)):
+        rotated.append("{}.{}".format(path, i))
+        i += 1
+    return rotated[::-1] + ([path] if os.path.exists(path) else [])
+
+
+def read_log(path):
+    """
+    Read a metrics log and its rotated files, in either format.
+    :param path: Log file.
+    :return: Dict of field name -> NumPy float array (NaN where a line has no value).
+    """
+    rows = []
+    for filename in log_files(path):
+        with open(filename, newline="") as f:
+            first = f.readline()
+            f.seek(0)
+            if first.startswith("{"):
+                rows.extend(json.loads(line) for line in f if line.strip())
+            else:
+                rows.extend(csv.DictReader(f))
+
+    columns = {}
+    for row in rows:
+        for name in row:
+            columns.setdefault(name, None)
+
+    def number(value):
+        if value is None or value == "":
+            return np.nan
+        return float(value)
+
+    return {name: np.array([number(row.get(name)) for row in rows]) for name in columns}
+
+
+def summarize(log, window_secs=600):
+    """
+    Summarize how the metrics drifted over a run: the mean of each metric over the first and last window of the run
+    and its trend per hour, and how frame time grows with the asteroid count.
+    :param log: Columns returned by read_log().
+    :param window_secs: Length of the first and last windows compared.
+    :return: List of text lines.
+    """
+    if "time" not in log or len(log["time"]) < 2:
+        return ["Not enough lines to summarize."]
+
+    timestamps = log["time"]
+    hours = (timestamps - timestamps[0]) / 3600
+    duration_hours = hours[-1]
+    first = timestamps <= timestamps[0] + window_secs
+    last = timestamps >= timestamps[-1] - window_secs
+    lines = ["{:.0f} ticks over {:.2f} hours, mean {:.1f} fps".format(
+        log["tick"][-1] - log["tick"][0] + 1, duration_hours, 1000 / np.nanmean(log["frame_ms"]))]
+
+    lines.append("{:<32} {:>12} {:>12} {:>14}".format("metric", "first", "last", "trend per hour"))
+    for name, values in log.items():
+        if name in ("tick", "time") or np.all(np.isnan(values)):
+            continue
+        valid = ~np.isnan(values)
+        trend = np.polyfit(hours[valid], values[valid], 1)[0] if duration_hours > 0 and valid.sum() > 1 else 0.0
+        lines.append("{:<32} {:>12.4g} {:>12.4g} {:>+14.4g}".format(
+            name, np.nanmean(values[first]), np.nanmean(values[last]), trend))
+
+    # Frame time against asteroid count, e.g. to tell FPS decay from rising load apart from FPS decay at the same load
+    if "asteroids" in log:
+        valid = ~np.isnan(log["asteroids"]) & ~np.isnan(log["frame_ms"])
+        if np.ptp(log["asteroids"][valid]) > 0:
+            per_asteroid = np.polyfit(log["asteroids"][valid], log["frame_ms"][valid], 1)[0]
+            lines.append("frame time grows {:.3f} ms per 100 asteroids".format(per_asteroid * 100))
+    return lines
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarize a metrics log.")
+    parser.add_argument("log_file")
+    parser.add_argument("--window", type=float, default=10, metavar="MINUTES",
+                        help="Length of the first and last windows of the run compared.")
+    args = parser.parse_args()
+
+    for line in summarize(read_log(args.log_file), args.window * 60):
+        print(line)
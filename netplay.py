@@ -0,0 +1,700 @@
+#!/usr/bin/env python3
+# Networked multiplayer
+#
+# Authoritative UDP server running the asteroids simulation with one ship per player.  Every tick the server sends
+# each client a snapshot of the world, delta-compressed against the last snapshot the client acknowledged, with
+# positions, velocities and headings quantized.  Entities are dead reckoned from their quantized velocity and spin on
+# both ends, so an entity is only sent when it appears, changes state or drifts from its prediction.  Clients rebuild
+# full states from the deltas and interpolate between them.
+#
+# Usage: python netplay.py --server [--port N]
+#        python netplay.py --bench [--players N ...] [--ticks N]
+
+import argparse
+import collections
+import os
+import random
+import socket
+import struct
+import time
+import weakref
+
+import numpy as np
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import asteroids
+from spaceobjects.Spaceobjects import *
+from spaceobjects.Ecs import find_distances, find_overlaps
+
+NET_TICK_RATE = 30
+NET_DEFAULT_PORT = 50607
+NET_HISTORY_TICKS = 32          # Snapshots kept for delta compression (server) and reconstruction (client)
+NET_INTERP_DELAY_TICKS = 2      # Clients draw this far behind the latest snapshot
+NET_RESPAWN_TICKS = 4 * NET_TICK_RATE
+NET_PLAYER_TIMEOUT_TICKS = 5 * NET_TICK_RATE   # Players are dropped after this long without a packet from them
+NET_MAX_PACKET = 65507          # Largest UDP payload; snapshots are capped to it
+
+# Quantization: coordinates and speeds in 1/COORD_SCALE pixel units (16 and 8 bit), headings in 256 steps, spin in
+# 1/SPIN_SCALE heading steps per tick
+COORD_SCALE = 2
+COORD_MAX = 0xFFFF / COORD_SCALE
+HEADING_STEPS = 256
+SPIN_SCALE = 16
+
+# Largest prediction error before an entity is sent again (quantized units)
+NET_POSITION_TOLERANCE = 2
+NET_HEADING_TOLERANCE = 3
+
+# Entity kinds
+KIND_ASTEROID = 0
+KIND_PLASMA = 1
+KIND_SHIP = 2
+
+# Input bits
+INPUT_LEFT = 1
+INPUT_RIGHT = 2
+INPUT_THRUST = 4
+INPUT_FIRE = 8
+INPUT_DEATHBLOSSOM = 16
+
+# Packets.  Client -> server: join, input.  Server -> client: welcome, snapshot.
+PACKET_JOIN = b"J"
+PACKET_INPUT = b"I"
+PACKET_WELCOME = b"W"
+PACKET_SNAPSHOT = b"S"
+
+INPUT_FORMAT = struct.Struct("<cIIB")             # type, input sequence, acknowledged snapshot tick, input bits
+WELCOME_FORMAT = struct.Struct("<cH")             # type, player id
+SNAPSHOT_FORMAT = struct.Struct("<cIIHHHI")       # type, tick, base tick, changed count, removed count, ship id, score
+ENTITY_FORMAT = struct.Struct("<HBHHBBBbbb")      # id, kind, x, y, heading, sprite index, extra, speed x, speed y, spin
+REMOVED_FORMAT = struct.Struct("<H")
+
+FULL_SNAPSHOT = 0xFFFFFFFF      # Base tick of a snapshot that is not a delta
+NO_SHIP = 0xFFFF
+
+
+def _clamp(value, low, high):
+    return min(max(int(round(value)), low), high)
+
+
+def quantize_entity(kind, obj):
+    """
+    :return: Quantized (kind, x, y, heading, sprite index, extra, speed x, speed y, spin) record of an object.
+    """
+    x = _clamp(obj.coord_x * COORD_SCALE, 0, 0xFFFF)
+    y = _clamp(obj.coord_y * COORD_SCALE, 0, 0xFFFF)
+    heading = int(round(obj.heading % 360 * HEADING_STEPS / 360)) % HEADING_STEPS
+    extra = min(obj.deathblossom_radius, 255) if kind == KIND_SHIP and obj.is_firing_deathblossom else 0
+    speed_x = _clamp(obj.speed_x * COORD_SCALE, -128, 127)
+    speed_y = _clamp(obj.speed_y * COORD_SCALE, -128, 127)
+    spin = _clamp(getattr(obj, "spin", 0) * HEADING_STEPS / 360 * SPIN_SCALE, -128, 127)
+    return (kind, x, y, heading, obj.sprite_index, extra, speed_x, speed_y, spin)
+
+
+def predict_record(record, ticks):
+    """
+    Dead reckon a quantized record forward.  Integer only, so the server and clients predict identically.
+    :param record: Quantized record.
+    :param ticks: Ticks to predict ahead.
+    :return: Predicted record.
+    """
+    kind, x, y, heading, sprite_index, extra, speed_x, speed_y, spin = record
+    x = min(max(x + speed_x * ticks, 0), 0xFFFF)
+    y = min(max(y + speed_y * ticks, 0), 0xFFFF)
+    heading = (heading + spin * ticks // SPIN_SCALE) % HEADING_STEPS
+    return (kind, x, y, heading, sprite_index, extra, speed_x, speed_y, spin)
+
+
+def _is_predicted(record, predicted):
+    """
+    :return: True if a record is close enough to its prediction that it need not be sent.
+    """
+    heading_error = abs(record[3] - predicted[3])
+    return (record[0] == predicted[0] and record[4:] == predicted[4:] and
+            abs(record[1] - predicted[1]) <= NET_POSITION_TOLERANCE and
+            abs(record[2] - predicted[2]) <= NET_POSITION_TOLERANCE and
+            min(heading_error, HEADING_STEPS - heading_error) <= NET_HEADING_TOLERANCE)
+
+
+def encode_snapshot(tick, base_tick, state, base_state, ship_id, score, max_packet=NET_MAX_PACKET):
+    """
+    Encode a snapshot as the difference between a state and the client's prediction of it from a base state.
+    Removals and changed entities that don't fit in max_packet are left out (ships first, then plasma, then
+    asteroids are kept); the client keeps predicting them from the base state, so a later snapshot sends them.
+    :param tick: Tick of the state.
+    :param base_tick: Tick of the base state (FULL_SNAPSHOT for none).
+    :param state: Dict of entity id -> quantized record.
+    :param base_state: Dict of entity id -> quantized record the client has for the base tick (empty for a full
+                       snapshot).
+    :param ship_id: Entity id of the receiving player's ship (NO_SHIP if none).
+    :param score: Receiving player's score.
+    :param max_packet: Largest packet size in bytes.
+    :return: (packet bytes, state the client will have after decoding it)
+    """
+    changed = []
+    client_state = {}
+    for entity_id, record in state.items():
+        base_record = base_state.get(entity_id, None)
+        if base_record is not None:
+            predicted = predict_record(base_record, tick - base_tick)
+            if _is_predicted(record, predicted):
+                client_state[entity_id] = predicted
+                continue
+        changed.append((entity_id, record))
+        client_state[entity_id] = record
+    removed = [entity_id for entity_id in base_state if entity_id not in state]
+
+    room = max_packet - SNAPSHOT_FORMAT.size
+    if len(changed) * ENTITY_FORMAT.size + len(removed) * REMOVED_FORMAT.size > room:
+        removed_count = min(len(removed), room // REMOVED_FORMAT.size)
+        for entity_id in removed[removed_count:]:
+            client_state[entity_id] = predict_record(base_state[entity_id], tick - base_tick)
+        removed = removed[:removed_count]
+
+        changed_count = (room - removed_count * REMOVED_FORMAT.size) // ENTITY_FORMAT.size
+        changed.sort(key=lambda item: item[1][0], reverse=True)
+        for entity_id, record in changed[changed_count:]:
+            base_record = base_state.get(entity_id, None)
+            if base_record is None:
+                del client_state[entity_id]
+            else:
+                client_state[entity_id] = predict_record(base_record, tick - base_tick)
+        changed = changed[:changed_count]
+
+    parts = [SNAPSHOT_FORMAT.pack(PACKET_SNAPSHOT, tick, base_tick, len(changed), len(removed), ship_id, score)]
+    parts.extend(ENTITY_FORMAT.pack(entity_id, *record) for entity_id, record in changed)
+    parts.extend(REMOVED_FORMAT.pack(entity_id) for entity_id in removed)
+    return b"".join(parts), client_state
+
+
+def decode_snapshot(packet):
+    """
+    :return: (tick, base tick, changed {id: record}, removed [id], ship id, score)
+    """
+    _, tick, base_tick, changed_count, removed_count, ship_id, score = SNAPSHOT_FORMAT.unpack_from(packet)
+    offset = SNAPSHOT_FORMAT.size
+    changed = {}
+    for i in range(changed_count):
+        entity_id, *record = ENTITY_FORMAT.unpack_from(packet, offset)
+        changed[entity_id] = tuple(record)
+        offset += ENTITY_FORMAT.size
+    removed = []
+    for i in range(removed_count):
+        removed.append(REMOVED_FORMAT.unpack_from(packet, offset)[0])
+        offset += REMOVED_FORMAT.size
+    return tick, base_tick, changed, removed, ship_id, score
+
+
+class Player:
+    """
+    Server side state of a connected client.
+    """
+    def __init__(self, player_id, address):
+        self.player_id = player_id
+        self.address = address
+        self.ship = None
+        self.score = 0
+        self.respawn_tick = 0
+
+        self.input_bits = 0
+        self.input_sequence = -1
+        self.acked_tick = None
+        self.last_packet_tick = 0
+
+        # Snapshot tick -> state the client has after decoding that snapshot
+        self.history = {}
+
+
+class NetServer:
+    """
+    Authoritative game server.  Runs the game's simulation rules (asteroids, weapons, ships, collisions) for every
+    player's ship and sends snapshots to the clients.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, delta=True, asteroid_count=asteroids.ASTEROID_STARTING_COUNT):
+        """
+        :param host: Address to bind.
+        :param port: UDP port (0 picks a free port).
+        :param delta: True/False - Delta-compress snapshots.  False sends full snapshots (for comparison).
+        :param asteroid_count: Number of asteroids in each wave.
+        """
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((host, port))
+        self.sock.setblocking(False)
+        self.address = self.sock.getsockname()
+        self.delta = delta
+        self.asteroid_count = asteroid_count
+
+        self.tick = 0
+        self.players = {}               # address -> Player
+        self.asteroids = asteroids.create_asteroids(asteroid_count)
+
+        # Entity ids, assigned when an object is first sent and released when it leaves the world state.  Released
+        # ids are reused oldest first, so an id is never shared by two live objects.
+        self._entity_ids = weakref.WeakKeyDictionary()
+        self._entity_objects = {}       # id -> weak reference to the object holding it
+        self._free_entity_ids = collections.deque()
+        self._next_entity_id = 0
+
+        # Statistics
+        self.bytes_sent = 0
+        self.packets_sent = 0
+        self.tick_time_total = 0
+
+
+    def close(self):
+        self.sock.close()
+
+
+    def _entity_id(self, obj):
+        entity_id = self._entity_ids.get(obj, None)
+        if entity_id is None:
+            if self._free_entity_ids:
+                entity_id = self._free_entity_ids.popleft()
+            elif self._next_entity_id < NO_SHIP:
+                entity_id = self._next_entity_id
+                self._next_entity_id += 1
+            else:
+                raise RuntimeError("More than {} entities in the world".format(NO_SHIP))
+            self._entity_ids[obj] = entity_id
+            self._entity_objects[entity_id] = weakref.ref(obj)
+        return entity_id
+
+
+    def _release_entity_ids(self, state):
+        """
+        Free the ids of objects that are no longer in the world state.
+        """
+        for entity_id in [entity_id for entity_id in self._entity_objects if entity_id not in state]:
+            obj = self._entity_objects.pop(entity_id)()
+            if obj is not None:
+                del self._entity_ids[obj]
+            self._free_entity_ids.append(entity_id)
+
+
+    def _spawn_ship(self, player):
+        # A respawned ship takes over the weapon slots of the ship it replaces
+        weapon_slots = None
+        if player.ship:
+            weapon_slots = player.ship.weapon_slots
+            player.ship.release()
+        ship = Ship(*asteroids.SHIP_START_LOCATION, weapon_slots=weapon_slots)
+        ship.set_move_bounds(asteroids.LEVEL_WIDTH, asteroids.LEVEL_HEIGHT, edge_bounce=True)
+        player.ship = ship
+
+
+    def _receive(self):
+        while True:
+            try:
+                packet, address = self.sock.recvfrom(NET_MAX_PACKET)
+            except BlockingIOError:
+                return
+
+            player = self.players.get(address, None)
+            if packet[:1] == PACKET_JOIN:
+                if player is None:
+                    player_ids = {other.player_id for other in self.players.values()}
+                    player = Player(min(set(range(len(player_ids) + 1)) - player_ids), address)
+                    self._spawn_ship(player)
+                    self.players[address] = player
+                self.sock.sendto(WELCOME_FORMAT.pack(PACKET_WELCOME, player.player_id), address)
+                player.last_packet_tick = self.tick
+
+            elif packet[:1] == PACKET_INPUT and player is not None and len(packet) == INPUT_FORMAT.size:
+                _, sequence, acked_tick, bits = INPUT_FORMAT.unpack(packet)
+                player.last_packet_tick = self.tick
+                if sequence > player.input_sequence:
+                    player.input_sequence = sequence
+                    player.input_bits = bits
+                if acked_tick in player.history and (player.acked_tick is None or acked_tick > player.acked_tick):
+                    player.acked_tick = acked_tick
+
+
+    def _drop_idle_players(self):
+        """
+        Remove the players that sent nothing for NET_PLAYER_TIMEOUT_TICKS.  Their ship and its plasma leave the world.
+        """
+        for address in [address for address, player in self.players.items()
+                        if self.tick - player.last_packet_tick > NET_PLAYER_TIMEOUT_TICKS]:
+            ship = self.players.pop(address).ship
+            for weapon in ship.weapon_slots:
+                weapon.release()
+            ship.release()
+
+
+    def _weapon_owners(self):
+        """
+        :return: Dict of weapon in flight -> player, from the weapon slots of every player's ship.
+        """
+        return {weapon: player for player in self.players.values() for weapon in player.ship.weapon_slots}
+
+
+    def _apply_inputs(self):
+        for player in self.players.values():
+            ship = player.ship
+            bits = player.input_bits
+            if bits & INPUT_LEFT and not bits & INPUT_RIGHT:
+                ship.rotate(6)
+            elif bits & INPUT_RIGHT and not bits & INPUT_LEFT:
+                ship.rotate(-6)
+            if bits & INPUT_THRUST:
+                ship.thrust(.5)
+            if bits & INPUT_FIRE:
+                # The shot goes in the ship's weapon slots
+                weapon = ship.shoot("plasma")
+                if weapon:
+                    weapon.set_move_bounds(edge_bounce=False)
+            if bits & INPUT_DEATHBLOSSOM:
+                ship.shoot("deathblossom")
+
+            # Fire buttons act once per press
+            player.input_bits &= ~(INPUT_FIRE | INPUT_DEATHBLOSSOM)
+
+
+    def _simulate(self):
+        """
+        One tick of the game simulation for all players' ships.
+        """
+        ships = [player.ship for player in self.players.values()]
+        weapon_owners = self._weapon_owners()
+        weapons = list(weapon_owners)
+        update_batch(self.asteroids)
+
+        # Rotated sprites set the hitbox sizes
+        update_sprites(self.asteroids)
+
+        # Weapons move before the hit test, which sweeps them along this tick's movement
+        update_batch(weapons)
+
+        fragments = []
+        for weapon, i in asteroids.find_weapon_hits(weapons, self.asteroids):
+            rock = self.asteroids[i]
+            rock.is_alive = False
+            weapon.is_alive = False
+            weapon_owners[weapon].score += asteroids.SCORE_ASTEROID_HIT
+            fragments.extend(asteroids.break_asteroid(rock, [(ship.coord_x, ship.coord_y) for ship in ships],
+                                                      self.asteroids + fragments))
+
+        # Ship hitboxes are tested in one batch, then the hits are handled in asteroid order
+        registry = get_registry()
+        players = list(self.players.values())
+        rock_rows = entity_rows(self.asteroids)
+        ship_hits = find_overlaps(registry, rock_rows, entity_rows(ships))
+        columns = registry.columns
+        rock_reach = np.minimum(columns["sprite_width"][rock_rows] // 2, columns["sprite_height"][rock_rows] // 2)
+        blossom_hits = np.zeros_like(ship_hits)
+        for p, ship in enumerate(ships):
+            if ship.is_firing_deathblossom:
+                blossom_hits[:, p] = (find_distances(registry, rock_rows, ship.coord_x, ship.coord_y) <=
+                                      ship.deathblossom_radius + rock_reach)
+        hits = ship_hits.any(axis=1) | blossom_hits.any(axis=1)
+
+        for i in np.flatnonzero(hits).tolist():
+            rock = self.asteroids[i]
+            for p, player in enumerate(players):
+                ship = player.ship
+                if not rock.is_alive:
+                    break
+                if blossom_hits[i, p]:
+                    rock.is_alive = False
+                    player.score += asteroids.SCORE_ASTEROID_HIT
+                elif ship.is_alive and ship_hits[i, p]:
+                    ship.animation_config(ship.ANIMATION_BOOM_FRAME_TIME, "boom", False)
+                    ship.animation_start()
+                    ship.is_alive = False
+                    player.respawn_tick = self.tick + NET_RESPAWN_TICKS
+
+        for rock in self.asteroids:
+            if not rock.is_alive:
+                rock.release()
+        self.asteroids = [rock for rock in self.asteroids if rock.is_alive] + fragments
+        for ship in ships:
+            ship.weapon_slots.release_dead()
+
+        for ship in ships:
+            ship.update()
+        get_animator().advance(1 / NET_TICK_RATE)
+
+        for player in self.players.values():
+            if not player.ship.is_alive and player.ship.animation_complete and self.tick >= player.respawn_tick:
+                self._spawn_ship(player)
+
+        # Next wave
+        if not self.asteroids:
+            self.asteroids = asteroids.create_asteroids(self.asteroid_count,
+                                                        [(ship.coord_x, ship.coord_y) for ship in ships])
+
+
+    def _world_state(self):
+        state = {}
+        for rock in self.asteroids:
+            state[self._entity_id(rock)] = quantize_entity(KIND_ASTEROID, rock)
+        for weapon in self._weapon_owners():
+            state[self._entity_id(weapon)] = quantize_entity(KIND_PLASMA, weapon)
+        for player in self.players.values():
+            ship = player.ship
+            if ship.is_alive or not ship.animation_complete:
+                state[self._entity_id(ship)] = quantize_entity(KIND_SHIP, ship)
+        self._release_entity_ids(state)
+        return state
+
+
+    def _send_snapshots(self, state):
+        for player in self.players.values():
+            base_tick = FULL_SNAPSHOT
+            base_state = {}
+            if self.delta and player.acked_tick in player.history:
+                base_tick = player.acked_tick
+                base_state = player.history[base_tick]
+
+            ship_id = self._entity_ids.get(player.ship, NO_SHIP)
+            packet, client_state = encode_snapshot(self.tick, base_tick, state, base_state, ship_id, player.score)
+            self.sock.sendto(packet, player.address)
+            self.bytes_sent += len(packet)
+            self.packets_sent += 1
+
+            player.history[self.tick] = client_state
+            player.history.pop(self.tick - NET_HISTORY_TICKS, None)
+
+
+    def step(self):
+        """
+        Run one server tick: read client packets, simulate, send snapshots.
+        :return: None
+        """
+        t0 = time.perf_counter()
+        self.tick += 1
+        self._receive()
+        self._drop_idle_players()
+        self._apply_inputs()
+        self._simulate()
+        self._send_snapshots(self._world_state())
+        self.tick_time_total += time.perf_counter() - t0
+
+
+    def run(self):
+        """
+        Run the server in real time until interrupted.
+        """
+        next_tick = time.perf_counter()
+        while True:
+            self.step()
+            next_tick += 1 / NET_TICK_RATE
+            time.sleep(max(next_tick - time.perf_counter(), 0))
+
+
+class NetClient:
+    """
+    Headless game client.  Sends inputs, rebuilds world states from delta snapshots and interpolates between them.
+    """
+
+    def __init__(self, server_address):
+        self.server_address = server_address
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(("127.0.0.1", 0))
+        self.sock.setblocking(False)
+
+        self.player_id = None
+        self.ship_id = NO_SHIP
+        self.score = 0
+
+        # Tick -> {entity id: quantized record}
+        self.states = {}
+        self.latest_tick = None
+        self.latest_receive_time = 0
+
+        self.input_sequence = 0
+        self.bytes_received = 0
+        self.undecodable_snapshots = 0
+
+
+    def close(self):
+        self.sock.close()
+
+
+    def join(self):
+        self.sock.sendto(PACKET_JOIN, self.server_address)
+
+
+    def send_input(self, bits):
+        """
+        :param bits: INPUT_* bits for this tick.
+        :return: None
+        """
+        self.input_sequence += 1
+        acked = self.latest_tick if self.latest_tick is not None else FULL_SNAPSHOT
+        self.sock.sendto(INPUT_FORMAT.pack(PACKET_INPUT, self.input_sequence, acked, bits), self.server_address)
+
+
+    def poll(self):
+        """
+        Read all waiting packets.
+        :return: Number of snapshots received.
+        """
+        received = 0
+        while True:
+            try:
+                packet, address = self.sock.recvfrom(NET_MAX_PACKET)
+            except BlockingIOError:
+                return received
+
+            self.bytes_received += len(packet)
+            if packet[:1] == PACKET_WELCOME:
+                self.player_id = WELCOME_FORMAT.unpack(packet)[1]
+            elif packet[:1] == PACKET_SNAPSHOT:
+                if self._apply_snapshot(packet):
+                    received += 1
+
+
+    def _apply_snapshot(self, packet):
+        tick, base_tick, changed, removed, ship_id, score = decode_snapshot(packet)
+        if self.latest_tick is not None and tick <= self.latest_tick:
+            return False            # Late or duplicate
+
+        if base_tick == FULL_SNAPSHOT:
+            state = {}
+        else:
+            base_state = self.states.get(base_tick, None)
+            if base_state is None:
+                self.undecodable_snapshots += 1
+                return False
+            ticks = tick - base_tick
+            state = {entity_id: predict_record(record, ticks) for entity_id, record in base_state.items()}
+
+        state.update(changed)
+        for entity_id in removed:
+            state.pop(entity_id, None)
+
+        self.states[tick] = state
+        for old_tick in [t for t in self.states if t <= tick - NET_HISTORY_TICKS]:
+            del self.states[old_tick]
+        self.latest_tick = tick
+        self.latest_receive_time = time.perf_counter()
+        self.ship_id = ship_id
+        self.score = score
+        return True
+
+
+    def render_tick(self, now=None):
+        """
+        :return: Fractional tick to draw at: interpolation delay behind the latest snapshot, advanced by the time
+        since it arrived.
+        """
+        now = time.perf_counter() if now is None else now
+        since = min((now - self.latest_receive_time) * NET_TICK_RATE, 1)
+        return self.latest_tick - NET_INTERP_DELAY_TICKS + since
+
+
+    def entities_at(self, render_tick):
+        """
+        Interpolate the world between the two snapshots around a tick.
+        :param render_tick: Fractional tick.
+        :return: List of (entity id, kind, x, y, heading, sprite index, extra) with world coordinates and degrees.
+        """
+        if not self.states:
+            return []
+        ticks = sorted(self.states)
+        before = max((t for t in ticks if t <= render_tick), default=ticks[0])
+        after = min((t for t in ticks if t > render_tick), default=before)
+        fraction = (render_tick - before) / (after - before) if after != before else 0
+        fraction = min(max(fraction, 0), 1)
+
+        entities = []
+        state_after = self.states[after]
+        for entity_id, (kind, x, y, heading, sprite_index, extra, *speeds) in self.states[before].items():
+            x /= COORD_SCALE
+            y /= COORD_SCALE
+            heading *= 360 / HEADING_STEPS
+            next_record = state_after.get(entity_id, None)
+            if next_record is not None:
+                nx = next_record[1] / COORD_SCALE
+                ny = next_record[2] / COORD_SCALE
+                # Don't sweep across the level when an object wraps to the opposite edge
+                if abs(nx - x) < asteroids.LEVEL_WIDTH / 2 and abs(ny - y) < asteroids.LEVEL_HEIGHT / 2:
+                    x += (nx - x) * fraction
+                    y += (ny - y) * fraction
+                turn = (next_record[3] * 360 / HEADING_STEPS - heading + 180) % 360 - 180
+                heading += turn * fraction
+            entities.append((entity_id, kind, x, y, heading, sprite_index, extra))
+        return entities
+
+
+def bot_input(rng, tick):
+    """
+    Random but plausible inputs for a headless client.
+    """
+    bits = rng.choice([0, INPUT_LEFT, INPUT_RIGHT]) | (INPUT_THRUST if rng.random() < 0.3 else 0)
+    if tick % 10 == 0:
+        bits |= INPUT_FIRE
+    return bits
+
+
+def benchmark(player_count, ticks, delta=True, seed=0):
+    """
+    Run a server and headless clients over localhost in lockstep.
+    :return: (average bytes sent per tick, average server tick ms, snapshots the clients could not decode)
+    """
+    random.seed(seed)
+    rng = random.Random(seed)
+    server = NetServer(delta=delta)
+    clients = [NetClient(server.address) for i in range(player_count)]
+    try:
+        for client in clients:
+            client.join()
+        server.step()
+        for client in clients:
+            client.poll()
+
+        server.bytes_sent = 0
+        server.tick_time_total = 0
+        for tick in range(ticks):
+            for client in clients:
+                client.send_input(bot_input(rng, tick))
+            server.step()
+            for client in clients:
+                client.poll()
+                client.entities_at(client.render_tick())
+    finally:
+        server.close()
+        for client in clients:
+            client.close()
+
+    undecodable = sum(client.undecodable_snapshots for client in clients)
+    return server.bytes_sent / ticks, server.tick_time_total * 1000 / ticks, undecodable
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Asteroids network server and benchmark.")
+    parser.add_argument("--server", action="store_true", help="Run a game server.")
+    parser.add_argument("--port", type=int, default=NET_DEFAULT_PORT)
+    parser.add_argument("--bench", action="store_true", help="Benchmark with headless clients over localhost.")
+    parser.add_argument("--players", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--ticks", type=int, default=300)
+    args = parser.parse_args()
+
+    asteroids.init_game()
+
+    if args.server:
+        server = NetServer("0.0.0.0", args.port)
+        print("Serving on port {}".format(server.address[1]))
+        server.run()
+
+    elif args.bench:
+        print("{:>8}{:>18}{:>18}{:>10}{:>16}".format("players", "delta bytes/tick", "full bytes/tick", "ratio",
+                                                      "server tick ms"))
+        for player_count in args.players:
+            delta_bytes, tick_ms, undecodable = benchmark(player_count, args.ticks, delta=True)
+            full_bytes, full_tick_ms, _ = benchmark(player_count, args.ticks, delta=False)
+            print("{:>8}{:>18.0f}{:>18.0f}{:>9.1f}x{:>16.2f}".format(player_count, delta_bytes, full_bytes,
+                                                                     full_bytes / delta_bytes, tick_ms))
+            if undecodable:
+                print("         {} snapshots could not be decoded".format(undecodable))
+
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+# Frame pacing
+#
+# Waits out the rest of each frame to hold a target frame rate, and measures how evenly frames are delivered.
+# time.sleep() wakes up late by an amount that depends on the OS timer (up to several milliseconds), so sleeping to
+# the deadline makes frame intervals uneven.  Busy-waiting hits the deadline closely but burns a CPU core.  The
+# hybrid strategy sleeps until a margin before the deadline and spins the rest; the adaptive strategy learns that
+# margin from a percentile of the recent sleep overshoots, so it spins no longer than the timer usually needs and a
+# single late wake-up doesn't keep it spinning.
+
+import collections
+import time
+
+import numpy as np
+
+PACING_SLEEP = "sleep"          # Sleep to the deadline: least CPU, wakes up late by the timer's overshoot
+PACING_HYBRID = "hybrid"        # Sleep until a fixed margin before the deadline, then spin
+PACING_SPIN = "spin"            # Busy-wait to the deadline: most even, keeps a core busy
+PACING_ADAPTIVE = "adaptive"    # Hybrid with the margin adapted to the recent sleep overshoots
+PACING_STRATEGIES = [PACING_SLEEP, PACING_HYBRID, PACING_SPIN, PACING_ADAPTIVE]
+
+# Adaptive spin margin: a percentile of the recent sleep overshoots, plus a minimum
+ADAPTIVE_MARGIN_PERCENTILE = 95
+ADAPTIVE_MIN_MARGIN = 0.0002
+
+# Upper edges of the jitter histogram bins in milliseconds (the last bin takes the rest)
+JITTER_BINS_MS = [0.25, 0.5, 1, 2, 4, 8]
+
+
+class FramePacer:
+    """
+    Paces frames to a target frame time.  The game calls presented() right after showing a frame and wait() at the
+    end of the frame, in place of pygame.time.Clock.tick().  Deadlines are spaced one frame time apart, so a short
+    frame doesn't push the following ones later; after falling behind by more than a frame, pacing restarts from
+    the current time rather than rushing to catch up.
+    """
+
+    def __init__(self, fps=30, strategy=PACING_ADAPTIVE, spin_margin=0.002, history_frames=300, adapt_frames=60):
+        """
+        :param fps: Target frame rate (0 for no pacing).
+        :param strategy: PACING_SLEEP, PACING_HYBRID, PACING_SPIN or PACING_ADAPTIVE.
+        :param spin_margin: Seconds before the deadline at which the hybrid strategy stops sleeping and spins.
+        :param history_frames: Frames of intervals kept for the histograms and statistics.
+        :param adapt_frames: Frames of sleep overshoots the adaptive strategy takes its margin from.
+        """
+        if strategy not in PACING_STRATEGIES:
+            raise ValueError("Unknown pacing strategy: {}".format(strategy))
+
+        self.fps = fps
+        self.strategy = strategy
+        self.spin_margin = spin_margin
+
+        # Frame-to-frame intervals (between wait() returns) and present-to-present intervals (between presented()
+        # calls), in seconds
+        self.frame_intervals = collections.deque(maxlen=history_frames)
+        self.present_intervals = collections.deque(maxlen=history_frames)
+
+        # Recent times sleep() woke up after it was asked to, and the adaptive margin taken from them
+        self.sleep_overshoots = collections.deque(maxlen=adapt_frames)
+        self._adaptive_margin = ADAPTIVE_MIN_MARGIN
+
+        # Time spent sleeping and spinning, and frames that ended after their deadline
+        self.sleep_secs = 0.0
+        self.spin_secs = 0.0
+        self.late_frames = 0
+
+        self._deadline = None
+        self._last_frame = None
+        self._last_present = None
+
+
+    def presented(self):
+        """
+        Record that a frame was shown (call right after the display flip).
+        :return: None
+        """
+        now = time.perf_counter()
+        if self._last_present is not None:
+            self.present_intervals.append(now - self._last_present)
+        self._last_present = now
+
+
+    def wait(self, fps=None):
+        """
+        Wait until the current frame's deadline.
+        :param fps: New target frame rate (None keeps the current one; 0 for no pacing).
+        :return: Seconds since the previous call returned.
+        """
+        if fps is not None:
+            self.fps = fps
+
+        now = time.perf_counter()
+        if self.fps > 0:
+            frame_secs = 1 / self.fps
+            if self._deadline is None or now > self._deadline + frame_secs:
+                # First frame, or fell behind by more than a frame: restart pacing from now
+                if self._deadline is not None:
+                    self.late_frames += 1
+                self._deadline = now
+            else:
+                if now > self._deadline:
+                    self.late_frames += 1
+                self._pace(self._deadline)
+            self._deadline += frame_secs
+        else:
+            self._deadline = None
+
+        now = time.perf_counter()
+        elapsed = 0.0 if self._last_frame is None else now - self._last_frame
+        if self._last_frame is not None:
+            self.frame_intervals.append(elapsed)
+        self._last_frame = now
+        return elapsed
+
+
+    def _pace(self, deadline):
+        """
+        Wait until the deadline with the pacing strategy.
+        """
+        if self.strategy == PACING_SLEEP:
+            self._sleep(deadline)
+        elif self.strategy == PACING_SPIN:
+            self._spin(deadline)
+        else:
+            self._sleep(deadline - self.margin())
+            self._spin(deadline)
+            if self.strategy == PACING_ADAPTIVE and self.sleep_overshoots:
+                overshoots = sorted(self.sleep_overshoots)
+                rank = min(len(overshoots) * ADAPTIVE_MARGIN_PERCENTILE // 100, len(overshoots) - 1)
+                self._adaptive_margin = overshoots[rank] + ADAPTIVE_MIN_MARGIN
+
+
+    def margin(self):
+        """
+        :return: Seconds before the deadline at which the hybrid and adaptive strategies stop sleeping and spin.
+        """
+        if self.strategy == PACING_ADAPTIVE:
+            return self._adaptive_margin
+        return self.spin_margin
+
+
+    def _sleep(self, until):
+        now = time.perf_counter()
+        if until <= now:
+            return
+        time.sleep(until - now)
+        woke = time.perf_counter()
+        self.sleep_secs += woke - now
+        self.sleep_overshoots.append(woke - until)
+
+
+    def _spin(self, until):
+        start = time.perf_counter()
+        now = start
+        while now < until:
+            now = time.perf_counter()
+        self.spin_secs += now - start
+
+
+    def jitter_ms(self, intervals=None):
+        """
+        :param intervals: Intervals in seconds (defaults to the frame intervals).
+        :return: NumPy array of the intervals' distance from the target frame time in milliseconds.
+        """
+        intervals = self.frame_intervals if intervals is None else intervals
+        if not self.fps or not intervals:
+            return np.zeros(0)
+        return np.abs(np.array(intervals) - 1 / self.fps) * 1000
+
+
+    def jitter_histogram(self, intervals=None):
+        """
+        :param intervals: Intervals in seconds (defaults to the frame intervals).
+        :return: List of frame counts per JITTER_BINS_MS bin, plus one for larger jitter.
+        """
+        jitter = self.jitter_ms(intervals)
+        return np.bincount(np.searchsorted(JITTER_BINS_MS, jitter), minlength=len(JITTER_BINS_MS) + 1).tolist()
+
+
+    def report_lines(self):
+        """
+        Pacing statistics and jitter histograms as text lines (a profiler report source).
+        :return: List of strings.
+        """
+        waited = self.sleep_secs + self.spin_secs
+        lines = ["pacing {} {} fps: spin {:.0f}% of wait, margin {:.2f} ms, {} late".format(
+            self.strategy, self.fps, self.spin_secs * 100 / waited if waited else 0, self.margin() * 1000,
+            self.late_frames)]
+
+        for name, intervals in (("frame", self.frame_intervals), ("present", self.present_intervals)):
+            jitter = self.jitter_ms(intervals)
+            if not jitter.size:
+                continue
+            lines.append("{} interval {:.2f} ms, jitter p99 {:.2f} ms".format(
+                name, np.mean(intervals) * 1000, np.percentile(jitter, 99)))
+            counts = self.jitter_histogram(intervals)
+            lines.append("  " + " ".join("<{:g}:{}".format(edge, count) for edge, count in zip(JITTER_BINS_MS, counts)) +
+                         " more:{}".format(counts[-1]))
+        return lines
@@ -0,0 +1,415 @@
+#!/usr/bin/env python3
+# Multicore chunked world
+#
+# Chunked world for the stress/huge-map mode whose sleeping asteroids are simulated every tick on worker processes,
+# so weapons hit them outside the resident chunks too.  The level is partitioned into horizontal bands, each owned by
+# one worker.  Sleeping asteroids are rows of an EntityRegistry in multiprocessing.shared_memory, which the workers
+# update with the ECS movement and collision systems; only small index arrays pass through the worker pipes.
+#
+# Usage: python asteroids.py --stress [--workers N]
+#        python parallel.py [--asteroids N] [--workers N] [--ticks N]     (benchmark)
+
+import argparse
+import multiprocessing as mp
+import os
+import random
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from spaceobjects.Ecs import (LOD_TICK_NONE, EntityRegistry, advance_movement, find_impacts, update_movement,
+                              update_spin)
+from spaceobjects.Spaceobjects import Asteroid, entity_rows, get_registry
+from world import ChunkedWorld, chunk_ids
+
+# Fields the collision system reads from the weapons, copied to the shared registry every tick
+WEAPON_FIELDS = ("coord_x", "coord_y", "speed_x", "speed_y", "sprite_width", "sprite_height", "shrinkhitbox_xy",
+                 "is_solid", "is_visible", "is_alive")
+
+
+def band_of(y, band_height, band_count):
+    return np.minimum((y // band_height).astype(np.int64), band_count - 1)
+
+
+class Band:
+    """
+    Simulation of the sleeping asteroids in one horizontal band of the level.  Runs in a worker process, or in the
+    main process when there are no workers.
+    """
+
+    def __init__(self, band, band_count, registry, level_height, chunk_width, chunk_height, chunks_x, chunks_y):
+        """
+        :param band: Index of the band, from the top.
+        :param band_count: Number of bands.
+        :param registry: EntityRegistry holding the rows.
+        :param level_height: Height of the level.
+        :param chunk_width: Width of a world chunk.
+        :param chunk_height: Height of a world chunk.
+        :param chunks_x: Number of chunks across the level.
+        :param chunks_y: Number of chunks down the level.
+        """
+        self.band = band
+        self.band_count = band_count
+        self.band_height = level_height / band_count
+        self.registry = registry
+        self.chunk_geometry = (chunk_width, chunk_height, chunks_x, chunks_y)
+
+        # Rows of the asteroids in the band
+        self.owned = np.zeros(0, dtype=np.intp)
+
+
+    def tick(self, incoming, weapon_rows):
+        """
+        Take ownership of rows handed to the band, move the asteroids one tick and sweep the weapons against them.
+        :param incoming: Index array of rows that entered the band or were put to sleep in it.
+        :param weapon_rows: Index array of the weapon rows, which have moved this tick.
+        :return: (rows that left the band, dead rows given up, (weapon rows, asteroid rows, times of impact) of hits)
+        """
+        columns = self.registry.columns
+        owned = np.concatenate((self.owned, incoming))
+
+        # Asteroids hit on the last tick are dead and are given back to be freed
+        alive = columns["is_alive"][owned]
+        dead = owned[~alive]
+        owned = owned[alive]
+
+        update_movement(self.registry, owned)
+        update_spin(self.registry, owned)
+
+        candidates = owned[self._near_weapons(owned, weapon_rows)]
+        impacts = find_impacts(self.registry, weapon_rows, candidates)
+        weapon_index, rock_index = np.nonzero(np.isfinite(impacts))
+        hits = (weapon_rows[weapon_index], candidates[rock_index], impacts[weapon_index, rock_index])
+
+        # Hand off asteroids that left the band
+        leaving = band_of(columns["coord_y"][owned], self.band_height, self.band_count) != self.band
+        self.owned = owned[~leaving]
+        return owned[leaving], dead, hits
+
+
+    def _near_weapons(self, rows, weapon_rows):
+        """
+        Broad phase of the weapon collisions: find the asteroids close enough to a weapon's path over the tick to be
+        hit, so only those are swept against the weapons.
+        :return: Boolean array, True for the rows near a weapon.
+        """
+        columns = self.registry.columns
+        near = np.zeros(len(rows), dtype=bool)
+        if not len(rows) or not len(weapon_rows):
+            return near
+
+        # Furthest an asteroid's center can be from a weapon's end position when they touch during the tick
+        rock_reach = (max(columns["sprite_width"][rows].max(), columns["sprite_height"][rows].max()) / 2 +
+                      max(np.abs(columns["speed_x"][rows]).max(), np.abs(columns["speed_y"][rows]).max()))
+        x = columns["coord_x"][rows]
+        y = columns["coord_y"][rows]
+        for weapon_x, weapon_y, speed_x, speed_y, width, height in zip(
+                *(columns[name][weapon_rows].tolist() for name in ("coord_x", "coord_y", "speed_x", "speed_y",
+                                                                   "sprite_width", "sprite_height"))):
+            reach = rock_reach + max(width, height) / 2
+            near |= ((np.abs(x - weapon_x) <= reach + abs(speed_x)) & (np.abs(y - weapon_y) <= reach + abs(speed_y)))
+        return near
+
+
+    def wake(self, wanted_ids):
+        """
+        Give up the live rows in the wanted chunks.
+        :param wanted_ids: Array of the ids of the wanted chunks.
+        :return: Index array of the rows.
+        """
+        columns = self.registry.columns
+        owned = self.owned
+        waking = np.isin(chunk_ids(columns["coord_x"][owned], columns["coord_y"][owned], *self.chunk_geometry),
+                         wanted_ids) & columns["is_alive"][owned]
+        self.owned = owned[~waking]
+        return owned[waking]
+
+
+def _worker(band, band_count, shm_name, capacity, level_height, chunk_width, chunk_height, chunks_x, chunks_y, conn):
+    """
+    Worker process: simulates one band until told to stop.
+    """
+    shm = shared_memory.SharedMemory(name=shm_name)
+    registry = EntityRegistry(capacity, shm.buf, clear=False)
+    simulation = Band(band, band_count, registry, level_height, chunk_width, chunk_height, chunks_x, chunks_y)
+    try:
+        while True:
+            message, args = conn.recv()
+            if message == "stop":
+                break
+            elif message == "tick":
+                conn.send(simulation.tick(*args))
+            elif message == "wake":
+                conn.send(simulation.wake(args))
+    finally:
+        del registry, simulation
+        shm.close()
+
+
+
+class ParallelChunkedWorld(ChunkedWorld):
+    """
+    Chunked world whose sleeping asteroids are simulated every tick, on a pool of worker processes (one per horizontal
+    band of the level) or, without workers, in the main process.  The main process starts each tick with
+    begin_tick(), which copies the weapons to the shared registry and hands the workers their new rows, and collects
+    the hand-offs and hits with end_tick().  Residency updates ask the workers for the rows in the wanted chunks and
+    wake them like the sleeping rows of a ChunkedWorld.
+
+    Rows are only freed by the main process: woken rows once their band gave them up, rows of asteroids hit by a
+    weapon once their band dropped them on its next tick.  Asteroids put to sleep when the shared registry is full
+    sleep in the ChunkedWorld's own array instead, without collisions.
+    """
+
+    def __init__(self, level_width, level_height, chunk_width, chunk_height, active_radius=1, max_resident_chunks=16,
+                 workers=4, capacity=65536, max_weapons=64):
+        """
+        :param level_width: Width of the level.
+        :param level_height: Height of the level.
+        :param chunk_width: Width of a chunk.
+        :param chunk_height: Height of a chunk.
+        :param active_radius: Chunks within this many chunks of the camera's chunk are resident.
+        :param max_resident_chunks: Memory budget: the most chunks that can be resident at once.
+        :param workers: Number of worker processes (bands).  0 simulates the sleeping asteroids in the main process.
+        :param capacity: Rows of the shared registry (weapons and sleeping asteroids).
+        :param max_weapons: Most weapons tested against the sleeping asteroids per tick.
+        """
+        super().__init__(level_width, level_height, chunk_width, chunk_height, active_radius, max_resident_chunks)
+        self.band_count = max(workers, 1)
+        self.band_height = level_height / self.band_count
+
+        self._shm = shared_memory.SharedMemory(create=True, size=EntityRegistry.buffer_size(capacity))
+        self.registry = EntityRegistry(capacity, self._shm.buf)
+        self._weapon_rows = np.array([self.registry.create() for i in range(max_weapons)], dtype=np.intp)
+
+        # Rows not yet owned by a band: asteroids put to sleep and asteroids handed off since the last tick
+        self._pending = np.zeros(0, dtype=np.intp)
+        self._shared_count = 0
+        self._tick_weapons = []
+        self._tick = 0
+        self._replies = None
+
+        # Number of asteroids handed off between bands
+        self.handoff_count = 0
+
+        self._bands = []
+        self._connections = []
+        self._processes = []
+        geometry = (level_height, chunk_width, chunk_height, self.chunks_x, self.chunks_y)
+        if workers:
+            for band in range(workers):
+                parent_conn, child_conn = mp.Pipe()
+                p = mp.Process(target=_worker, args=(band, workers, self._shm.name, capacity, *geometry, child_conn),
+                               daemon=True)
+                p.start()
+                self._connections.append(parent_conn)
+                self._processes.append(p)
+        else:
+            self._bands.append(Band(0, 1, self.registry, *geometry))
+
+
+    def sleeping_count(self):
+        return super().sleeping_count() + self._shared_count
+
+
+    def sleeping_positions(self, tick):
+        positions = super().sleeping_positions(tick)
+        columns = self.registry.columns
+        first = len(self._weapon_rows)
+        rows = np.flatnonzero(columns["is_alive"][first:]) + first
+        if not len(rows):
+            return positions
+        return np.concatenate((positions, np.column_stack((columns["coord_x"][rows], columns["coord_y"][rows]))))
+
+
+    def begin_tick(self, weapons, tick):
+        self._tick = tick
+        weapons = [weapon for weapon in weapons if weapon.is_alive][:len(self._weapon_rows)]
+        weapon_rows = self._weapon_rows[:len(weapons)]
+        game_columns = get_registry().columns
+        game_rows = entity_rows(weapons)
+        for name in WEAPON_FIELDS:
+            self.registry.columns[name][weapon_rows] = game_columns[name][game_rows]
+        self._tick_weapons = weapons
+
+        # Hand the pending rows to the bands they are in
+        pending = self._pending
+        bands = band_of(self.registry.columns["coord_y"][pending], self.band_height, self.band_count)
+        self._pending = np.zeros(0, dtype=np.intp)
+        if self._bands:
+            self._replies = [band.tick(pending[bands == band.band], weapon_rows) for band in self._bands]
+        else:
+            for band, conn in enumerate(self._connections):
+                conn.send(("tick", (pending[bands == band], weapon_rows)))
+
+
+    def end_tick(self):
+        replies = self._replies if self._bands else [conn.recv() for conn in self._connections]
+        self._replies = None
+
+        for band_outgoing, dead, hits in replies:
+            self._pending = np.concatenate((self._pending, band_outgoing))
+            self.handoff_count += len(band_outgoing)
+            self._free(dead)
+
+        # Take the hits in order of impact, each weapon and asteroid at most once
+        weapon_rows, rock_rows, impacts = (np.concatenate(column) for column in zip(*(hits for o, d, hits in replies)))
+        order = np.lexsort((rock_rows, weapon_rows, impacts))
+        hits = []
+        rocks_used = set()
+        for weapon_row, rock_row in zip(weapon_rows[order].tolist(), rock_rows[order].tolist()):
+            weapon = self._tick_weapons[weapon_row]
+            if weapon.is_alive and rock_row not in rocks_used:
+                rocks_used.add(rock_row)
+                weapon.is_alive = False
+                hits.append((weapon, self._wake_shared(np.array([rock_row]), self._tick)[0]))
+
+                # The band drops the row on its next tick, then it is freed
+                self.registry.columns["is_alive"][rock_row] = False
+                self._shared_count -= 1
+        self._tick_weapons = []
+        return hits
+
+
+    def close(self):
+        for conn in self._connections:
+            conn.send(("stop", None))
+        for p in self._processes:
+            p.join()
+        self._bands = []
+        self.registry = None
+        self._shm.close()
+        self._shm.unlink()
+
+
+    def _wake_in(self, wanted_ids, tick):
+        rocks = super()._wake_in(wanted_ids, tick)
+
+        if self._bands:
+            rows = [band.wake(wanted_ids) for band in self._bands]
+        else:
+            for conn in self._connections:
+                conn.send(("wake", wanted_ids))
+            rows = [conn.recv() for conn in self._connections]
+
+        columns = self.registry.columns
+        pending = self._pending
+        waking = np.isin(chunk_ids(columns["coord_x"][pending], columns["coord_y"][pending], self.chunk_width,
+                                   self.chunk_height, self.chunks_x, self.chunks_y), wanted_ids)
+        self._pending = pending[~waking]
+        rows = np.concatenate(rows + [pending[waking]])
+
+        rocks.extend(self._wake_shared(rows, tick))
+        self._free(rows)
+        self._shared_count -= len(rows)
+        return rocks
+
+
+    def _sleep(self, rocks, tick):
+        """
+        Store asteroids as shared rows and release their entity rows.
+        """
+        shared_rocks = rocks[:self.registry.free_count()]
+        super()._sleep(rocks[len(shared_rocks):], tick)
+        if not shared_rocks:
+            return
+
+        rows = np.array([self.registry.create() for rock in shared_rocks], dtype=np.intp)
+        game_columns = get_registry().columns
+        game_rows = entity_rows(shared_rocks)
+        for name, column in self.registry.columns.items():
+            column[rows] = game_columns[name][game_rows]
+
+        # Asteroids held back by the level of detail scheduler catch up to the tick
+        lod_ticks = game_columns["lod_tick"][game_rows]
+        elapsed = np.where(lod_ticks == LOD_TICK_NONE, 0, tick - lod_ticks)
+        advance_movement(self.registry, rows, elapsed)
+        update_spin(self.registry, rows, elapsed)
+
+        for rock in shared_rocks:
+            rock.release()
+        self._pending = np.concatenate((self._pending, rows))
+        self._shared_count += len(rows)
+        self.sleep_count += len(rows)
+
+
+    def _wake_shared(self, rows, tick):
+        """
+        Create Asteroid objects from shared rows that are up to date with the tick.
+        """
+        columns = self.registry.columns
+        rocks = []
+        for x, y, speed_x, speed_y, heading, spin, size in zip(
+                *(columns[name][rows].tolist() for name in ("coord_x", "coord_y", "speed_x", "speed_y", "heading",
+                                                            "spin", "sprite_index"))):
+            a = Asteroid(x, y, speed_x, speed_y, heading)
+            a.spin = spin
+            a.select_size(size)
+            a.set_move_bounds(self.level_width, self.level_height, edge_bounce=False)
+            a.lod_tick = tick
+            rocks.append(a)
+        self.wake_count += len(rocks)
+        return rocks
+
+
+    def _free(self, rows):
+        self.registry.columns["is_alive"][rows] = False
+        for row in rows.tolist():
+            self.registry.release(row)
+
+
+def benchmark(asteroid_count, workers, ticks, level_width, level_height, weapon_count=64, seed=0):
+    """
+    Compare simulating the sleeping asteroids in the main process with simulating them on worker processes.
+    :return: (single process ms per tick, parallel ms per tick)
+    """
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    import asteroids
+    from spaceobjects.Spaceobjects import Plasma_weapon
+
+    asteroids.init_game()
+    rng = random.Random(seed)
+    weapons = [Plasma_weapon(0, 0) for i in range(weapon_count)]
+    for weapon in weapons:
+        weapon.is_alive = True
+
+    results = []
+    for worker_count in (0, workers):
+        world = ParallelChunkedWorld(level_width, level_height, asteroids.SCREEN_WIDTH, asteroids.SCREEN_HEIGHT,
+                                     workers=worker_count, capacity=asteroid_count + weapon_count,
+                                     max_weapons=weapon_count)
+        try:
+            rocks = []
+            for i in range(asteroid_count):
+                a = Asteroid(rng.randint(0, level_width), rng.randint(0, level_height), rng.randint(-5, 5),
+                             rng.randint(-5, 5))
+                a.set_move_bounds(level_width, level_height, edge_bounce=False)
+                rocks.append(a)
+            world._sleep(rocks, 0)
+            del rocks
+
+            t0 = time.perf_counter()
+            for tick in range(ticks):
+                for weapon in weapons:
+                    weapon.coord_x = rng.uniform(0, level_width)
+                    weapon.coord_y = rng.uniform(0, level_height)
+                world.begin_tick(weapons, tick + 1)
+                world.end_tick()
+            results.append((time.perf_counter() - t0) * 1000 / ticks)
+        finally:
+            world.close()
+    return tuple(results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the multicore chunked world.")
+    parser.add_argument("--asteroids", type=int, default=50000)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--ticks", type=int, default=200)
+    parser.add_argument("--level-width", type=int, default=100 * 800)
+    parser.add_argument("--level-height", type=int, default=100 * 600)
+    args = parser.parse_args()
+
+    serial_ms, parallel_ms = benchmark(args.asteroids, args.workers, args.ticks, args.level_width, args.level_height)
+    print("{} asteroids, {} workers: single process {:.2f} ms/tick, parallel {:.2f} ms/tick ({:.2f}x)".format(
+        args.asteroids, args.workers, serial_ms, parallel_ms, serial_ms / parallel_ms))
@@ -0,0 +1,116 @@
+# Particle system
+#
+# Debris particles kept in fixed size NumPy arrays.  Particles are spawned, moved, aged and drawn in bulk; there are
+# no per-particle Python objects.
+
+import math
+import numpy as np
+import pygame as pg
+
+
+class ParticleSystem:
+    """
+    Fixed capacity particle store used as a ring buffer.  When full, new particles replace the oldest ones, so memory
+    use never grows past the arrays allocated at creation.
+    """
+
+    def __init__(self, capacity=20000, seed=None):
+        """
+        :param capacity: Maximum number of live particles.
+        :param seed: Random seed for particle directions, speeds and lifetimes.
+        """
+        self.capacity = capacity
+        self.position = np.zeros((capacity, 2), dtype=np.float32)
+        self.velocity = np.zeros((capacity, 2), dtype=np.float32)
+        self.life = np.zeros(capacity, dtype=np.int32)          # Ticks left to live (0 = dead)
+        self.max_life = np.ones(capacity, dtype=np.int32)       # Ticks to live at spawn (used to fade out)
+        self.color = np.zeros((capacity, 3), dtype=np.uint8)
+
+        # Next slot to write in the ring buffer
+        self._next = 0
+        self._rng = np.random.default_rng(seed)
+
+
+    def spawn(self, x, y, count, speed=3.0, life=20, color=(255, 255, 255), base_velocity=(0, 0)):
+        """
+        Spawn a burst of particles flying out from a point.
+        :param x: World x coordinate of the burst.
+        :param y: World y coordinate of the burst.
+        :param count: Number of particles.
+        :param speed: Maximum particle speed (pixels per tick).
+        :param life: Maximum particle lifetime in ticks.
+        :param color: Base (r, g, b) color (the alpha of an (r, g, b, a) color is ignored).  Each particle gets a random
+        brightness of it.
+        :param base_velocity: (x, y) velocity added to every particle (e.g. the velocity of the exploding object).
+        :return: None
+        """
+        count = min(count, self.capacity)
+        if count <= 0:
+            return
+
+        index = (self._next + np.arange(count)) % self.capacity
+        self._next = (self._next + count) % self.capacity
+
+        rng = self._rng
+        angle = rng.uniform(0, 2 * math.pi, count)
+        particle_speed = rng.uniform(0.2, 1.0, count) * speed
+        self.position[index] = (x, y)
+        self.velocity[index, 0] = np.cos(angle) * particle_speed + base_velocity[0]
+        self.velocity[index, 1] = np.sin(angle) * particle_speed + base_velocity[1]
+
+        ticks = rng.integers(max(life // 2, 1), life + 1, count)
+        self.life[index] = ticks
+        self.max_life[index] = ticks
+
+        brightness = rng.uniform(0.6, 1.0, (count, 1))
+        self.color[index] = np.asarray(color, dtype=np.float32)[:3] * brightness
+
+
+    def update(self):
+        """
+        Move and age every particle by one tick.
+        :return: None
+        """
+        # Dead particles are moved too; it's cheaper than selecting the live ones and they are never drawn
+        np.add(self.position, self.velocity, out=self.position)
+        np.subtract(self.life, 1, out=self.life)
+        np.maximum(self.life, 0, out=self.life)
+
+
+    @property
+    def live_count(self):
+        return int(np.count_nonzero(self.life))
+
+
+    def render(self, surface, camera=None):
+        """
+        Draw the live particles as single pixels, fading out with age, with one pixel array write.
+        :param surface: Surface on which to draw (must be 24 or 32 bit).
+        :param camera: Viewport.Camera used to translate world coordinates (None for no translation).
+        :return: Number of particles drawn.
+        """
+        live = np.flatnonzero(self.life)
+        if live.size == 0:
+            return 0
+
+        x = self.position[live, 0]
+        y = self.position[live, 1]
+        if camera is not None:
+            x, y = camera.apply(x, y)
+        x = x.astype(np.int32)
+        y = y.astype(np.int32)
+
+        w, h = surface.get_size()
+        visible = (x >= 0) & (x < w) & (y >= 0) & (y < h)
+        live = live[visible]
+        if live.size == 0:
+            return 0
+
+        fade = (self.life[live] / self.max_life[live])[:, np.newaxis]
+        colors = (self.color[live] * fade).astype(np.uint8)
+
+        pixels = pg.surfarray.pixels3d(surface)
+        pixels[x[visible], y[visible]] = colors
+        del pixels                          # Unlock the surface
+
+        return int(live.size)
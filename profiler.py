@@ -0,0 +1,237 @@
+# Frame profiler
+#
+# Per-stage frame timing with an on-screen overlay and Chrome trace (Perfetto) export.
+
+import collections
+import json
+import time
+import pygame as pg
+
+
+class FrameProfiler:
+    """
+    Times the phases of each frame.  The game loop calls begin_frame() at the top of the frame, mark() at the end of
+    each phase and end_frame() once the frame is complete.  Recording into the history ring buffer is independent of
+    the overlay, so a trace export always has the most recent frames.  When the profiler is disabled those calls are
+    bound to a no-op so the cost to the frame is a single empty method call per phase.
+    """
+    OVERLAY_WIDTH = 300
+    OVERLAY_GRAPH_HEIGHT = 60
+    OVERLAY_LINE_HEIGHT = 14
+    OVERLAY_FONT_SIZE = 16
+
+    def __init__(self, history_secs=10, fps=30, enabled=True):
+        """
+        :param history_secs: Number of seconds of frame history to keep for the overlay and trace export.
+        :param fps: Expected frame rate.  Used to size the history buffer and draw the frame budget line.
+        :param enabled: True/False - Record frames.  False turns the profiler off: the hooks are no-ops and the
+        overlay and trace export have nothing to show.
+        """
+        self.fps = fps
+        self.frames = collections.deque(maxlen=int(history_secs * fps))
+
+        # Current frame's (stage name, timestamp) marks.  The first mark is the frame start.
+        self._marks = []
+
+        # Object counts reported by the game loop and cache counter sources registered by subsystems
+        self.counts = {}
+        self.counter_sources = {}
+
+        # Extra report sources (name -> function returning a list of text lines) shown below the overlay
+        self.report_sources = {}
+
+        self.is_overlay_visible = False
+        self._overlay_surface = None
+        self._overlay_font = None
+
+        self.enabled = False
+        self.set_enabled(enabled)
+
+
+    def set_enabled(self, enabled=True):
+        """
+        Turn recording on or off.  Disabling swaps the per-frame hooks for no-ops.
+        :param enabled: True/False
+        :return: None
+        """
+        self.enabled = enabled
+        if enabled:
+            self.begin_frame = self._begin_frame
+            self.mark = self._mark
+            self.end_frame = self._end_frame
+        else:
+            self.begin_frame = self._noop
+            self.mark = self._noop
+            self.end_frame = self._noop
+            self._marks = []
+
+
+    def toggle_overlay(self):
+        """
+        Show or hide the overlay.  Showing it turns recording on if the profiler is disabled; hiding it leaves
+        recording on, so a trace export still has the most recent frames.
+        :return: None
+        """
+        self.is_overlay_visible = not self.is_overlay_visible
+        if self.is_overlay_visible and not self.enabled:
+            self.set_enabled(True)
+
+
+    def add_counter_source(self, name, counter_function):
+        """
+        Register a cache whose hit rate is shown on the overlay.
+        :param name: Display name of the cache.
+        :param counter_function: Function returning a (hits, misses) tuple.
+        :return: None
+        """
+        self.counter_sources[name] = counter_function
+
+
+    def add_report_source(self, name, report_function):
+        """
+        Register extra text lines (e.g. histograms) to show on the overlay.
+        :param name: Name of the report.
+        :param report_function: Function returning a list of strings.
+        :return: None
+        """
+        self.report_sources[name] = report_function
+
+
+    def _noop(self, *args, **kwargs):
+        pass
+
+
+    def _begin_frame(self):
+        self._marks = [("frame", time.perf_counter())]
+
+
+    def _mark(self, stage):
+        self._marks.append((stage, time.perf_counter()))
+
+
+    def _end_frame(self, **counts):
+        """
+        Close the current frame and store it in the history.
+        :param counts: Object counts to record with the frame (e.g. asteroids=10, weapons=2).
+        :return: None
+        """
+        if not self._marks:
+            return
+        self.frames.append((tuple(self._marks), counts))
+        self.counts = counts
+        self._marks = []
+
+
+    def stage_averages(self, frame_count=None):
+        """
+        Average time per stage over the most recent frames.
+        :param frame_count: Number of frames to average.  Defaults to one second of frames.
+        :return: Ordered dict of stage name to average milliseconds.
+        """
+        if frame_count is None:
+            frame_count = self.fps
+
+        totals = collections.OrderedDict()
+        frames = list(self.frames)[-frame_count:]
+        for marks, counts in frames:
+            for (stage_name, t_end), (_, t_start) in zip(marks[1:], marks):
+                totals[stage_name] = totals.get(stage_name, 0) + (t_end - t_start)
+
+        n = max(len(frames), 1)
+        return collections.OrderedDict((k, v * 1000 / n) for k, v in totals.items())
+
+
+    def frame_times_ms(self):
+        """
+        :return: List of total frame times in milliseconds, oldest first.
+        """
+        return [(marks[-1][1] - marks[0][1]) * 1000 for marks, counts in self.frames]
+
+
+    def cache_hit_rates(self):
+        """
+        :return: Dict of cache name to hit rate (0.0 - 1.0) or None if the cache has not been used.
+        """
+        rates = {}
+        for name, counter_function in self.counter_sources.items():
+            hits, misses = counter_function()
+            total = hits + misses
+            rates[name] = hits / total if total else None
+        return rates
+
+
+    def render_overlay(self, surface, pos=(5, 35)):
+        """
+        Draw the overlay (frame time graph, stage times, object counts and cache hit rates).
+        :param surface: Surface on which to draw the overlay.
+        :param pos: Upper left coordinate of the overlay.
+        :return: None
+        """
+        if not self.is_overlay_visible:
+            return
+
+        if self._overlay_font is None:
+            self._overlay_font = pg.font.Font(None, self.OVERLAY_FONT_SIZE)
+
+        lines = []
+        for stage_name, ms in self.stage_averages().items():
+            lines.append("{:<16}{:6.2f} ms".format(stage_name, ms))
+        lines.append(" ".join("{}={}".format(k, v) for k, v in self.counts.items()))
+        for name, rate in self.cache_hit_rates().items():
+            lines.append("{:<16}{}".format(name, "-" if rate is None else "{:5.1f}%".format(rate * 100)))
+        for name, report_function in self.report_sources.items():
+            lines.extend(report_function())
+
+        w = self.OVERLAY_WIDTH
+        h = self.OVERLAY_GRAPH_HEIGHT + 4 + len(lines) * self.OVERLAY_LINE_HEIGHT
+        if self._overlay_surface is None or self._overlay_surface.get_height() != h:
+            self._overlay_surface = pg.Surface((w, h))
+            self._overlay_surface.set_alpha(200)
+        overlay = self._overlay_surface
+        overlay.fill((1, 1, 1))
+
+        # Rolling frame time graph.  Bars are scaled so the frame budget sits at half the graph height.
+        graph_h = self.OVERLAY_GRAPH_HEIGHT
+        budget_ms = 1000 / self.fps
+        times = self.frame_times_ms()[-w:]
+        for i, ms in enumerate(times):
+            bar = min(int(ms / budget_ms * graph_h / 2), graph_h)
+            color = (0, 200, 0) if ms <= budget_ms else (255, 0, 0)
+            pg.draw.line(overlay, color, (w - len(times) + i, graph_h), (w - len(times) + i, graph_h - bar))
+        pg.draw.line(overlay, (255, 255, 0), (0, graph_h // 2), (w, graph_h // 2))
+
+        y = graph_h + 4
+        for line in lines:
+            overlay.blit(self._overlay_font.render(line, False, (255, 255, 255)), (2, y))
+            y += self.OVERLAY_LINE_HEIGHT
+
+        surface.blit(overlay, pos)
+
+
+    def export_trace(self, filename, seconds=None):
+        """
+        Write the recorded frames as a Chrome trace JSON file (loadable in chrome://tracing or Perfetto).
+        :param filename: Name of the file to write.
+        :param seconds: Number of seconds of history to export.  Defaults to all recorded history.
+        :return: Number of frames written.
+        """
+        frames = list(self.frames)
+        if seconds is not None:
+            frames = frames[-int(seconds * self.fps):]
+
+        events = []
+        for marks, counts in frames:
+            frame_start = marks[0][1]
+            frame_end = marks[-1][1]
+            events.append({"name": "frame", "cat": "frame", "ph": "X", "pid": 1, "tid": 1,
+                           "ts": frame_start * 1e6, "dur": (frame_end - frame_start) * 1e6})
+            for (stage_name, t_end), (_, t_start) in zip(marks[1:], marks):
+                events.append({"name": stage_name, "cat": "stage", "ph": "X", "pid": 1, "tid": 1,
+                               "ts": t_start * 1e6, "dur": (t_end - t_start) * 1e6})
+            if counts:
+                events.append({"name": "objects", "ph": "C", "pid": 1, "ts": frame_start * 1e6, "args": counts})
+
+        with open(filename, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+        return len(frames)
@@ -0,0 +1,111 @@
+import weakref
+
+
+class Animation:
+    """
+    Playback state of one object's animation.
+    """
+    __slots__ = ("sequence", "position", "frame_time", "next_frame_time", "repeat")
+
+    def __init__(self, sequence, frame_time, next_frame_time, repeat):
+        self.sequence = sequence
+        self.position = -1                  # Not showing a frame of the sequence yet
+        self.frame_time = frame_time
+        self.next_frame_time = next_frame_time
+        self.repeat = repeat
+
+
+class Animator:
+    """
+    Advances the animations of all animated space objects in one pass per tick from a simulation clock.  Animation
+    sequence tables are made once per class and shared by all of its objects.  Objects are held weakly, so objects
+    that are discarded while animating need not be stopped.
+    """
+
+    def __init__(self):
+        # Simulation time in seconds
+        self.time = 0
+
+        # Class -> {sequence name: list of sprite indexes}
+        self._sequence_tables = {}
+
+        # Object -> Animation
+        self._animations = weakref.WeakKeyDictionary()
+
+
+    def sequences(self, obj):
+        """
+        :param obj: Space object.
+        :return: The animation sequence table of the object's class.
+        """
+        table = self._sequence_tables.get(type(obj), None)
+        if table is None:
+            table = obj._create_animation_sequences(obj.sprite_list)
+            self._sequence_tables[type(obj)] = table
+        return table
+
+
+    def start(self, obj, sequence_name="", frame_time=0.1, repeat=True):
+        """
+        Start (or restart) an object's animation.  The first frame of the sequence is shown one frame time after
+        starting.
+        :param obj: Space object.
+        :param sequence_name: Name of the sequence in the class sequence table ("" for every sprite in order).
+        :param frame_time: Seconds each frame is shown.
+        :param repeat: True/False - Loop the sequence.  If False the animation completes after its last frame.
+        :return: None
+        """
+        if frame_time <= 0:
+            raise ValueError("Animation frame time must be positive.")
+
+        if sequence_name:
+            sequence = self.sequences(obj).get(sequence_name, None)
+            if sequence is None:
+                raise KeyError("Animation sequence name not found.")
+        else:
+            sequence = range(len(obj.sprite_list))
+
+        self._animations[obj] = Animation(sequence, frame_time, self.time + frame_time, repeat)
+        obj.is_animating = True
+        obj.animation_complete = False
+
+
+    def stop(self, obj):
+        self._animations.pop(obj, None)
+        obj.is_animating = False
+
+
+    def __len__(self):
+        return len(self._animations)
+
+
+    def advance(self, seconds):
+        """
+        Advance the simulation clock and move every animation to the frame it should be showing.
+        :param seconds: Simulation time since the last call.
+        :return: None
+        """
+        self.time += seconds
+        now = self.time
+
+        for obj, animation in list(self._animations.items()):
+            while now >= animation.next_frame_time:
+                animation.next_frame_time += animation.frame_time
+                animation.position += 1
+
+                if animation.position >= len(animation.sequence):
+                    if not animation.repeat:
+                        del self._animations[obj]
+                        obj.is_animating = False
+                        obj.animation_complete = True
+                        obj._animation_finished()
+                        break
+                    animation.position = 0
+
+                obj.switch_sprite(animation.sequence[animation.position], True)
+
+                # Objects can end their own animation from the frame hook
+                obj._animation_frame()
+                if not obj.is_animating:
+                    self._animations.pop(obj, None)
+                    break
@@ -0,0 +1,148 @@
+import pygame as pg
+
+
+class SpriteAtlas:
+    """
+    Packs sprites and their pre-rotated variants into a few large surfaces (pages).  Each packed image is available
+    as a subsurface of its page and as a (page, rect) region so many sprites can be drawn with one Surface.blits call.
+    """
+    PAGE_SIZE = 2048
+    PADDING = 1
+
+    def __init__(self, rotation_steps=120, colorkey=(0, 0, 0)):
+        """
+        :param rotation_steps: Number of pre-rotated variants made for each rotatable sprite.
+        :param colorkey: Transparent color of the atlas pages.
+        """
+        self.rotation_steps = rotation_steps
+        self.colorkey = colorkey
+
+        self.pages = []
+        self._sources = []          # (key, surface, is_rotatable)
+        self._images = {}           # (key, rotation step) -> subsurface
+        self._regions = {}          # subsurface -> (page, rect)
+        self._master_keys = {}      # unrotated subsurface -> (key, is_rotatable)
+
+        # Rotation lookups served from the atlas and those that had to fall back to pygame.transform.rotate
+        self.hits = 0
+        self.misses = 0
+
+
+    def add(self, key, surface, is_rotatable=True):
+        """
+        Add a source image.  Must be called before build().
+        :param key: Hashable key identifying the image.
+        :param surface: Source image.
+        :param is_rotatable: True/False - Pack pre-rotated variants of the image.
+        :return: None
+        """
+        self._sources.append((key, surface, is_rotatable))
+
+
+    def build(self):
+        """
+        Rotate and pack all source images into the atlas pages.
+        :return: Number of pages.
+        """
+        images = []
+        for key, surface, is_rotatable in self._sources:
+            steps = self.rotation_steps if is_rotatable else 1
+            for step in range(steps):
+                image = surface if step == 0 else pg.transform.rotate(surface, step * 360 / steps)
+                images.append(((key, step), image))
+
+        # Shelf packing, tallest images first
+        images.sort(key=lambda entry: entry[1].get_height(), reverse=True)
+        placements = []
+        page_heights = [0]
+        x = y = shelf_height = 0
+        for entry, image in images:
+            w, h = image.get_size()
+            if x + w > self.PAGE_SIZE:
+                x = 0
+                y += shelf_height + self.PADDING
+                shelf_height = 0
+            if y + h > self.PAGE_SIZE:
+                page_heights.append(0)
+                x = y = shelf_height = 0
+
+            placements.append((entry, image, len(page_heights) - 1, pg.Rect(x, y, w, h)))
+            page_heights[-1] = max(page_heights[-1], y + h)
+            x += w + self.PADDING
+            shelf_height = max(shelf_height, h)
+
+        # Pages are only as tall as the packed images
+        self.pages = []
+        for height in page_heights:
+            page = pg.Surface((self.PAGE_SIZE, max(height, 1)))
+            page.fill(self.colorkey)
+            self.pages.append(page)
+
+        for entry, image, page_index, rect in placements:
+            self.pages[page_index].blit(image, rect)
+
+        # Convert to the display format when there is a display for faster blits
+        if pg.display.get_surface() is not None:
+            self.pages = [page.convert() for page in self.pages]
+        for page in self.pages:
+            page.set_colorkey(self.colorkey)
+
+        for (key, step), image, page_index, rect in placements:
+            page = self.pages[page_index]
+            subsurface = page.subsurface(rect)
+            subsurface.set_colorkey(self.colorkey)
+            self._images[(key, step)] = subsurface
+            self._regions[subsurface] = (page, rect)
+
+        for key, surface, is_rotatable in self._sources:
+            self._master_keys[self._images[(key, 0)]] = (key, is_rotatable)
+
+        return len(self.pages)
+
+
+    def master(self, key):
+        """
+        :param key: Key of a source image.
+        :return: The unrotated image as a subsurface of the atlas.
+        """
+        return self._images[(key, 0)]
+
+
+    def rotated(self, master, heading):
+        """
+        Find the pre-rotated variant of an atlas image closest to a heading.
+        :param master: Unrotated atlas image (as returned by master()).
+        :param heading: Heading in degrees ('+' is counter-clockwise).
+        :return: Rotated image or None if the image is not a rotatable atlas image.
+        """
+        key, is_rotatable = self._master_keys.get(master, (None, False))
+        if not is_rotatable:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return self._images[(key, self.rotation_step(heading))]
+
+
+    def rotation_step(self, heading):
+        """
+        :param heading: Heading in degrees.
+        :return: Index of the pre-rotated variant closest to the heading.
+        """
+        return int(round(heading * self.rotation_steps / 360)) % self.rotation_steps
+
+
+    def is_rotatable(self, master):
+        """
+        :param master: Unrotated atlas image.
+        :return: True if the atlas holds pre-rotated variants of the image.
+        """
+        return self._master_keys.get(master, (None, False))[1]
+
+
+    def region(self, sprite):
+        """
+        :param sprite: Atlas image.
+        :return: (page, rect) of the image or None if the sprite is not in the atlas.
+        """
+        return self._regions.get(sprite, None)
@@ -0,0 +1,412 @@
+import heapq
+
+import numpy as np
+
+
+# Components and their fields: (field name, dtype, default).  Field names are the attribute names of the space object
+# facades that store their state in the component arrays.
+COMPONENTS = {
+    "transform": (("coord_x", np.float64, 0), ("coord_y", np.float64, 0), ("heading", np.float64, 0),
+                  ("bounds_leftx", np.float64, 0), ("bounds_rightx", np.float64, 0),
+                  ("bounds_topy", np.float64, 0), ("bounds_bottomy", np.float64, 0),
+                  ("bounds_edgebounce", np.bool_, False)),
+    "velocity": (("speed_x", np.float64, 0), ("speed_y", np.float64, 0)),
+    "spin": (("spin", np.float64, 0),),
+    "sprite": (("sprite_index", np.int64, 0), ("sprite_width", np.int64, 0), ("sprite_height", np.int64, 0),
+               ("is_sprite_stale", np.bool_, False), ("is_visible", np.bool_, False)),
+    "collider": (("is_solid", np.bool_, False), ("shrinkhitbox_xy", np.int64, 0)),
+    "lifetime": (("is_alive", np.bool_, False), ("life_timeout", np.float64, np.inf), ("lod_tick", np.int64, -1)),
+    "animation": (("is_animating", np.bool_, False), ("animation_complete", np.bool_, False)),
+}
+
+# Value of the lod_tick field of objects not yet scheduled by the level of detail scheduler
+LOD_TICK_NONE = -1
+
+
+class EntityRegistry:
+    """
+    Dense component arrays with one row per entity.  Each field of each component is a NumPy array in 'columns',
+    indexed by entity row.  Rows of released entities are reused, lowest first, so the used rows stay packed at the
+    start of the arrays.  Systems work on index arrays of rows, so a set of objects is updated in one batch.
+
+    The arrays can be placed in a given buffer, such as multiprocessing.shared_memory, so that other processes can
+    run the systems on the same rows.
+    """
+
+    def __init__(self, capacity=256, buffer=None, clear=True):
+        """
+        :param capacity: Initial number of rows.  The arrays double in size when full.
+        :param buffer: Buffer of at least buffer_size(capacity) bytes to place the arrays in, or None to allocate
+        them.  A registry in a buffer can't grow.
+        :param clear: True/False - Set the arrays in the buffer to the default values.  False attaches to arrays
+        that another registry in the same buffer already holds.
+        """
+        self.capacity = capacity
+        self.columns = {}
+        self._defaults = {}
+        self.is_fixed = buffer is not None
+        offset = 0
+        for fields in COMPONENTS.values():
+            for name, dtype, default in fields:
+                if buffer is None:
+                    self.columns[name] = np.full(capacity, default, dtype=dtype)
+                else:
+                    column = np.ndarray(capacity, dtype=dtype, buffer=buffer, offset=offset)
+                    if clear:
+                        column[:] = default
+                    self.columns[name] = column
+                    offset += _aligned(column.nbytes)
+                self._defaults[name] = default
+
+        # Number of live entities, rows used so far and released rows waiting for reuse
+        self.count = 0
+        self._used = 0
+        self._free = []
+
+
+    def create(self):
+        """
+        Create an entity with every field at its default value.
+        :return: Row of the entity.
+        """
+        if self._free:
+            row = heapq.heappop(self._free)
+            for name, column in self.columns.items():
+                column[row] = self._defaults[name]
+        else:
+            if self._used == self.capacity:
+                if self.is_fixed:
+                    raise MemoryError("Entity registry in a buffer is full ({} rows)".format(self.capacity))
+                self._grow()
+            row = self._used
+            self._used += 1
+
+        self.count += 1
+        return row
+
+
+    def release(self, row):
+        """
+        Release an entity's row for reuse.
+        :param row: Row of the entity.
+        :return: None
+        """
+        heapq.heappush(self._free, row)
+        self.count -= 1
+
+
+    def free_count(self):
+        """
+        :return: Number of entities that can still be created without growing the arrays.
+        """
+        return self.capacity - self.count
+
+
+    @staticmethod
+    def buffer_size(capacity):
+        """
+        :return: Bytes needed for a registry of a capacity in a buffer.
+        """
+        return sum(_aligned(capacity * np.dtype(dtype).itemsize)
+                   for fields in COMPONENTS.values() for name, dtype, default in fields)
+
+
+    def _grow(self):
+        capacity = self.capacity * 2
+        for name, column in self.columns.items():
+            grown = np.full(capacity, self._defaults[name], dtype=column.dtype)
+            grown[:self.capacity] = column
+            self.columns[name] = grown
+        self.capacity = capacity
+
+
+
+def _aligned(size):
+    """
+    :return: Size rounded up so the array after it in a buffer is 8 byte aligned.
+    """
+    return -(-size // 8) * 8
+
+
+
+class ComponentField:
+    """
+    Attribute descriptor for facade objects.  Reads and writes the field in the facade's row of the component arrays
+    (the facade has '_columns', the registry's column dict, and '_row').
+    """
+    __slots__ = ("name",)
+
+    def __init__(self, name):
+        self.name = name
+
+
+    def __get__(self, obj, owner=None):
+        if obj is None:
+            return self
+        return obj._columns[self.name].item(obj._row)
+
+
+    def __set__(self, obj, value):
+        obj._columns[self.name][obj._row] = value
+
+
+
+class OptionalComponentField(ComponentField):
+    """
+    Component field that is None when it holds a marker value.
+    """
+    __slots__ = ("none_value",)
+
+    def __init__(self, name, none_value):
+        super().__init__(name)
+        self.none_value = none_value
+
+
+    def __get__(self, obj, owner=None):
+        if obj is None:
+            return self
+        value = obj._columns[self.name].item(obj._row)
+        return None if value == self.none_value else value
+
+
+    def __set__(self, obj, value):
+        obj._columns[self.name][obj._row] = self.none_value if value is None else value
+
+
+def advance_wrapped(coord, speed, low, high, ticks):
+    """
+    Array version of Spaceobject._advance_wrapped(): coordinates after a number of ticks of movement between wrapping
+    bounds, where moving past one edge places the object exactly on the opposite edge.
+    :param coord: Array of starting coordinates.
+    :param speed: Array of speeds along the axis.
+    :param low: Low bound (scalar or array).
+    :param high: High bound (scalar or array).
+    :param ticks: Array (or scalar) of tick counts.
+    :return: Array of new coordinates.
+    """
+    coord = np.array(coord, dtype=float)
+    ticks = np.broadcast_to(ticks, coord.shape).astype(np.int64)
+
+    # Objects starting outside the bounds are placed on an edge by their first tick
+    outside = ((coord < low) | (coord > high)) & (ticks > 0)
+    if outside.any():
+        stepped = coord + speed
+        stepped = np.where(stepped > high, low, np.where(stepped < low, high, stepped))
+        coord = np.where(outside, stepped, coord)
+        ticks = ticks - outside
+
+    moving = speed != 0
+    safe_speed = np.where(moving, speed, 1)
+    positive = speed > 0
+
+    # Ticks until first wrap, then ticks per full trip across the bounds
+    to_wrap = np.where(positive, np.floor((high - coord) / safe_speed), np.floor((coord - low) / -safe_speed)) + 1
+    to_wrap = np.maximum(to_wrap, 1)
+    restart = np.where(positive, low, high)
+    period = np.floor((high - low) / np.abs(safe_speed)) + 1
+
+    wrapped = restart + np.mod(ticks - to_wrap, period) * speed
+    result = np.where(ticks < to_wrap, coord + ticks * speed, wrapped)
+    return np.where(moving & (ticks > 0), result, coord)
+
+
+# Position, speed and bound fields of each axis
+_AXES = (("coord_x", "speed_x", "bounds_leftx", "bounds_rightx"),
+         ("coord_y", "speed_y", "bounds_topy", "bounds_bottomy"))
+
+
+def update_movement(registry, rows):
+    """
+    Movement system: move entities one tick, wrapping or bouncing at their bounds like
+    Spaceobject._update_position().
+    :param registry: EntityRegistry
+    :param rows: Index array of entity rows.
+    :return: None
+    """
+    columns = registry.columns
+    bounce = columns["bounds_edgebounce"][rows]
+    for coord_name, speed_name, low_name, high_name in _AXES:
+        speed = columns[speed_name][rows]
+        coord = columns[coord_name][rows] + speed
+        low = columns[low_name][rows]
+        high = columns[high_name][rows]
+
+        over = coord > high
+        under = ~over & (coord < low)
+        flipped = (over | under) & bounce
+        if flipped.any():
+            columns[speed_name][rows[flipped]] = -speed[flipped]
+
+        coord = np.where(over, np.where(bounce, high, low), np.where(under, np.where(bounce, low, high), coord))
+        columns[coord_name][rows] = coord
+
+
+def advance_movement(registry, rows, ticks):
+    """
+    Movement system for several ticks at once, like Spaceobject.advance().  Wrapping entities are advanced
+    analytically; bouncing entities are stepped.
+    :param registry: EntityRegistry
+    :param rows: Index array of entity rows.
+    :param ticks: Number of ticks (scalar or an array with one count per row).
+    :return: None
+    """
+    columns = registry.columns
+    ticks = np.broadcast_to(ticks, rows.shape)
+    moving = ticks > 0
+    rows = rows[moving]
+    ticks = ticks[moving]
+
+    # Bouncing changes speed at the edges, so step it
+    bounce = columns["bounds_edgebounce"][rows]
+    if bounce.any():
+        stepped = rows[bounce]
+        remaining = ticks[bounce]
+        while len(stepped):
+            update_movement(registry, stepped)
+            remaining = remaining - 1
+            stepped = stepped[remaining > 0]
+            remaining = remaining[remaining > 0]
+        rows = rows[~bounce]
+        ticks = ticks[~bounce]
+
+    for coord_name, speed_name, low_name, high_name in _AXES:
+        columns[coord_name][rows] = advance_wrapped(columns[coord_name][rows], columns[speed_name][rows],
+                                                    columns[low_name][rows], columns[high_name][rows], ticks)
+
+
+def update_spin(registry, rows, ticks=1):
+    """
+    Spin system: turn spinning entities by their spin for a number of ticks.  Their sprites are marked stale to be
+    rotated when next needed, as by Spaceobject.rotate(degrees, update_sprite=False).
+    :param registry: EntityRegistry
+    :param rows: Index array of entity rows.
+    :param ticks: Number of ticks (scalar or an array with one count per row).
+    :return: None
+    """
+    columns = registry.columns
+    spin = columns["spin"][rows]
+    ticks = np.broadcast_to(ticks, rows.shape)
+    turning = (spin != 0) & (ticks > 0)
+    rows = rows[turning]
+
+    heading = columns["heading"][rows] + spin[turning] * ticks[turning]
+    wrap = (heading > 360) | (heading < -360)
+    heading[wrap] = np.fmod(heading[wrap], 360)
+    columns["heading"][rows] = heading
+    columns["is_sprite_stale"][rows] = True
+
+
+def update_lifetime(registry, rows, time):
+    """
+    Lifetime system: entities whose life has timed out die.
+    :param registry: EntityRegistry
+    :param rows: Index array of entity rows.
+    :param time: Current simulation time.
+    :return: Boolean array, True for the rows that died.
+    """
+    columns = registry.columns
+    expired = columns["is_alive"][rows] & (columns["life_timeout"][rows] <= time)
+    columns["is_alive"][rows[expired]] = False
+    return expired
+
+
+def _hitboxes(registry, rows):
+    """
+    :return: (x, y, half width, half height, collidable) arrays of the entities' hitboxes as used by
+    Spaceobject.is_collision().
+    """
+    columns = registry.columns
+    shrink = columns["shrinkhitbox_xy"][rows]
+    half_x = ((columns["sprite_width"][rows] - shrink) / 2).astype(np.int64)
+    half_y = ((columns["sprite_height"][rows] - shrink) / 2).astype(np.int64)
+    collidable = columns["is_solid"][rows] & columns["is_visible"][rows] & columns["is_alive"][rows]
+    return columns["coord_x"][rows], columns["coord_y"][rows], half_x, half_y, collidable
+
+
+def find_overlaps(registry, rows, other_rows):
+    """
+    Collision system: test every entity of one set against every entity of another with the hitbox test of
+    Spaceobject.is_collision().  Entities that are not solid, visible and alive never collide.
+    :param registry: EntityRegistry
+    :param rows: Index array of entity rows.
+    :param other_rows: Index array of the other entity rows.
+    :return: Boolean array of shape (len(rows), len(other_rows)), True where the hitboxes overlap.
+    """
+    x, y, half_x, half_y, collidable = _hitboxes(registry, rows)
+    other_x, other_y, other_half_x, other_half_y, other_collidable = _hitboxes(registry, other_rows)
+
+    overlap_x = ~(((x + half_x)[:, None] < (other_x - other_half_x)[None, :]) |
+                  ((x - half_x)[:, None] > (other_x + other_half_x)[None, :]))
+    overlap_y = ~(((y + half_y)[:, None] < (other_y - other_half_y)[None, :]) |
+                  ((y - half_y)[:, None] > (other_y + other_half_y)[None, :]))
+    return overlap_x & overlap_y & collidable[:, None] & other_collidable[None, :]
+
+
+def find_impacts(registry, rows, other_rows):
+    """
+    Continuous collision system: sweep the hitboxes of entities along their movement over the last tick against the
+    hitboxes of other entities, which may be moving too, and find the time of impact.  Unlike find_overlaps(), a fast
+    entity can't pass through a small one between ticks.  Entities are taken to have moved by their current speed
+    since the previous tick (movement wrapped or bounced at the bounds during the tick is not swept).
+    :param registry: EntityRegistry
+    :param rows: Index array of the (moving) entity rows.
+    :param other_rows: Index array of the other entity rows.
+    :return: Array of shape (len(rows), len(other_rows)): the fraction of the tick, from 0 to 1, at which the hitboxes
+    first touch, or inf where they don't touch during the tick.
+    """
+    columns = registry.columns
+    x, y, half_x, half_y, collidable = _hitboxes(registry, rows)
+    other_x, other_y, other_half_x, other_half_y, other_collidable = _hitboxes(registry, other_rows)
+
+    # Relative to the other entity, the entity moves along a segment that ends at its current offset.  They touch
+    # while that segment is inside a box with the two hitboxes' combined half sizes.
+    t_enter = np.full((len(rows), len(other_rows)), -np.inf)
+    t_exit = np.full((len(rows), len(other_rows)), np.inf)
+    for coord, speed, half, other_coord, other_speed, other_half in (
+            (x, columns["speed_x"][rows], half_x, other_x, columns["speed_x"][other_rows], other_half_x),
+            (y, columns["speed_y"][rows], half_y, other_y, columns["speed_y"][other_rows], other_half_y)):
+        end = coord[:, None] - other_coord[None, :]
+        move = speed[:, None] - other_speed[None, :]
+        start = end - move
+        reach = (half[:, None] + other_half[None, :]).astype(float)
+
+        # Times at which the segment crosses the two sides of the box along this axis.  Without movement along the
+        # axis, the segment is either inside the box for the whole tick or never.
+        moving = move != 0
+        safe_move = np.where(moving, move, 1)
+        t_low = (-reach - start) / safe_move
+        t_high = (reach - start) / safe_move
+        inside = np.abs(start) <= reach
+        t_enter = np.maximum(t_enter, np.where(moving, np.minimum(t_low, t_high), np.where(inside, -np.inf, np.inf)))
+        t_exit = np.minimum(t_exit, np.where(moving, np.maximum(t_low, t_high), np.where(inside, np.inf, -np.inf)))
+
+    hit = (t_enter <= t_exit) & (t_exit >= 0) & (t_enter <= 1) & collidable[:, None] & other_collidable[None, :]
+    return np.where(hit, np.maximum(t_enter, 0), np.inf)
+
+
+def find_distances(registry, rows, x, y):
+    """
+    :param registry: EntityRegistry
+    :param rows: Index array of entity rows.
+    :param x: X coordinate.
+    :param y: Y coordinate.
+    :return: Array of the distances of the entities from (x, y), as Spaceobject.distance_to().
+    """
+    columns = registry.columns
+    dx = x - columns["coord_x"][rows]
+    dy = y - columns["coord_y"][rows]
+    return np.sqrt(dx*dx + dy*dy)
+
+
+def find_in_view(registry, rows, camera, margin=0):
+    """
+    Culling system: test which entities are within a camera's view, as Camera.is_in_view().
+    :param registry: EntityRegistry
+    :param rows: Index array of entity rows.
+    :param camera: Viewport.Camera
+    :param margin: Distance outside the view that still counts as in view (scalar or one per row).
+    :return: Boolean array, True for the rows in view.
+    """
+    columns = registry.columns
+    return ((np.abs(columns["coord_x"][rows] - camera.x) <= camera.view_width // 2 + margin) &
+            (np.abs(columns["coord_y"][rows] - camera.y) <= camera.view_height // 2 + margin))
@@ -1,10 +1,15 @@
-import itertools
+import collections
 import math
+import numpy as np
 import pygame as pg
 import random
 import os
 import sys
-import time
+
+from spaceobjects.Atlas import SpriteAtlas
+from spaceobjects.Animator import Animator
+from spaceobjects.Ecs import EntityRegistry, ComponentField, OptionalComponentField, LOD_TICK_NONE, update_lifetime, \
+    update_movement, update_spin
 
 # DEBUG OPTIONS
 DEBUG_SHOW_HITBOX = False
@@ -14,36 +19,241 @@ colormap = {"white": (255, 255, 255), "black": (0, 0, 0), "red": (255, 0, 0), "b
             "yellow": pg.color.THECOLORS["yellow"], "green": pg.color.THECOLORS["green"], "orange": pg.color.THECOLORS["orange"]}
 
 
+# Render backends
+RENDER_BACKEND_SPRITE = "sprite"        # Bitmap sprites loaded from PNG files and rotated with pygame.transform
+RENDER_BACKEND_VECTOR = "vector"        # Vertex list shapes rotated in batches and drawn as polygons
+_render_backend = RENDER_BACKEND_SPRITE
+
+# Images loaded from disk, shared by every object that uses them
+_image_cache = {}
+
+# Sprite lists shared by every instance of a class
+_class_sprites = {}
+
+# Atlas of packed and pre-rotated sprites (None until built)
+_sprite_atlas = None
+
+# Advances the animations of all space objects
+_animator = Animator()
+
+# Component arrays holding the state of all space objects
+_registry = EntityRegistry()
+
+
+def set_render_backend(backend):
+    """
+    Select how space objects are drawn.  Must be called before objects are created.
+    :param backend: RENDER_BACKEND_SPRITE or RENDER_BACKEND_VECTOR
+    :return: None
+    """
+    global _render_backend, _sprite_atlas
+    if backend not in (RENDER_BACKEND_SPRITE, RENDER_BACKEND_VECTOR):
+        raise ValueError("Invalid render backend.")
+    _render_backend = backend
+
+    # Sprites made for the previous backend no longer apply
+    _class_sprites.clear()
+    _sprite_atlas = None
+
+
+def get_render_backend():
+    return _render_backend
+
+
+def get_animator():
+    """
+    :return: The Animator that plays space object animations and keeps the simulation clock (also used for weapon
+    life).  Its advance() must be called once per tick.
+    """
+    return _animator
+
+
+def get_registry():
+    """
+    :return: The EntityRegistry whose component arrays hold the state of all space objects.
+    """
+    return _registry
+
+
+def entity_rows(objects):
+    """
+    :param objects: Sequence of space objects.
+    :return: Index array of the objects' rows in the component arrays, in the same order.
+    """
+    return np.fromiter((obj._row for obj in objects), dtype=np.intp, count=len(objects))
+
+
+def update_sprites(objects, rows=None):
+    """
+    Sprite system: rotate the working sprites of the objects whose heading changed without their sprite being rotated.
+    :param objects: Sequence of space objects.
+    :param rows: Index array of the objects' rows (None to look them up).
+    :return: None
+    """
+    if rows is None:
+        rows = entity_rows(objects)
+    for i in np.flatnonzero(_registry.columns["is_sprite_stale"][rows]).tolist():
+        objects[i].rotate(0)
+
+
+def update_batch(objects):
+    """
+    Update asteroids and weapons for one tick with the batched systems.  The result is the same as calling update()
+    on each object, except that sprites are only marked stale; update_sprites() rotates those that are needed (render()
+    also catches up a stale sprite).  Ships must still be updated one by one.
+    :param objects: Sequence of asteroids and weapons.
+    :return: None
+    """
+    rows = entity_rows(objects)
+    update_movement(_registry, rows)
+    update_spin(_registry, rows)
+    update_lifetime(_registry, rows, _animator.time)
+
+
+def build_sprite_atlas(classes, rotation_steps=120):
+    """
+    Pack the sprites of the given classes, with pre-rotated variants, into a sprite atlas.  After this, objects of
+    these classes draw from the atlas instead of rotating their sprites.
+    :param classes: Space object classes to include.
+    :param rotation_steps: Number of pre-rotated variants per sprite.
+    :return: SpriteAtlas
+    """
+    global _sprite_atlas
+
+    atlas = SpriteAtlas(rotation_steps, colormap["black"])
+    for cls in classes:
+        # Creating an object creates and caches the class sprites
+        obj = cls(0, 0)
+        for i, sp in enumerate(_class_sprites[cls]):
+            atlas.add((cls.__name__, i), sp, not obj.is_vector_rendered)
+    atlas.build()
+
+    # Replace the class sprites with their atlas images
+    for cls in classes:
+        sprite_list = _class_sprites[cls]
+        sprite_list[:] = [atlas.master((cls.__name__, i)) for i in range(len(sprite_list))]
+
+    _sprite_atlas = atlas
+    return atlas
+
+
+def sprite_atlas_region(sprite):
+    """
+    :param sprite: Sprite surface.
+    :return: (atlas page, rect) of the sprite or None if it is not an atlas image.
+    """
+    if _sprite_atlas is None:
+        return None
+    return _sprite_atlas.region(sprite)
+
+
+def jagged_polygon(radius, vertex_count, roughness=0.3, seed=0):
+    """
+    Create a rock-like polygon centered on (0, 0).
+    :param radius: Average radius of the polygon.
+    :param vertex_count: Number of vertices.
+    :param roughness: Fraction of the radius by which vertices are randomly moved in or out.
+    :param seed: Random seed so the same shape is produced each time.
+    :return: List of (x, y) vertices.
+    """
+    rnd = random.Random(seed)
+    vertices = []
+    for i in range(vertex_count):
+        angle = 2 * math.pi * i / vertex_count
+        r = radius * (1 - roughness * rnd.random())
+        vertices.append((r * math.cos(angle), r * math.sin(angle)))
+    return vertices
+
+
+def load_image(filename):
+    """
+    Load an image from the game directory.  Each file is only read from disk once; later calls return the same
+    surface, so callers must not draw on the returned surface.
+    :param filename: Name of the image file.
+    :return: pygame.Surface
+    """
+    image = _image_cache.get(filename, None)
+    if image is None:
+        image = pg.image.load(os.path.join(sys.path[0], filename))
+        _image_cache[filename] = image
+    return image
+
+
 class Spaceobject:
     """
-    Base class for space objects.
+    Base class for space objects.  Objects are facades over a row of the component arrays: the state that the
+    batched systems work on is stored there rather than in the object.
     """
     DEFAULTSIZE_WIDTH = 28
     DEFAULTSIZE_HEIGHT = 28
 
+    # True if the vector backend draws this class in batches with the VectorRenderer rather than as sprites
+    VECTOR_BATCHED = False
+
+    # State stored in the component arrays
+    coord_x = ComponentField("coord_x")
+    coord_y = ComponentField("coord_y")
+    heading = ComponentField("heading")
+    speed_x = ComponentField("speed_x")
+    speed_y = ComponentField("speed_y")
+    bounds_leftx = ComponentField("bounds_leftx")
+    bounds_rightx = ComponentField("bounds_rightx")
+    bounds_topy = ComponentField("bounds_topy")
+    bounds_bottomy = ComponentField("bounds_bottomy")
+    bounds_edgebounce = ComponentField("bounds_edgebounce")
+    sprite_index = ComponentField("sprite_index")
+    sprite_width = ComponentField("sprite_width")
+    sprite_height = ComponentField("sprite_height")
+    is_sprite_stale = ComponentField("is_sprite_stale")
+    is_visible = ComponentField("is_visible")
+    is_solid = ComponentField("is_solid")
+    shrinkhitbox_xy = ComponentField("shrinkhitbox_xy")
+    is_alive = ComponentField("is_alive")
+    is_animating = ComponentField("is_animating")
+    animation_complete = ComponentField("animation_complete")
+
 
     def __init__(self, coord_x, coord_y, speed_x=0, speed_y=0, heading=0):
+        # Row of the component arrays holding this object's state
+        self._registry = _registry
+        self._columns = _registry.columns
+        self._row = _registry.create()
+
         self.coord_x = coord_x
         self.coord_y = coord_y
         self.speed_x = speed_x
         self.speed_y = speed_y
         self.heading = heading
 
-        # Make the sprites for the various images of this object
-        self.sprite_list = self._create_sprites()
+        # True when the heading has changed without the working sprite being rotated to match
+        self.is_sprite_stale = False
 
-        # Define structures used for animation and animation sequences
+        # Make the sprites for the various images of this object (shared by all objects of the same class)
+        self.sprite_list = _class_sprites.get(type(self), None)
+        if self.sprite_list is None:
+            if _render_backend == RENDER_BACKEND_VECTOR and self.vector_shapes():
+                self.sprite_list = self._create_vector_sprites()
+            else:
+                self.sprite_list = self._create_sprites()
+            _class_sprites[type(self)] = self.sprite_list
+
+        # Objects drawn by the VectorRenderer only need their heading updated when rotating
+        self.is_vector_rendered = _render_backend == RENDER_BACKEND_VECTOR and self.VECTOR_BATCHED
+        self.sprite_index = 0
+
+        # Animation state.  Animations are played by the animator from the class sequence table.
         self.is_animating = False
         self.animation_complete = False
-        self.animate_frame_display_time_secs = 0
-        self.animate_timestamp = 0
-        self.animation_list_index_iter = None
-        self.animation_sequences_dict = self._create_animation_sequences(self.sprite_list)
+        self.animation_sequences_dict = _animator.sequences(self)
+        self._animation_settings = None
 
         # Create variables to hold the master (untransformed) and working sprite (possibly transformed)
         self.sprite_master = None
         self.sprite = None
 
+        # Master sprite -> (rotation bucket, rotated sprite) of the last rotation of each sprite in the sprite list
+        self._rotated_sprites = {}
+
         # Select initial sprite and assign it to self.sprite_master and self.sprite
         self.switch_sprite(0, True)
         (a, b, self.sprite_width, self.sprite_height) = self.sprite.get_rect()
@@ -68,6 +278,27 @@ class Spaceobject:
         self.set_properties()
 
 
+    def __del__(self):
+        if self._registry is not None:
+            self._registry.release(self._row)
+
+
+    def release(self):
+        """
+        Release the object's row of the component arrays for reuse, when it dies or leaves the world.  The object
+        keeps its last state in arrays of its own, so references still held read valid values, but it must no longer
+        be passed to the batch systems.
+        :return: None
+        """
+        if self._registry is None:
+            return
+        row = self._row
+        self._columns = {name: column[row:row + 1].copy() for name, column in self._columns.items()}
+        self._row = 0
+        self._registry.release(row)
+        self._registry = None
+
+
     def set_move_bounds(self, width=10000, height=10000, leftx=0, topy=0, edge_bounce=False):
         """
         Set world boundaries for object.
@@ -120,9 +351,36 @@ class Spaceobject:
         return sprite_list
 
 
+    def vector_shapes(self):
+        """
+        Subclasses override this function to define the shapes used by the vector render backend.
+        :return: List with an entry for each sprite index.  Each entry is a list of (color, vertices, line_width)
+        polygons, with vertices centered on (0, 0) at heading 0.  None if the object has no vector shapes.
+        """
+        return None
+
+
+    def _create_vector_sprites(self):
+        """
+        Draw the vector shapes onto surfaces.  Used for sprite dimensions and for objects not drawn in batches.
+        :return: A list containing pygame.Surface objects for each sprite index.
+        """
+        sprite_list = []
+        for polygons in self.vector_shapes():
+            half = max(max(abs(x), abs(y)) for color, vertices, line_width in polygons for x, y in vertices)
+            half = int(math.ceil(half))
+            sp = pg.Surface((2*half + 1, 2*half + 1))
+            for color, vertices, line_width in polygons:
+                pg.draw.polygon(sp, color, [(x + half, y + half) for x, y in vertices], line_width)
+            sp.set_colorkey(colormap["black"])
+            sprite_list.append(sp)
+
+        return sprite_list
+
+
     def _create_animation_sequences(self, sprite_list):
         """
-        Subclasses override this function to create the animation sequences for the subclass.
+        Subclasses override this function to create the animation sequences for the subclass.  Called once per class.
         :param sprite_list: List of sprites defined for this object.
         :return:
         """
@@ -135,16 +393,20 @@ class Spaceobject:
 
     def switch_sprite(self, sprite_index, apply_heading_rotation=True):
         """
-        Switch to a new sprite in the sprite list.
+        Switch to a new sprite in the sprite list.  Sprites are shared and never copied; if the sprite and rotation
+        are unchanged the current working sprite is kept.
         :param sprite_index: Index of the sprite to which to switch.
         :param apply_heading_rotation: True/False - Rotate the working sprite to object's current heading.
         :return: None
         """
         try:
             self.sprite_master = self.sprite_list[sprite_index]
-            self.sprite = self.sprite_master.copy()
-            if apply_heading_rotation:
+            self.sprite_index = sprite_index
+            if apply_heading_rotation and not self.is_vector_rendered:
                 self.rotate(0)
+                return
+
+            self.sprite = self.sprite_master
 
             # Update sprite dimensions
             (a, b, self.sprite_width, self.sprite_height) = self.sprite.get_rect()
@@ -153,22 +415,46 @@ class Spaceobject:
             pass
 
 
-    def rotate(self, degrees):
+    def rotate(self, degrees, update_sprite=True):
         """
         Rotate the object.
         :param degrees: Number of degrees to rotate.  '+' is counter-clockwise; '-' is clockwise
+        :param update_sprite: True/False - Rotate the working sprite.  If False, only the heading is changed and the
+        sprite is rotated the next time it is needed.
         :return: None
         """
         # Update heading
         self.heading += degrees
-        if self.heading > 360:
-            self.heading -= 360
-        elif self.heading < -360:
-            self.heading += 360
+        if self.heading > 360 or self.heading < -360:
+            self.heading = math.fmod(self.heading, 360)
 
-        # Rotate a copy of the original unrotated sprite to reduce image flaws
+        if not update_sprite:
+            self.is_sprite_stale = True
+            return
+        self.is_sprite_stale = False
+
+        # Batched vector objects are rotated when drawn
+        if self.is_vector_rendered:
+            return
+
+        # Reuse the last rotation of this sprite if it was for the same rotation bucket (the atlas rotation step, or
+        # the exact heading when rotating with pygame.transform)
         unrotated_sprite = self.sprite_master
-        new_sprite = pg.transform.rotate(unrotated_sprite, self.heading)
+        if _sprite_atlas is not None and _sprite_atlas.is_rotatable(unrotated_sprite):
+            bucket = _sprite_atlas.rotation_step(self.heading)
+        else:
+            bucket = self.heading
+        last_bucket, new_sprite = self._rotated_sprites.get(unrotated_sprite, (None, None))
+
+        if new_sprite is None or last_bucket != bucket:
+            # Use the pre-rotated atlas image if there is one, otherwise rotate the original unrotated sprite to
+            # reduce image flaws
+            new_sprite = None
+            if _sprite_atlas is not None:
+                new_sprite = _sprite_atlas.rotated(unrotated_sprite, self.heading)
+            if new_sprite is None:
+                new_sprite = pg.transform.rotate(unrotated_sprite, self.heading)
+            self._rotated_sprites[unrotated_sprite] = (bucket, new_sprite)
 
         # Update sprite dimensions
         (a, b, self.sprite_width, self.sprite_height) = new_sprite.get_rect()
@@ -186,6 +472,67 @@ class Spaceobject:
         self._update_position()
 
 
+    def advance(self, ticks):
+        """
+        Advance the object's position by a number of ticks at once.  The result is the same as calling
+        _update_position() 'ticks' times.
+        :param ticks: Number of ticks to advance.
+        :return: None
+        """
+        if ticks <= 0:
+            return
+
+        # Bouncing changes speed at the edges, so step it
+        if self.bounds_edgebounce:
+            for i in range(ticks):
+                self._update_position()
+            return
+
+        self.coord_x = self._advance_wrapped(self.coord_x, self.speed_x, self.bounds_leftx, self.bounds_rightx, ticks)
+        self.coord_y = self._advance_wrapped(self.coord_y, self.speed_y, self.bounds_topy, self.bounds_bottomy, ticks)
+
+
+    @staticmethod
+    def _advance_wrapped(coord, speed, low, high, ticks):
+        """
+        Calculate a coordinate after a number of ticks of movement between wrapping bounds.  As in _update_position(),
+        moving past one edge places the object exactly on the opposite edge.  Exact for integer speeds.
+        :param coord: Starting coordinate.
+        :param speed: Speed along the axis.
+        :param low: Low bound.
+        :param high: High bound.
+        :param ticks: Number of ticks.
+        :return: New coordinate.
+        """
+        if ticks <= 0:
+            return coord
+
+        # An object starting outside the bounds is placed on an edge by its first tick
+        if coord < low or coord > high:
+            coord += speed
+            if coord > high:
+                coord = low
+            elif coord < low:
+                coord = high
+            return Spaceobject._advance_wrapped(coord, speed, low, high, ticks - 1)
+
+        if speed == 0:
+            return coord
+
+        # Ticks until first wrap, then ticks per full trip across the bounds
+        if speed > 0:
+            to_wrap = max(math.floor((high - coord) / speed) + 1, 1)
+            restart = low
+        else:
+            to_wrap = max(math.floor((coord - low) / -speed) + 1, 1)
+            restart = high
+        if ticks < to_wrap:
+            return coord + ticks * speed
+
+        period = math.floor((high - low) / abs(speed)) + 1
+        return restart + ((ticks - to_wrap) % period) * speed
+
+
     def _update_position(self):
         """
         Update object's position with respect to bounds checking.
@@ -328,15 +675,17 @@ class Spaceobject:
         if not self.is_visible or not self.is_alive:
             return None
 
-        # Current sprite
-        sprite = self.sprite
+        # Catch up the working sprite if it was skipped while rotating
+        if self.is_sprite_stale:
+            self.rotate(0)
 
-        # If animated, handle animation sequence
-        if self.is_animating:
-            sprite = self._animate()
+        # Current sprite (switched by the animator if animating)
+        sprite = self.sprite
 
         # Show hitbox for debugging
         if "DEBUG_SHOW_HITBOX" in globals() and DEBUG_SHOW_HITBOX:
+            # Draw on a copy since sprites are shared
+            sprite = sprite.copy()
             _, _, w, h = sprite.get_rect()
             pg.draw.rect(sprite, colormap["red"], (int(self.shrinkhitbox_xy/2), int(self.shrinkhitbox_xy/2), w-self.shrinkhitbox_xy, h-self.shrinkhitbox_xy), 1)
 
@@ -344,54 +693,39 @@ class Spaceobject:
 
 
     def animation_config(self, frame_display_time_secs=0.1, animation_sequence_name="", animation_repeat=True):
-        self.animate_frame_display_time_secs = frame_display_time_secs
-        self.animate_timestamp = 0
-
-        # Pick type of iterator to use based on whether animation repeats or not.
-        if animation_repeat:
-            iter_to_use = itertools.cycle
-        else:
-            iter_to_use = iter
+        if animation_sequence_name and animation_sequence_name not in self.animation_sequences_dict:
+            raise KeyError("Animation sequence name not found.")
 
-        # Choose animation sequence to use
-        if animation_sequence_name:
-            animation_seq = self.animation_sequences_dict.get(animation_sequence_name, None)
-            if animation_seq is None:
-                raise KeyError("Animation sequence name not found.")
-        else:
-            animation_seq = range(len(self.sprite_list))
-
-        self.animation_list_index_iter = iter_to_use(animation_seq)
+        self._animation_settings = (animation_sequence_name, frame_display_time_secs, animation_repeat)
 
 
     def animation_start(self):
         # If animation hasn't been explicitly configured, configure it with defaults.
-        if self.animation_list_index_iter is None:
+        if self._animation_settings is None:
             self.animation_config()
 
-        self.is_animating = True
+        _animator.start(self, *self._animation_settings)
 
 
     def animation_stop(self):
-        self.is_animating = False
+        _animator.stop(self)
 
 
-    def _animate(self):
-        if time.time() >= self.animate_timestamp:
-            # If not first displayed frame, switch to next sprite in animation sequence
-            if self.animate_timestamp != 0:
-                try:
-                    index = next(self.animation_list_index_iter)
-                    self.switch_sprite(index, True)
-
-                except StopIteration:
-                    self.animation_complete = True
-                    self.is_animating = False
+    def _animation_frame(self):
+        """
+        Called by the animator after switching to the next frame of an animation.  Subclasses override this to
+        drive effects tied to animation frames.
+        :return: None
+        """
+        pass
 
-            # Set next animation frame timestamp
-            self.animate_timestamp = time.time() + self.animate_frame_display_time_secs
 
-        return self.sprite
+    def _animation_finished(self):
+        """
+        Called by the animator when a non-repeating animation has shown its last frame.
+        :return: None
+        """
+        pass
 
 
 
@@ -399,8 +733,17 @@ class Asteroid(Spaceobject):
     MAX_SIZE = 2
     MAX_SPIN_SPEED = 1.5
 
+    VECTOR_BATCHED = True
+    VECTOR_SHAPES = [[((102, 102, 102), jagged_polygon(radius, 10, seed=radius), 0),
+                      ((160, 160, 160), jagged_polygon(radius, 10, seed=radius), 1)] for radius in (8, 12, 16)]
+
     size = MAX_SIZE
 
+    spin = ComponentField("spin")
+
+    # Tick of the last level of detail scheduler update (None if not yet scheduled)
+    lod_tick = OptionalComponentField("lod_tick", LOD_TICK_NONE)
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
@@ -429,16 +772,26 @@ class Asteroid(Spaceobject):
             self.rotate(self.spin)
 
 
+    def advance(self, ticks, update_sprite=True):
+        """
+        Advance position and spin by a number of ticks at once.
+        :param ticks: Number of ticks to advance.
+        :param update_sprite: True/False - Rotate the working sprite to the new heading.
+        :return: None
+        """
+        super().advance(ticks)
+
+        if self.spin != 0 and ticks > 0:
+            self.rotate(self.spin * ticks, update_sprite)
+
+
     def _create_sprites(self):
         # Load images
-        filename = os.path.join(sys.path[0], "asteroid0.png")
-        asteroid_size0 = pg.image.load(filename)
+        asteroid_size0 = load_image("asteroid0.png")
 
-        filename = os.path.join(sys.path[0], "asteroid1.png")
-        asteroid_size1 = pg.image.load(filename)
+        asteroid_size1 = load_image("asteroid1.png")
 
-        filename = os.path.join(sys.path[0], "asteroid2.png")
-        asteroid_size2 = pg.image.load(filename)
+        asteroid_size2 = load_image("asteroid2.png")
 
         sprite_list = [asteroid_size0, asteroid_size1, asteroid_size2]
 
@@ -449,14 +802,26 @@ class Asteroid(Spaceobject):
         return sprite_list
 
 
+    def vector_shapes(self):
+        return self.VECTOR_SHAPES
+
+
 
 class Plasma_weapon(Spaceobject):
 
     TIME_TO_LIVE_SECS = 1
 
+    VECTOR_BATCHED = True
+    VECTOR_SHAPES = [[(colormap["red"], [(6, 0), (0, 3), (-6, 0), (0, -3)], 0),
+                      (colormap["yellow"], [(3, 0), (0, 1), (-3, 0), (0, -1)], 0)]]
+
+    life_timeout = ComponentField("life_timeout")
+
     def __init__(self, coord_x, coord_y, speed_x=0, speed_y=0, heading=0):
         super().__init__(coord_x, coord_y, speed_x, speed_y, heading)
-        self.life_timeout = time.time() + self.TIME_TO_LIVE_SECS
+
+        # Life is measured on the simulation clock, so replays run faster than real time behave the same
+        self.life_timeout = _animator.time + self.TIME_TO_LIVE_SECS
 
 
     def _create_sprites(self):
@@ -464,12 +829,16 @@ class Plasma_weapon(Spaceobject):
         Create sprites and animation sequences.
         :return: List of sprites
         """
-        plasma = pg.image.load(os.path.join(sys.path[0], "plasma.png"))
+        plasma = load_image("plasma.png")
         sprite_list = [plasma]
 
         return sprite_list
 
 
+    def vector_shapes(self):
+        return self.VECTOR_SHAPES
+
+
     def _create_animation_sequences(self, sprite_list):
         # Create default animations sequences
         animation_seq_dict = super()._create_animation_sequences(sprite_list)
@@ -482,11 +851,67 @@ class Plasma_weapon(Spaceobject):
         super().update()
 
         # Check life timeout
-        if time.time() >= self.life_timeout:
+        if _animator.time >= self.life_timeout:
             self.is_alive = False
 
 
 
+class WeaponSlots:
+    """
+    Fixed number of slots for a ship's weapons in flight.  A slot is freed when its weapon dies and reused, oldest
+    freed first, by the next shot, so the store never grows.  Iterating gives the weapons in flight in slot order.
+    """
+
+    def __init__(self, capacity):
+        """
+        :param capacity: Number of slots (weapons that can be in flight at once).
+        """
+        self.slots = [None] * capacity
+        self.live_count = 0
+        self._free = collections.deque(range(capacity))
+
+
+    def __len__(self):
+        return self.live_count
+
+
+    def __iter__(self):
+        return (weapon for weapon in self.slots if weapon is not None)
+
+
+    def is_full(self):
+        """
+        :return: True if every slot holds a weapon.
+        """
+        return not self._free
+
+
+    def add(self, weapon):
+        """
+        Put a weapon in a free slot.
+        :param weapon: Weapon in flight.
+        :return: Slot index.
+        """
+        slot = self._free.popleft()
+        self.slots[slot] = weapon
+        self.live_count += 1
+        return slot
+
+
+    def release_dead(self):
+        """
+        Free the slots of weapons that are no longer alive and release their entity rows.
+        :return: None
+        """
+        for slot, weapon in enumerate(self.slots):
+            if weapon is not None and not weapon.is_alive:
+                weapon.release()
+                self.slots[slot] = None
+                self.live_count -= 1
+                self._free.append(slot)
+
+
+
 class Ship(Spaceobject):
 
     MAX_SPEEDX = 10
@@ -494,9 +919,6 @@ class Ship(Spaceobject):
 
     is_thrusting = False
 
-    # List holds live missile weapons in flight
-    missile_weapons = []
-
     WEAPON_PLASMA_SPEED = 8
     WEAPON_PLASMA_MAXLIVE = 5
 
@@ -507,12 +929,32 @@ class Ship(Spaceobject):
 
     ANIMATION_BOOM_FRAME_TIME = 0.05
 
-    def __init__(self, coord_x, coord_y, speed_x=0, speed_y=0, heading=0):
+    # Deathblossom effect frames (radius -> surface), shared by all ships
+    _deathblossom_frames = {}
+
+    # Vector shapes: idle, thrusting, then five explosion frames (same order as the sprite list)
+    VECTOR_HULL = [((128, 128, 128), [(16, 0), (-14, -12), (-8, 0), (-14, 12)], 0),
+                   (colormap["white"], [(16, 0), (-14, -12), (-8, 0), (-14, 12)], 1)]
+    VECTOR_FLAME = [(colormap["red"], [(-9, -4), (-9, 4), (-19, 0)], 0),
+                    (colormap["yellow"], [(-9, -2), (-9, 2), (-14, 0)], 0)]
+    VECTOR_SHAPES = [VECTOR_HULL, VECTOR_HULL + VECTOR_FLAME] + \
+                    [[(colormap["red"], jagged_polygon(radius, 12, 0.5, seed=radius), 0),
+                      (colormap["yellow"], jagged_polygon(radius // 2, 8, 0.5, seed=radius), 0)] for radius in (4, 8, 12, 16, 24)]
+
+    def __init__(self, coord_x, coord_y, speed_x=0, speed_y=0, heading=0, weapon_slots=None):
+        """
+        :param weapon_slots: WeaponSlots holding the ship's weapons in flight, such as those of the ship it respawns.
+        None to give the ship its own.
+        """
         super().__init__(coord_x, coord_y, speed_x=0, speed_y=0, heading=0)
 
         # Shrink the hitbox "slightly" to make hitbox tighter around image
         self.shrinkhitbox_xy = 6
 
+        if weapon_slots is None:
+            weapon_slots = WeaponSlots(self.WEAPON_PLASMA_MAXLIVE)
+        self.weapon_slots = weapon_slots
+
         self.deathblossom_charges = 10
         self.is_firing_deathblossom = False
         self.deathblossom_radius = 0
@@ -535,7 +977,7 @@ class Ship(Spaceobject):
         # sp.set_colorkey(colormap["black"])
 
         # Load ship image
-        ship = pg.image.load(os.path.join(sys.path[0], "ship.png"))
+        ship = load_image("ship.png")
         a, b, w, h = ship.get_rect()
 
         # Resize ship image to leave space for engine thrust "flame"
@@ -555,28 +997,23 @@ class Ship(Spaceobject):
         sprite_list = [sp, sp_thrust]
 
         # Explosion - smallest
-        filename = os.path.join(sys.path[0], "explosion0.png")
-        explosion = pg.image.load(filename)
+        explosion = load_image("explosion0.png")
         sprite_list.append(explosion)
 
         # Explosion - medium
-        filename = os.path.join(sys.path[0], "explosion1.png")
-        explosion = pg.image.load(filename)
+        explosion = load_image("explosion1.png")
         sprite_list.append(explosion)
 
         # Explosion - large
-        filename = os.path.join(sys.path[0], "explosion2.png")
-        explosion = pg.image.load(filename)
+        explosion = load_image("explosion2.png")
         sprite_list.append(explosion)
 
         # Explosion - larger
-        filename = os.path.join(sys.path[0], "explosion3.png")
-        explosion = pg.image.load(filename)
+        explosion = load_image("explosion3.png")
         sprite_list.append(explosion)
 
         # Explosion - largest
-        filename = os.path.join(sys.path[0], "explosion4.png")
-        explosion = pg.image.load(filename)
+        explosion = load_image("explosion4.png")
         sprite_list.append(explosion)
 
         # Alpha channel - select transparent color
@@ -586,6 +1023,10 @@ class Ship(Spaceobject):
         return sprite_list
 
 
+    def vector_shapes(self):
+        return self.VECTOR_SHAPES
+
+
     def _create_animation_sequences(self, sprite_list):
         animation_seq = super()._create_animation_sequences(sprite_list)
 
@@ -602,17 +1043,8 @@ class Ship(Spaceobject):
         # Update position
         super().update()
 
-        # Update live missile weapons
-        del_list = []
-        for m in self.missile_weapons:
-            if m:
-                if not m.is_alive:
-                    # Add "dead" missiles to the delete list
-                    del_list.append(m)
-
-        # Delete missiles marked for deletion
-        for m in del_list:
-            self.missile_weapons.remove(m)
+        # Free the slots of dead weapons
+        self.weapon_slots.release_dead()
 
 
     def thrust(self, thrust_deltaspeed):
@@ -634,15 +1066,6 @@ class Ship(Spaceobject):
             self.speed_y = sy
 
 
-    def _live_missile_count(self):
-        count = 0
-        for m in self.missile_weapons:
-            if m and m.is_alive:
-                count += 1
-
-        return count
-
-
     def shoot(self, type_string):
         """
         :return:
@@ -652,7 +1075,7 @@ class Ship(Spaceobject):
             return None
 
         if type_string == "plasma":
-            if self._live_missile_count() < self.WEAPON_PLASMA_MAXLIVE:
+            if not self.weapon_slots.is_full():
 
                 # Compute speed components
                 weaponspeed_x = self.speed_x + self.WEAPON_PLASMA_SPEED*math.cos(math.radians(self.heading))
@@ -660,7 +1083,7 @@ class Ship(Spaceobject):
 
                 weapon = Plasma_weapon(self.coord_x, self.coord_y, weaponspeed_x, weaponspeed_y, self.heading)
                 weapon.set_properties(True, True, True)
-                self.missile_weapons.append(weapon)
+                self.weapon_slots.add(weapon)
 
                 return weapon
 
@@ -668,7 +1091,9 @@ class Ship(Spaceobject):
             if not self.is_firing_deathblossom and self.deathblossom_charges > 0:
                 self.deathblossom_charges -= 1
                 self.is_firing_deathblossom = True
-                self.deathblossom_radius = self.sprite_width // 2
+
+                # Start from the unrotated sprite so every firing uses the same (cached) radius steps
+                self.deathblossom_radius = self.sprite_list[0].get_width() // 2
 
                 # Config for animation
                 self.animation_config(frame_display_time_secs=self.ANIMATION_DEATHBLOSSOM_FRAME_TIME, animation_sequence_name="deathblossom", animation_repeat=True)
@@ -680,61 +1105,65 @@ class Ship(Spaceobject):
         return None
 
 
-    def _animate(self):
-        time_now = time.time()
-        sprite_to_display = self.sprite
-
-        if time_now >= self.animate_timestamp:
-            # If not first displayed frame, switch to next sprite in animation sequence
-            if self.animate_timestamp != 0:
-                try:
-                    index = next(self.animation_list_index_iter)
-                    self.switch_sprite(index, True)
-                    sprite_to_display = self.sprite
-
-                except StopIteration:
-                    self.animation_complete = True
-                    self.is_animating = False
-                    self.is_firing_deathblossom = False
-
-                # Control "deathblossom" animation
-                if self.is_firing_deathblossom:
-                    self.deathblossom_radius += self.ANIMATION_DEATHBLOSSOM_DELTARAD_PER_FRAME
+    def _animation_frame(self):
+        # Control "deathblossom" animation
+        if self.is_firing_deathblossom:
+            self.deathblossom_radius += self.ANIMATION_DEATHBLOSSOM_DELTARAD_PER_FRAME
 
-                    # Test if it is time to end the deathblossom effect
-                    if self.deathblossom_radius >= self.WEAPON_DEATHBLOSSOM_MAXRADIUS:
-                        self.is_firing_deathblossom = False
-                        self.animation_complete = True
-                        self.is_animating = False
+            # Test if it is time to end the deathblossom effect
+            if self.deathblossom_radius >= self.WEAPON_DEATHBLOSSOM_MAXRADIUS:
+                self.is_firing_deathblossom = False
+                self.animation_stop()
+                self.animation_complete = True
 
-            # Set next animation frame timestamp
-            self.animate_timestamp = time_now + self.animate_frame_display_time_secs
 
-        # Add in "deathblossom" effect to animation
-        if self.is_firing_deathblossom:
-            # Create new sprite to hold composite image
-            w = max(self.sprite_width, 2 * self.deathblossom_radius)
-            h = max(self.sprite_height, 2 * self.deathblossom_radius)
-            sprite_to_display = pg.Surface((w, h))
-            sprite_to_display.set_colorkey(colormap["black"])
+    def _animation_finished(self):
+        self.is_firing_deathblossom = False
 
-            # Determine blit coordinates by placing sprite rectangle center on sprite_to_show rectangle center
-            current_sprite_rect = self.sprite.get_rect()
-            sprite_to_display_rect = sprite_to_display.get_rect()
-            current_sprite_rect.centerx = sprite_to_display_rect.centerx
-            current_sprite_rect.centery = sprite_to_display_rect.centery
-            blit_dest = (current_sprite_rect.left, current_sprite_rect.top)
 
-            # Draw circle and blit image over it
-            pg.draw.circle(sprite_to_display, colormap["red"], (sprite_to_display_rect.centerx, sprite_to_display_rect.centery), self.deathblossom_radius, 0)
-            sprite_to_display.blit(self.sprite, blit_dest)
+    def _deathblossom_frame(self, radius):
+        """
+        Get the deathblossom effect frame for a radius.  Frames for every radius step are made the first time the
+        weapon is fired and reused after that.
+        :param radius: Deathblossom radius.
+        :return: pygame.Surface
+        """
+        frames = Ship._deathblossom_frames
+        frame = frames.get(radius, None)
+        if frame is None:
+            r = radius
+            while r not in frames:
+                frame = pg.Surface((2 * r + 1, 2 * r + 1))
+                pg.draw.circle(frame, colormap["red"], (r, r), r, 0)
+                if pg.display.get_surface() is not None:
+                    frame = frame.convert()
+                frame.set_colorkey(colormap["black"])
+                frames[r] = frame
+
+                if r >= self.WEAPON_DEATHBLOSSOM_MAXRADIUS:
+                    break
+                r += self.ANIMATION_DEATHBLOSSOM_DELTARAD_PER_FRAME
+            frame = frames[radius]
+
+        return frame
+
+
+    def render_effect(self):
+        """
+        Return the effect drawn underneath the ship (the deathblossom), if any.  Drawn separately from the ship sprite
+        so it can come from a cache instead of being composited every frame.
+        :return: Effect surface or None
+        """
+        if not self.is_firing_deathblossom:
+            return None
 
-        return sprite_to_display
+        return self._deathblossom_frame(self.deathblossom_radius)
 
 
     def render(self):
         if self.is_animating:
-            sprite = self._animate()
+            # Sprite is switched by the animator
+            sprite = self.sprite
         elif self.animation_complete and not self.is_alive:
             # If animation complete after dying, display nothing
             return None
@@ -750,6 +1179,8 @@ class Ship(Spaceobject):
 
         # Show hitbox for debugging
         if "DEBUG_SHOW_HITBOX" in globals() and DEBUG_SHOW_HITBOX:
+            # Draw on a copy since sprites are shared
+            sprite = sprite.copy()
             _, _, w, h = sprite.get_rect()
             pg.draw.rect(sprite, colormap["red"], (int(self.shrinkhitbox_xy/2), int(self.shrinkhitbox_xy/2), w-self.shrinkhitbox_xy, h-self.shrinkhitbox_xy), 1)
 
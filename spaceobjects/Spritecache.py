@@ -0,0 +1,61 @@
+from collections import OrderedDict
+
+import pygame as pg
+
+
+class ScaledSpriteCache:
+    """
+    LRU cache of scaled copies of sprites, keyed by the sprite surface and the scale.  Sprites that are reused
+    between frames (class sprites, sprite atlas rotations) are scaled once per scale rather than once per draw.
+    """
+
+    def __init__(self, max_entries=4096, smooth=False):
+        """
+        :param max_entries: Number of scaled sprites kept.  The least recently used are evicted first.
+        :param smooth: True/False - Use pygame.transform.smoothscale (slower, filtered) instead of scale.
+        """
+        self.max_entries = max_entries
+        self.smooth = smooth
+        self._entries = OrderedDict()
+
+        # Lookups served from the cache and those that had to scale
+        self.hits = 0
+        self.misses = 0
+
+
+    def get(self, sprite, scale):
+        """
+        :param sprite: Unscaled sprite surface.
+        :param scale: Scale factor.
+        :return: The sprite scaled by the scale factor.
+        """
+        if scale == 1:
+            return sprite
+
+        key = (sprite, scale)
+        scaled = self._entries.get(key, None)
+        if scaled is not None:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return scaled
+
+        self.misses += 1
+        w, h = sprite.get_size()
+        size = (max(int(round(w * scale)), 1), max(int(round(h * scale)), 1))
+        if self.smooth and sprite.get_bitsize() >= 24:
+            scaled = pg.transform.smoothscale(sprite, size)
+        else:
+            scaled = pg.transform.scale(sprite, size)
+
+        self._entries[key] = scaled
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return scaled
+
+
+    def clear(self):
+        self._entries.clear()
+
+
+    def __len__(self):
+        return len(self._entries)
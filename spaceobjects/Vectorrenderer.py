@@ -0,0 +1,126 @@
+import numpy as np
+import pygame as pg
+
+from spaceobjects.Ecs import find_in_view
+from spaceobjects.Spaceobjects import entity_rows, get_registry
+
+
+class VectorRenderer:
+    """
+    Draws space objects from their vector shapes.  The vertices of every visible object are rotated and translated
+    as one NumPy batch, then drawn with pygame.draw.polygon.  Used by the vector render backend in place of rotating
+    and blitting a bitmap sprite per object.
+    """
+
+    def __init__(self, cull_margin=50):
+        """
+        :param cull_margin: Distance outside the camera view within which objects are still drawn.
+        """
+        self.cull_margin = cull_margin
+
+        # Vertex arrays per (class, sprite index), built from the class vector shapes on first use
+        self._shape_cache = {}
+
+
+    def _polygons(self, obj):
+        key = (type(obj), obj.sprite_index)
+        polygons = self._shape_cache.get(key, None)
+        if polygons is None:
+            polygons = [(color, np.array(vertices, dtype=float), line_width)
+                        for color, vertices, line_width in obj.vector_shapes()[obj.sprite_index]]
+            self._shape_cache[key] = polygons
+        return polygons
+
+
+    def draw(self, surface, camera, objects):
+        """
+        Draw the objects.
+        :param surface: Surface on which to draw.
+        :param camera: Viewport.Camera used to translate world coordinates (None for no translation).
+        :param objects: Sequence of space objects with vector shapes.
+        :return: Number of objects drawn.
+        """
+        return self.draw_views([(surface, camera)], objects)
+
+
+    def draw_views(self, views, objects):
+        """
+        Draw the objects on several views of the same world.  Objects are culled against all the views at once and
+        their vertices are rotated once; each view only translates and scales them.
+        :param views: List of (surface, Viewport.Camera) pairs.  A camera of None draws without translation.
+        :param objects: Sequence of space objects with vector shapes.
+        :return: Number of objects drawn (counted once however many views show them).
+        """
+        cameras = [camera for surface, camera in views]
+        registry = get_registry()
+        columns = registry.columns
+        rows = entity_rows(objects)
+
+        # Cull against all views in one batch
+        shown = columns["is_alive"][rows] & columns["is_visible"][rows]
+        if None not in cameras:
+            shown &= np.logical_or.reduce([find_in_view(registry, rows, camera, self.cull_margin)
+                                           for camera in cameras])
+        shown = np.flatnonzero(shown)
+        shown_x = columns["coord_x"][rows[shown]].tolist()
+        shown_y = columns["coord_y"][rows[shown]].tolist()
+        shown_headings = columns["heading"][rows[shown]].tolist()
+
+        vertex_arrays = []
+        vertex_counts = []
+        styles = []
+        centers_x = []
+        centers_y = []
+        headings = []
+        for i, x, y, heading in zip(shown.tolist(), shown_x, shown_y, shown_headings):
+            for color, vertices, line_width in self._polygons(objects[i]):
+                vertex_arrays.append(vertices)
+                vertex_counts.append(len(vertices))
+                styles.append((color, line_width))
+                centers_x.append(x)
+                centers_y.append(y)
+                headings.append(heading)
+        object_count = len(shown)
+
+        if not vertex_arrays:
+            return 0
+
+        # Rotate all vertices at once.  Positive headings are counter-clockwise on screen (y axis points down).
+        vertices = np.concatenate(vertex_arrays)
+        theta = np.radians(np.repeat(headings, vertex_counts))
+        cos_t = np.cos(theta)
+        sin_t = np.sin(theta)
+        offsets_x = vertices[:, 0] * cos_t + vertices[:, 1] * sin_t
+        offsets_y = vertices[:, 1] * cos_t - vertices[:, 0] * sin_t
+        centers_x = np.array(centers_x, dtype=float)
+        centers_y = np.array(centers_y, dtype=float)
+
+        for surface, camera in views:
+            self._draw_view(surface, camera, styles, vertex_counts, centers_x, centers_y, offsets_x, offsets_y)
+
+        return object_count
+
+
+    def _draw_view(self, surface, camera, styles, vertex_counts, centers_x, centers_y, offsets_x, offsets_y):
+        """
+        Translate and scale rotated polygons into one view and draw those the view's camera can see.
+        """
+        visible = None
+        scale = 1
+        if camera is not None:
+            visible = ((np.abs(centers_x - camera.x) <= camera.view_width // 2 + self.cull_margin) &
+                       (np.abs(centers_y - camera.y) <= camera.view_height // 2 + self.cull_margin))
+            scale = camera.scale
+
+            # Translate centers from world to display coordinates (camera.apply works element-wise on arrays)
+            centers_x, centers_y = camera.apply(centers_x, centers_y)
+
+        x = offsets_x * scale + np.repeat(centers_x, vertex_counts)
+        y = offsets_y * scale + np.repeat(centers_y, vertex_counts)
+        points = np.column_stack((x, y)).tolist()
+
+        start = 0
+        for i, ((color, line_width), count) in enumerate(zip(styles, vertex_counts)):
+            if visible is None or visible[i]:
+                pg.draw.polygon(surface, color, points[start:start + count], line_width)
+            start += count
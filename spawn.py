@@ -0,0 +1,127 @@
+# Spawn placement
+#
+# Places new asteroids apart from each other, from the asteroids already in the level and clear of the ship.
+# Candidate points are drawn at random and rejected if they are too close to a point already placed or occupied
+# (grid rejection sampling).  Placed points are kept in a
+# uniform grid with cells the size of the separation, so each test only looks at the neighboring cells and placing
+# hundreds of asteroids takes time linear in their number.
+
+import math
+import random
+
+
+class SpawnPlacer:
+    """
+    Picks spawn points in the level.  Points are integer coordinates, so asteroids spawned at them keep the exact
+    integer movement that the analytic position updates rely on.
+    """
+
+    # Largest fraction of the spacing of points spread evenly over the spawn area used as the separation.  Requests
+    # for more points than fit at the wanted separation are placed at a reduced separation.
+    PACKING = 0.5
+
+    def __init__(self, level_width, level_height, max_attempts=30, rng=random):
+        """
+        :param level_width: Width of the level.
+        :param level_height: Height of the level.
+        :param max_attempts: Candidates tried per point.  If none is clear, the candidate furthest from the others
+        is used.
+        :param rng: Random number generator (the random module or a random.Random).
+        """
+        self.level_width = level_width
+        self.level_height = level_height
+        self.max_attempts = max_attempts
+        self.rng = rng
+
+        # Points placed, and points placed at less than the wanted separation because no clear candidate was found
+        self.placed = 0
+        self.crowded = 0
+
+
+    def place(self, count, min_separation, keep_out=(), area=None, occupied=()):
+        """
+        Pick spawn points.
+        :param count: Number of points.
+        :param min_separation: Wanted distance between the points.
+        :param keep_out: List of (x, y, radius) circles to keep the points out of (such as the ship).
+        :param area: (x, y, radius) disc in which to place the points, or None for the whole level.
+        :param occupied: (x, y) points already taken (such as the asteroids in the level).  The new points keep the
+        separation from those near the spawn area too.
+        :return: List of (x, y) points.
+        """
+        if count <= 0:
+            return []
+
+        if area is None:
+            spawn_area = self.level_width * self.level_height
+            nearby = list(occupied)
+            inside = len(nearby)
+        else:
+            center_x, center_y, radius = area
+            spawn_area = math.pi * radius * radius
+            distances = [(math.hypot(x - center_x, y - center_y), (x, y)) for x, y in occupied]
+            nearby = [point for distance, point in distances if distance <= radius + min_separation]
+            inside = sum(1 for distance, point in distances if distance <= radius)
+
+        # Occupied points in the area share its space with the new points
+        separation = min(min_separation, self.PACKING * math.sqrt(spawn_area / (count + inside)))
+        cell_size = max(separation, 1)
+        grid = {}
+        for point in nearby:
+            grid.setdefault((int(point[0] // cell_size), int(point[1] // cell_size)), []).append(point)
+
+        points = []
+        for i in range(count):
+            best = None
+            best_clearance = None
+            for attempt in range(self.max_attempts):
+                x, y = self._candidate(area)
+                clearance = self._clearance(grid, cell_size, x, y, separation, keep_out)
+                if best is None or clearance > best_clearance:
+                    best = (x, y)
+                    best_clearance = clearance
+                if clearance >= separation:
+                    break
+            else:
+                self.crowded += 1
+
+            grid.setdefault((int(best[0] // cell_size), int(best[1] // cell_size)), []).append(best)
+            points.append(best)
+
+        self.placed += count
+        return points
+
+
+    def _candidate(self, area):
+        """
+        :return: Random (x, y) point in the area (a disc, or the whole level if None) and within the level.
+        """
+        if area is None:
+            return self.rng.randint(0, self.level_width), self.rng.randint(0, self.level_height)
+
+        center_x, center_y, radius = area
+        angle = self.rng.uniform(0, 2 * math.pi)
+        distance = radius * math.sqrt(self.rng.random())
+        x = min(max(round(center_x + distance * math.cos(angle)), 0), self.level_width)
+        y = min(max(round(center_y + distance * math.sin(angle)), 0), self.level_height)
+        return x, y
+
+
+    @staticmethod
+    def _clearance(grid, cell_size, x, y, separation, keep_out):
+        """
+        :return: Distance from a point to the nearest placed point, up to 'separation'.  Keep out circles count as
+        placed points that must be 'radius' away rather than 'separation', so a point inside one has a clearance
+        below 'separation' (negative when deep inside).
+        """
+        clearance = separation
+        for circle_x, circle_y, radius in keep_out:
+            clearance = min(clearance, math.hypot(x - circle_x, y - circle_y) - radius + separation)
+
+        cx = int(x // cell_size)
+        cy = int(y // cell_size)
+        for ny in (cy - 1, cy, cy + 1):
+            for nx in (cx - 1, cx, cx + 1):
+                for px, py in grid.get((nx, ny), ()):
+                    clearance = min(clearance, math.hypot(x - px, y - py))
+        return clearance
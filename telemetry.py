@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+# Live telemetry and control
+#
+# A local TCP endpoint, served by asyncio on a background thread, that streams live frame stats to connected
+# clients and takes commands that change runtime knobs (frame rate, LOD thresholds, cache sizes, spawning extra
+# asteroids for load tests) without restarting the game.
+#
+# The protocol is line based.  The server sends a JSON object of frame stats per line, at most every stream
+# interval.  Clients send commands as "<command> <value>" lines (e.g. "fps 60", "spawn 200"; "help" lists the
+# commands) and get a JSON reply line.  Commands are queued and the game applies them at its next tick boundary, so
+# the endpoint never blocks a frame: the game only swaps in its latest stats and pops queued commands off a deque.
+#
+# Usage: python telemetry.py [--host HOST] [--port N]    (connects and prints the stats, sending typed commands)
+
+import argparse
+import asyncio
+import collections
+import json
+import socket
+import sys
+import threading
+
+TELEMETRY_DEFAULT_PORT = 7201
+
+
+def parse_bool(text):
+    """
+    :return: True/False for on/off, true/false, yes/no or 1/0.
+    """
+    value = text.lower()
+    if value in ("1", "on", "true", "yes"):
+        return True
+    if value in ("0", "off", "false", "no"):
+        return False
+    raise ValueError("expected on or off")
+
+
+def int_range(low, high):
+    """
+    :return: Function parsing an integer from low to high, for a command's value.
+    """
+    def parse_int(text):
+        value = int(text)
+        if not low <= value <= high:
+            raise ValueError("expected {} to {}".format(low, high))
+        return value
+    return parse_int
+
+
+class TelemetryServer:
+    """
+    Telemetry endpoint on its own thread and event loop.  The game calls publish() with its frame stats and poll()
+    for the commands received since the last tick; neither waits on the server thread.
+    """
+
+    def __init__(self, commands, port=TELEMETRY_DEFAULT_PORT, host="127.0.0.1", stream_interval=0.1):
+        """
+        :param commands: Dict of command name -> function parsing the command's value (such as int or parse_bool).
+        The parse functions run on the server thread and raise ValueError for bad values.
+        :param port: TCP port (0 picks a free port, see 'port' once started).
+        :param host: Interface to listen on.  The default only accepts local connections.
+        :param stream_interval: Seconds between stats lines sent to each client.
+        """
+        self.commands = commands
+        self.host = host
+        self.port = port
+        self.stream_interval = stream_interval
+
+        # Statistics
+        self.clients = 0
+        self.commands_received = 0
+
+        # The latest stats are swapped in whole and commands are appended and popped whole, which are atomic, so the
+        # game and server threads don't share a lock
+        self._stats = None
+        self._pending = collections.deque()
+
+        self._loop = asyncio.new_event_loop()
+        self._stop = None
+        self._clients = {}
+        self._error = None
+        self._started = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="telemetry", daemon=True)
+        self._thread.start()
+        self._started.wait()
+        if self._error is not None:
+            raise self._error
+
+
+    def publish(self, stats):
+        """
+        Make a tick's stats the latest to stream.
+        :param stats: Dict of JSON serializable values.  The dict must not be changed afterwards.
+        :return: None
+        """
+        self._stats = stats
+
+
+    def poll(self):
+        """
+        Take the commands received since the last call.  Called by the game at a tick boundary.
+        :return: List of (command name, value), in the order received.
+        """
+        commands = []
+        while self._pending:
+            commands.append(self._pending.popleft())
+        return commands
+
+
+    def close(self):
+        """
+        Disconnect the clients and stop the server thread.
+        :return: None
+        """
+        if self._thread.is_alive():
+            self._loop.call_soon_threadsafe(self._stop.set)
+            self._thread.join()
+
+
+    def _run(self):
+        try:
+            self._loop.run_until_complete(self._serve())
+        except Exception as e:
+            self._error = e
+            self._started.set()
+        finally:
+            self._loop.close()
+
+
+    async def _serve(self):
+        self._stop = asyncio.Event()
+        server = await asyncio.start_server(self._client, self.host, self.port)
+        self.port = server.sockets[0].getsockname()[1]
+        self._started.set()
+
+        await self._stop.wait()
+        server.close()
+        clients = list(self._clients.items())
+        for writer, task in clients:
+            writer.close()
+        await asyncio.gather(*(task for writer, task in clients), return_exceptions=True)
+        await server.wait_closed()
+
+
+    async def _client(self, reader, writer):
+        """
+        Serve one client: stream stats while reading its commands.
+        """
+        self.clients += 1
+        self._clients[writer] = asyncio.current_task()
+        stream = asyncio.ensure_future(self._stream(writer))
+        try:
+            skipping = False
+            while True:
+                try:
+                    line = await reader.readuntil(b"\n")
+                except asyncio.IncompleteReadError as e:
+                    line = e.partial            # End of the stream
+                except asyncio.LimitOverrunError as e:
+                    # Longer than the reader's buffer limit: drop what was read and skip the rest of the line
+                    await reader.readexactly(e.consumed)
+                    if not skipping:
+                        writer.write((json.dumps({"error": "line too long"}) + "\n").encode())
+                    skipping = True
+                    continue
+
+                if not skipping:
+                    reply = self._command(line.decode(errors="replace"))
+                    if reply is not None:
+                        writer.write((json.dumps(reply) + "\n").encode())
+                skipping = False
+                if not line.endswith(b"\n"):
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            stream.cancel()
+            del self._clients[writer]
+            self.clients -= 1
+            writer.close()
+
+
+    async def _stream(self, writer):
+        """
+        Send the latest stats whenever they changed, at most every stream interval.
+        """
+        sent = None
+        try:
+            while True:
+                stats = self._stats
+                if stats is not None and stats is not sent:
+                    writer.write((json.dumps(stats) + "\n").encode())
+                    await writer.drain()
+                    sent = stats
+                await asyncio.sleep(self.stream_interval)
+        except ConnectionError:
+            pass
+
+
+    def _command(self, line):
+        """
+        Parse a command line and queue the command.
+        :return: Reply (dict), or None for an empty line.
+        """
+        words = line.split()
+        if not words:
+            return None
+
+        name = words[0].lower()
+        if name == "help":
+            return {"commands": sorted(self.commands)}
+        if name not in self.commands:
+            return {"error": "unknown command: {}".format(name)}
+        if len(words) != 2:
+            return {"error": "usage: {} <value>".format(name)}
+        try:
+            value = self.commands[name](words[1])
+        except ValueError as e:
+            return {"error": "{}: {}".format(name, e)}
+
+        self._pending.append((name, value))
+        self.commands_received += 1
+        return {"queued": name, "value": value}
+
+
+def monitor(host, port):
+    """
+    Print the stats and replies streamed by a telemetry endpoint, and send commands typed on stdin.
+    :return: None
+    """
+    with socket.create_connection((host, port)) as sock:
+        def send_commands():
+            for line in sys.stdin:
+                sock.sendall(line.encode())
+            sock.shutdown(socket.SHUT_WR)
+
+        threading.Thread(target=send_commands, daemon=True).start()
+        with sock.makefile("r") as lines:
+            for line in lines:
+                print(line, end="")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Watch and control a running game's telemetry endpoint.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=TELEMETRY_DEFAULT_PORT)
+    args = parser.parse_args()
+
+    try:
+        monitor(args.host, args.port)
+    except (ConnectionError, KeyboardInterrupt) as e:
+        print(e)
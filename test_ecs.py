@@ -0,0 +1,155 @@
+# Entity component system tests: registry rows, the collision and lifetime systems and releasing space objects' rows
+
+import numpy as np
+import pytest
+
+from spaceobjects.Ecs import EntityRegistry, find_impacts, find_overlaps, update_lifetime
+
+
+def create_box(registry, x, y, size=10, speed_x=0, speed_y=0, solid=True):
+    """
+    :return: Row of a live, visible entity with a square hitbox.
+    """
+    row = registry.create()
+    columns = registry.columns
+    columns["coord_x"][row] = x
+    columns["coord_y"][row] = y
+    columns["speed_x"][row] = speed_x
+    columns["speed_y"][row] = speed_y
+    columns["sprite_width"][row] = size
+    columns["sprite_height"][row] = size
+    columns["is_solid"][row] = solid
+    columns["is_visible"][row] = True
+    columns["is_alive"][row] = True
+    return row
+
+
+def rows(*values):
+    return np.array(values, dtype=np.intp)
+
+
+def test_released_rows_are_reused_lowest_first_with_defaults():
+    registry = EntityRegistry(capacity=8)
+    created = [registry.create() for i in range(5)]
+    assert created == [0, 1, 2, 3, 4]
+    assert registry.count == 5
+
+    registry.columns["coord_x"][3] = 42
+    registry.columns["life_timeout"][3] = 7
+    registry.release(3)
+    registry.release(1)
+    assert registry.count == 3
+
+    assert registry.create() == 1
+    assert registry.create() == 3
+    assert registry.columns["coord_x"][3] == 0
+    assert registry.columns["life_timeout"][3] == np.inf
+    assert registry.columns["lod_tick"][3] == -1
+    assert registry.create() == 5
+    assert registry.count == 6
+
+
+def test_registry_grows_and_keeps_the_rows():
+    registry = EntityRegistry(capacity=2)
+    for i in range(5):
+        row = registry.create()
+        registry.columns["coord_x"][row] = i * 10
+
+    assert registry.capacity == 8
+    assert registry.count == 5
+    assert all(len(column) == 8 for column in registry.columns.values())
+    assert registry.columns["coord_x"].tolist() == [0, 10, 20, 30, 40, 0, 0, 0]
+    assert registry.columns["life_timeout"][5:].tolist() == [np.inf] * 3
+
+
+def test_registry_in_a_buffer_is_shared_and_fixed():
+    buffer = bytearray(EntityRegistry.buffer_size(4))
+    registry = EntityRegistry(4, buffer)
+    attached = EntityRegistry(4, buffer, clear=False)
+    row = registry.create()
+    registry.columns["coord_x"][row] = 42
+    assert attached.columns["coord_x"][row] == 42
+    assert attached.columns["life_timeout"][row] == np.inf
+
+    for i in range(3):
+        registry.create()
+    assert registry.free_count() == 0
+    with pytest.raises(MemoryError):
+        registry.create()
+
+
+def test_overlaps_match_the_hitboxes():
+    registry = EntityRegistry()
+    a = create_box(registry, 100, 100)
+    touching = create_box(registry, 110, 100)
+    apart = create_box(registry, 111, 100)
+    shrunk = create_box(registry, 108, 108)
+    registry.columns["shrinkhitbox_xy"][shrunk] = 6
+    not_solid = create_box(registry, 100, 100, solid=False)
+
+    overlaps = find_overlaps(registry, rows(a), rows(touching, apart, shrunk, not_solid))
+    assert overlaps.shape == (1, 4)
+    assert overlaps[0].tolist() == [True, False, False, False]
+
+    # Dead entities never collide
+    registry.columns["is_alive"][touching] = False
+    assert not find_overlaps(registry, rows(a), rows(touching)).any()
+
+
+def test_impacts_find_the_time_a_fast_entity_passes_through():
+    registry = EntityRegistry()
+
+    # Moved 100 to the right this tick, through a box centred 50 behind its current position
+    shot = create_box(registry, 200, 100, size=2, speed_x=100)
+    rock = create_box(registry, 150, 100, size=20)
+    missed = create_box(registry, 150, 130, size=20)
+    ahead = create_box(registry, 230, 100, size=20)
+    behind = create_box(registry, 100, 100, size=20)
+
+    impacts = find_impacts(registry, rows(shot), rows(rock, missed, ahead, behind))[0]
+    assert impacts[0] == (150 - 11 - 100) / 100
+    assert impacts[1] == np.inf
+    assert impacts[2] == np.inf
+    assert impacts[3] == 0
+
+    # The discrete test only sees the end of the tick
+    assert not find_overlaps(registry, rows(shot), rows(rock, behind)).any()
+
+
+def test_lifetime_kills_timed_out_entities_only():
+    registry = EntityRegistry()
+    expiring = create_box(registry, 0, 0)
+    later = create_box(registry, 0, 0)
+    forever = create_box(registry, 0, 0)
+    dead = create_box(registry, 0, 0)
+    columns = registry.columns
+    columns["life_timeout"][[expiring, later, dead]] = (5, 6, 1)
+    columns["is_alive"][dead] = False
+
+    expired = update_lifetime(registry, rows(expiring, later, forever, dead), 5)
+    assert expired.tolist() == [True, False, False, False]
+    assert columns["is_alive"][[expiring, later, forever, dead]].tolist() == [False, True, True, False]
+
+
+def test_released_objects_keep_their_state_and_free_their_row(game):
+    from spaceobjects.Spaceobjects import Asteroid, get_registry
+
+    registry = get_registry()
+    rock = Asteroid(120, 80, 3, -2, 45)
+    row = rock._row
+    count = registry.count
+
+    rock.release()
+    rock.release()
+    assert registry.count == count - 1
+    assert (rock.coord_x, rock.coord_y, rock.speed_x, rock.heading) == (120, 80, 3, 45)
+
+    # The row is reused by the next object without the released one seeing its state
+    other = Asteroid(5, 6)
+    assert other._row == row
+    assert rock.coord_x == 120
+    rock.coord_x = 1
+    assert other.coord_x == 5
+
+    del rock
+    assert registry.count == count
@@ -0,0 +1,54 @@
+# Level of detail tests: asteroids updated at a reduced rate end up where the full-rate simulation puts them
+
+import random
+
+import pytest
+
+from lod import LodScheduler
+
+LEVEL_WIDTH = 3000
+LEVEL_HEIGHT = 2000
+
+
+def make_rocks(seed, count):
+    from spaceobjects.Spaceobjects import Asteroid
+
+    rng = random.Random(seed)
+    rocks = []
+    for i in range(count):
+        rock = Asteroid(rng.randint(0, LEVEL_WIDTH), rng.randint(0, LEVEL_HEIGHT),
+                        rng.randint(-30, 30), rng.randint(-30, 30), rng.randint(0, 359))
+        rock.spin = rng.choice([-3, -1, 0, 2, 5])
+        rock.set_move_bounds(LEVEL_WIDTH, LEVEL_HEIGHT, edge_bounce=False)
+        rocks.append(rock)
+    return rocks
+
+
+@pytest.mark.parametrize("ticks", [1, 7, 8, 9, 250])
+def test_reduced_rate_matches_full_rate_once_promoted(game, ticks):
+    camera = game.Viewport.Camera(400, 300, LEVEL_WIDTH, LEVEL_HEIGHT, 200, 150)
+    everything = game.Viewport.Camera(LEVEL_WIDTH, LEVEL_HEIGHT, LEVEL_WIDTH, LEVEL_HEIGHT,
+                                      LEVEL_WIDTH // 2, LEVEL_HEIGHT // 2)
+
+    reduced = make_rocks(3, 200)
+    full = make_rocks(3, 200)
+    lod = LodScheduler(reduced_rate_ticks=8)
+    full_rate = LodScheduler(enabled=False)
+
+    far_ticks = 0
+    for tick in range(ticks):
+        lod.update(reduced, [camera], [])
+        full_rate.update(full, [camera], [])
+        far_ticks += lod.far_count
+
+    # Asteroids were held back (over the long run, for long enough that fast ones wrapped around the level)
+    assert far_ticks > 0
+
+    # A camera over the whole level promotes every asteroid back to full rate
+    assert len(lod.update(reduced, [everything], [])) == len(reduced)
+    full_rate.update(full, [everything], [])
+
+    for rock, reference in zip(reduced, full):
+        assert (rock.coord_x, rock.coord_y) == (reference.coord_x, reference.coord_y)
+        assert rock.heading == pytest.approx(reference.heading)
+        assert rock.lod_tick == reference.lod_tick == ticks + 1
@@ -0,0 +1,150 @@
+# Metrics log tests: rotation, both formats, dropped lines, reading back and the drift summary
+
+import os
+import threading
+import time
+
+import numpy as np
+
+from metrics import METRICS_FORMAT_CSV, METRICS_FORMAT_NDJSON, MetricsLog, log_files, read_log, summarize
+
+
+def write_log(path, metrics_format, ticks, max_bytes=2000, backup_count=10, **kwargs):
+    """
+    Record ticks with a steadily growing asteroid count and frame time.  Each line is written before the next is
+    recorded, as in a game running slower than the writer (lines queued together are written, and rotated, together).
+    :return: The closed MetricsLog.
+    """
+    log = MetricsLog(str(path), metrics_format, max_bytes, backup_count, **kwargs)
+    for tick in range(ticks):
+        log.record((10 + tick * 0.01) / 1000, asteroids=100 + tick, weapons=tick % 3)
+        while log.lines_written <= tick:
+            time.sleep(0.0001)
+    log.close()
+    return log
+
+
+def test_rotation_keeps_every_line(tmp_path):
+    path = tmp_path / "soak.ndjson"
+    log = write_log(path, METRICS_FORMAT_NDJSON, 200, max_bytes=8000)
+
+    files = log_files(str(path))
+    assert log.rotations > 0
+    assert files[-1] == str(path)
+    assert files[:-1] == ["{}.{}".format(path, i) for i in range(len(files) - 1, 0, -1)]
+    for filename in files[:-1]:
+        assert os.path.getsize(filename) >= log.max_bytes
+
+    line_count = sum(len(open(filename).read().splitlines()) for filename in files)
+    assert line_count == log.lines_written == 200
+    assert sum(os.path.getsize(filename) for filename in files) == log.bytes_written
+    assert read_log(str(path))["tick"].tolist() == list(range(1, 201))
+
+
+def test_rotation_deletes_the_oldest_files(tmp_path):
+    path = tmp_path / "soak.ndjson"
+    log = write_log(path, METRICS_FORMAT_NDJSON, 200, backup_count=2)
+
+    assert log.rotations > 2
+    assert log_files(str(path)) == [str(path) + ".2", str(path) + ".1", str(path)]
+    ticks = read_log(str(path))["tick"]
+    assert ticks[-1] == 200
+    assert np.all(np.diff(ticks) == 1)
+    assert len(ticks) < 200
+
+
+def test_csv_files_each_start_with_the_same_header(tmp_path):
+    path = tmp_path / "soak.csv"
+    log = write_log(path, METRICS_FORMAT_CSV, 200, max_bytes=8000)
+
+    files = log_files(str(path))
+    assert len(files) > 1
+    headers = [open(filename).readline() for filename in files]
+    assert headers == [headers[0]] * len(files)
+    assert headers[0].startswith("tick,time,frame_ms,asteroids,weapons,rss_bytes,")
+
+    line_count = sum(len(open(filename).read().splitlines()) for filename in files)
+    assert line_count == log.lines_written + len(files)
+    columns = read_log(str(path))
+    assert columns["tick"].tolist() == list(range(1, 201))
+    assert columns["asteroids"].tolist() == list(range(100, 300))
+
+
+def test_full_queue_drops_and_counts_lines(tmp_path):
+    log = MetricsLog(str(tmp_path / "soak.ndjson"), queue_lines=4)
+
+    # Hold the writer in its first write so the queue fills up
+    writing = threading.Event()
+    release = threading.Event()
+    write = log._write
+
+    def held_write(text, line_count):
+        writing.set()
+        release.wait()
+        write(text, line_count)
+
+    log._write = held_write
+    assert log.record(0.01)
+    assert writing.wait(5)
+    queued = [log.record(0.01) for i in range(10)]
+    release.set()
+    log.close()
+
+    assert queued == [True] * 4 + [False] * 6
+    assert log.lines_dropped == 6
+    assert log.lines_written == 5
+    assert log.tick == 11
+
+
+def test_hit_rates_are_per_tick(tmp_path):
+    path = tmp_path / "soak.ndjson"
+    counters = {"hits": 0, "misses": 0}
+    log = MetricsLog(str(path), counter_sources={"sprites": lambda: (counters["hits"], counters["misses"])})
+    for hits, misses in ((3, 1), (3, 1), (13, 1)):
+        counters["hits"] += hits
+        counters["misses"] += misses
+        log.record(0.01)
+    log.close()
+
+    assert read_log(str(path))["hit_rate sprites"].tolist() == [0.75, 0.75, round(13 / 14, 4)]
+
+
+def test_read_log_across_mixed_formats(tmp_path):
+    path = tmp_path / "soak.log"
+    write_log(path, METRICS_FORMAT_CSV, 50, max_bytes=10**6)
+    os.replace(str(path), str(path) + ".1")
+
+    log = MetricsLog(str(path), METRICS_FORMAT_NDJSON)
+    log.tick = 50
+    log.add_gauge("surfaces", lambda: 7)
+    log.record(0.02, asteroids=150)
+    log.close()
+
+    columns = read_log(str(path))
+    assert columns["tick"].tolist() == list(range(1, 52))
+    assert columns["asteroids"][-1] == 150
+    assert columns["frame_ms"][-1] == 20
+    assert np.all(np.isnan(columns["surfaces"][:50]))
+    assert columns["surfaces"][-1] == 7
+    assert np.isnan(columns["weapons"][-1])
+
+
+def test_summarize_reports_drift_and_frame_time_per_asteroid():
+    ticks = np.arange(1, 3601, dtype=float)
+    log = {"tick": ticks, "time": ticks,
+           "frame_ms": 10 + ticks * 0.01, "asteroids": 100 + ticks, "surfaces": np.full(3600, 5.0)}
+    lines = summarize(log, window_secs=60)
+
+    assert lines[0] == "3600 ticks over 1.00 hours, mean {:.1f} fps".format(1000 / np.mean(log["frame_ms"]))
+    rows = {line.split()[0]: line.split()[1:] for line in lines[2:-1]}
+    assert set(rows) == {"frame_ms", "asteroids", "surfaces"}
+    first, last, trend = (float(value) for value in rows["asteroids"])
+    assert first == np.mean(log["asteroids"][:61])
+    assert last == np.mean(log["asteroids"][-61:])
+    assert trend == 3600
+    assert abs(float(rows["surfaces"][2])) < 1e-9
+    assert lines[-1] == "frame time grows 1.000 ms per 100 asteroids"
+
+
+def test_summarize_needs_two_lines():
+    assert summarize({"tick": np.array([1.0]), "time": np.array([0.0])}) == ["Not enough lines to summarize."]
@@ -0,0 +1,182 @@
+# Networked multiplayer tests: snapshot encoding, client reconstruction and server bookkeeping
+
+import netplay
+from netplay import (ENTITY_FORMAT, FULL_SNAPSHOT, KIND_ASTEROID, KIND_PLASMA, KIND_SHIP, NET_MAX_PACKET, NO_SHIP,
+                     NetClient, NetServer, decode_snapshot, encode_snapshot, predict_record)
+
+
+def record(kind=KIND_ASTEROID, x=100, y=200, heading=0, speed_x=0, speed_y=0, spin=0):
+    return (kind, x, y, heading, 0, 0, speed_x, speed_y, spin)
+
+
+def apply(client, tick, base_tick, state, base_state):
+    """
+    Encode a snapshot on the server side and apply it on the client.
+    :return: (True if the client applied it, state the server expects the client to have)
+    """
+    packet, client_state = encode_snapshot(tick, base_tick, state, base_state, NO_SHIP, 0)
+    return client._apply_snapshot(packet), client_state
+
+
+def make_client():
+    # The client's socket is never used: snapshots are handed to it directly
+    client = NetClient(("127.0.0.1", 9))
+    client.close()
+    return client
+
+
+def test_full_snapshot_round_trip():
+    state = {1: record(speed_x=3), 2: record(KIND_PLASMA, 500, 600, 64, -5, 7), 3: record(KIND_SHIP, spin=-12)}
+    packet, client_state = encode_snapshot(10, FULL_SNAPSHOT, state, {}, 3, 42)
+
+    assert decode_snapshot(packet) == (10, FULL_SNAPSHOT, state, [], 3, 42)
+    assert client_state == state
+
+
+def test_delta_sends_only_mispredicted_new_and_removed_entities():
+    base_state = {1: record(speed_x=3), 2: record(x=300), 3: record(x=400)}
+    state = {1: predict_record(base_state[1], 2),      # Moved as predicted
+             2: record(x=350),                          # Drifted from its prediction
+             4: record(KIND_PLASMA)}                    # New; 3 was removed
+    packet, client_state = encode_snapshot(12, 10, state, base_state, NO_SHIP, 0)
+
+    tick, base_tick, changed, removed, ship_id, score = decode_snapshot(packet)
+    assert (tick, base_tick) == (12, 10)
+    assert changed == {2: state[2], 4: state[4]}
+    assert removed == [3]
+    assert client_state == state
+
+
+def test_client_rebuilds_server_state_from_deltas():
+    client = make_client()
+    states = {1: {1: record(speed_x=3), 2: record(x=300), 3: record(x=400)}}
+    states[2] = {1: predict_record(states[1][1], 1), 2: record(x=320), 3: states[1][3]}
+    states[3] = {1: predict_record(states[1][1], 2), 2: record(x=340), 4: record(KIND_PLASMA)}
+
+    applied, expected = apply(client, 1, FULL_SNAPSHOT, states[1], {})
+    assert applied and client.states[1] == expected == states[1]
+
+    applied, expected = apply(client, 2, 1, states[2], expected)
+    assert applied and client.states[2] == expected
+
+    applied, expected = apply(client, 3, 2, states[3], expected)
+    assert applied and client.states[3] == expected
+    assert 3 not in client.states[3]
+    assert client.latest_tick == 3
+
+
+def test_lost_ack_falls_back_to_an_older_base():
+    client = make_client()
+    states = {1: {1: record(), 2: record(x=300)}, 2: {1: record(x=150), 2: record(x=300)},
+              3: {1: record(x=200)}}
+
+    applied, history_1 = apply(client, 1, FULL_SNAPSHOT, states[1], {})
+    assert applied
+    applied, history_2 = apply(client, 2, 1, states[2], history_1)
+    assert applied
+
+    # The client's ack of tick 2 never reached the server, so tick 3 is still encoded against tick 1
+    applied, expected = apply(client, 3, 1, states[3], history_1)
+    assert applied and client.states[3] == expected
+    assert 2 not in client.states[3]
+
+
+def test_snapshot_on_an_unknown_base_is_rejected():
+    client = make_client()
+    applied, history_1 = apply(client, 1, FULL_SNAPSHOT, {1: record()}, {})
+    assert applied
+
+    # Encoded against a tick the client never received
+    applied, _ = apply(client, 3, 2, {1: record(x=150)}, {1: record(x=120)})
+    assert not applied
+    assert client.undecodable_snapshots == 1
+    assert client.latest_tick == 1
+
+
+def test_late_snapshot_is_ignored():
+    client = make_client()
+    assert apply(client, 5, FULL_SNAPSHOT, {1: record()}, {})[0]
+    assert not apply(client, 4, FULL_SNAPSHOT, {1: record(x=150)}, {})[0]
+    assert client.states[5] == {1: record()}
+
+
+def test_large_snapshot_is_capped_and_completed_by_later_deltas():
+    client = make_client()
+    entity_count = 2 * NET_MAX_PACKET // ENTITY_FORMAT.size
+    state = {entity_id: record(x=entity_id % 1000, y=entity_id // 1000) for entity_id in range(entity_count)}
+    state[entity_count] = record(KIND_SHIP)
+
+    packet, expected = encode_snapshot(1, FULL_SNAPSHOT, state, {}, entity_count, 0)
+    assert len(packet) <= NET_MAX_PACKET
+    assert client._apply_snapshot(packet)
+    assert client.states[1] == expected
+    assert entity_count in expected             # Ships are sent first
+
+    tick = 1
+    while expected != state:
+        tick += 1
+        packet, expected = encode_snapshot(tick, tick - 1, state, expected, entity_count, 0)
+        assert len(packet) <= NET_MAX_PACKET
+        assert client._apply_snapshot(packet)
+        assert client.states[tick] == expected
+    assert tick == 3
+
+
+def test_entity_ids_are_unique_and_reused_after_release(game):
+    server = NetServer(asteroid_count=5)
+    try:
+        first = server._world_state()
+        assert len(first) == 5
+
+        released = [server._entity_ids[rock] for rock in server.asteroids[:2]]
+        server.asteroids = server.asteroids[2:]
+        assert len(server._world_state()) == 3
+
+        server.asteroids += game.create_asteroids(4)
+        state = server._world_state()
+        assert len(state) == 7
+        assert set(released) <= set(state)
+        assert len(set(server._entity_ids[rock] for rock in server.asteroids)) == 7
+    finally:
+        server.close()
+
+
+def test_idle_player_is_dropped(game):
+    server = NetServer(asteroid_count=5)
+    client = NetClient(server.address)
+    try:
+        client.join()
+        server.step()
+        assert len(server.players) == 1
+
+        for tick in range(netplay.NET_PLAYER_TIMEOUT_TICKS):
+            server.step()
+        assert len(server.players) == 1
+
+        server.step()
+        assert not server.players
+    finally:
+        server.close()
+        client.close()
+
+
+def test_plasma_is_tracked_in_the_ships_weapon_slots(game):
+    server = NetServer(asteroid_count=5)
+    client = NetClient(server.address)
+    try:
+        client.join()
+        server.step()
+        player = next(iter(server.players.values()))
+
+        player.input_bits = netplay.INPUT_FIRE
+        server.step()
+        assert len(player.ship.weapon_slots) == 1
+        assert [record[0] for record in server._world_state().values()].count(KIND_PLASMA) == 1
+
+        next(iter(player.ship.weapon_slots)).is_alive = False
+        server.step()
+        assert len(player.ship.weapon_slots) == 0
+        assert KIND_PLASMA not in [record[0] for record in server._world_state().values()]
+    finally:
+        server.close()
+        client.close()
@@ -0,0 +1,40 @@
+# Frame pacing tests
+
+import time
+
+from pacing import ADAPTIVE_MIN_MARGIN, FramePacer, PACING_ADAPTIVE, PACING_SLEEP
+
+
+def test_frames_past_their_deadline_are_counted_late():
+    pacer = FramePacer(100, PACING_SLEEP)
+    pacer.wait()
+    pacer.wait()
+    assert pacer.late_frames == 0
+
+    # Behind by half a frame: paced from the same deadlines
+    time.sleep(0.015)
+    pacer.wait()
+    assert pacer.late_frames == 1
+
+    # Behind by more than a frame: pacing restarts from now, and the frame still counts as late
+    time.sleep(0.05)
+    pacer.wait()
+    assert pacer.late_frames == 2
+
+
+def test_adaptive_margin_ignores_a_single_late_wake_up():
+    pacer = FramePacer(100, PACING_ADAPTIVE, adapt_frames=60)
+    pacer.sleep_overshoots.extend([0.0001] * 59 + [0.008])
+    pacer._pace(time.perf_counter())
+    assert pacer.margin() == 0.0001 + ADAPTIVE_MIN_MARGIN
+
+    # Repeated late wake-ups raise it
+    pacer.sleep_overshoots.extend([0.003] * 10)
+    pacer._pace(time.perf_counter())
+    assert pacer.margin() == 0.003 + ADAPTIVE_MIN_MARGIN
+
+
+def test_jitter_histogram_counts_every_interval():
+    pacer = FramePacer(100, PACING_SLEEP)
+    pacer.frame_intervals.extend([0.01, 0.0101, 0.0107, 0.013, 0.05])
+    assert pacer.jitter_histogram() == [2, 0, 1, 0, 1, 0, 1]
@@ -0,0 +1,123 @@
+# Multicore chunked world tests: worker bands match the single process simulation, hand-offs included
+
+import random
+
+import pytest
+
+from lod import LodScheduler
+from parallel import ParallelChunkedWorld
+from world import ChunkedWorld
+
+LEVEL_WIDTH = 4000
+LEVEL_HEIGHT = 3000
+CHUNK_SIZE = 1000
+
+
+def make_rocks(seed, count):
+    from spaceobjects.Spaceobjects import Asteroid
+
+    rng = random.Random(seed)
+    rocks = []
+    for i in range(count):
+        # Fast vertical movement crosses the bands (and wraps around the level) many times
+        rock = Asteroid(rng.randint(0, LEVEL_WIDTH), rng.randint(0, LEVEL_HEIGHT), rng.randint(-10, 10),
+                        rng.randint(-60, 60), rng.randint(0, 359))
+        rock.spin = rng.choice([-2, 0, 3])
+        rock.select_size(rng.randint(0, Asteroid.MAX_SIZE))
+        rock.set_move_bounds(LEVEL_WIDTH, LEVEL_HEIGHT, edge_bounce=False)
+        rocks.append(rock)
+    return rocks
+
+
+def rock_state(rock):
+    return rock.coord_x, rock.coord_y, rock.speed_x, rock.speed_y, rock.size, round(rock.heading % 360, 6)
+
+
+@pytest.fixture
+def worlds():
+    created = []
+
+    def make_world(workers):
+        if workers is None:
+            world = ChunkedWorld(LEVEL_WIDTH, LEVEL_HEIGHT, CHUNK_SIZE, CHUNK_SIZE)
+        else:
+            world = ParallelChunkedWorld(LEVEL_WIDTH, LEVEL_HEIGHT, CHUNK_SIZE, CHUNK_SIZE, workers=workers,
+                                         capacity=512, max_weapons=8)
+        created.append(world)
+        return world
+
+    yield make_world
+    for world in created:
+        world.close()
+
+
+def run(game, world, ticks, weapons=()):
+    """
+    Run the world like the game loop with the camera jumping between corners.
+    :return: List of (weapon, asteroid) hits on sleeping asteroids.
+    """
+    cameras = [game.Viewport.Camera(800, 600, LEVEL_WIDTH, LEVEL_HEIGHT, x, y)
+               for x, y in ((500, 500), (3500, 2500), (3500, 500))]
+    lod = LodScheduler(enabled=False)
+    for a in make_rocks(5, 120):
+        world.add(a, lod.tick)
+
+    hits = []
+    for tick in range(ticks):
+        if tick % 5 == 0:
+            world.update_residency([cameras[tick // 30 % len(cameras)]], lod.tick)
+        lod.update(world.active, [], [])
+        world.begin_tick(weapons, lod.tick)
+        hits.extend(world.end_tick())
+
+    # Zoomed out over the whole level, everything wakes at the current tick
+    world.update_residency([game.Viewport.Camera(LEVEL_WIDTH, LEVEL_HEIGHT, LEVEL_WIDTH, LEVEL_HEIGHT,
+                                                 LEVEL_WIDTH // 2, LEVEL_HEIGHT // 2)], lod.tick)
+    assert world.sleeping_count() == 0
+    return hits
+
+
+def test_bands_match_the_single_process_run(game, worlds):
+    reference = worlds(None)
+    single = worlds(0)
+    bands = worlds(3)
+    for world in (reference, single, bands):
+        assert run(game, world, 200) == []
+
+    assert bands.handoff_count > 100
+    assert single.handoff_count == 0
+    assert bands.sleep_count == single.sleep_count == reference.sleep_count
+    expected = sorted(map(rock_state, reference.active))
+    assert sorted(map(rock_state, single.active)) == expected
+    assert sorted(map(rock_state, bands.active)) == expected
+
+
+def test_weapons_hit_sleeping_asteroids_in_every_band(game, worlds):
+    from spaceobjects.Spaceobjects import Plasma_weapon
+
+    def make_weapons():
+        # Fast shots across the middle of each band, far from the cameras
+        weapons = []
+        for y in (500, 1500, 2500):
+            weapon = Plasma_weapon(2000, y, 0, 0)
+            weapon.set_move_bounds(LEVEL_WIDTH, LEVEL_HEIGHT)
+            weapon.is_alive = True
+            weapons.append(weapon)
+        return weapons
+
+    results = []
+    for workers in (0, 3):
+        world = worlds(workers)
+        weapons = make_weapons()
+        hits = run(game, world, 200, weapons)
+        results.append(([weapons.index(weapon) for weapon, rock in hits], [rock_state(rock) for weapon, rock in hits],
+                         sorted(map(rock_state, world.active))))
+
+        assert world.count() == 120 - len(hits)
+        for weapon, rock in hits:
+            assert not weapon.is_alive
+            assert abs(rock.coord_x - weapon.coord_x) <= rock.sprite_width
+            assert abs(rock.coord_y - weapon.coord_y) <= rock.sprite_height
+
+    assert results[0][0], "no weapon hit a sleeping asteroid"
+    assert results[0] == results[1]
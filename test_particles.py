@@ -0,0 +1,28 @@
+# Particle system tests
+
+import numpy as np
+import pygame as pg
+
+from particles import ParticleSystem
+
+
+def test_spawn_from_pygame_color():
+    # pygame Colors (such as those in the game's colormap) have an alpha channel, which particles don't store
+    particles = ParticleSystem(capacity=100, seed=1)
+    color = pg.Color("orange")
+    particles.spawn(10, 20, 30, color=color)
+
+    assert particles.live_count == 30
+    spawned = particles.color[:30].astype(np.float32)
+    base = np.array(color[:3], dtype=np.float32)
+    assert np.all(spawned <= base + 1)
+    assert np.all(spawned >= base * 0.6 - 1)
+
+
+def test_spawn_wraps_at_capacity():
+    particles = ParticleSystem(capacity=50, seed=1)
+    particles.spawn(0, 0, 40, color=(255, 255, 255))
+    particles.spawn(0, 0, 40, color=pg.Color(255, 0, 0, 128))
+
+    assert particles.live_count == 50
+    assert np.all(particles.color[:30, 1:] == 0)
@@ -0,0 +1,349 @@
+# Performance budget tests
+#
+# Headless game scenarios checked against performance and allocation budgets.  Catches regressions such as assets
+# being loaded or constructed per frame and objects leaking between frames or ship instances.  Budgets on wall clock
+# time depend on the machine, so those tests are marked "perf" and only run with "python -m pytest --perf".
+
+import time
+import tracemalloc
+
+import numpy as np
+import pygame as pg
+import pytest
+
+from spaceobjects.Spaceobjects import *
+
+# Budgets
+BUDGET_IMAGE_LOADS_AFTER_WARMUP = 0
+BUDGET_SYSFONT_CALLS_PER_FRAME = 0
+BUDGET_HUD_CONSTRUCTIONS_PER_FRAME = 0
+BUDGET_TRACEMALLOC_GROWTH_BYTES = 256 * 1024
+BUDGET_TRACEMALLOC_TICKS = 10000
+BUDGET_UPDATE_1000_ASTEROIDS_MS = 1000 / 30     # One frame at the default frame rate
+BUDGET_UPDATE_BATCH_ASTEROIDS = 20000
+BUDGET_UPDATE_BATCH_MS = 1000 / 30
+BUDGET_SPAWN_ASTEROIDS = 500
+BUDGET_SPAWN_MS = 1000 / 30
+BUDGET_DEATHBLOSSOM_SURFACES_PER_FRAME = 0
+BUDGET_WEAPON_HIT_ASTEROIDS = 1000
+BUDGET_WEAPON_HIT_MS = 1000 / 30 / 10
+
+WARMUP_FRAMES = 30
+
+
+class CallCounter:
+    """
+    Counts calls to a module function while active.  The original function is still called.
+    """
+    def __init__(self, module, function_name):
+        self.module = module
+        self.function_name = function_name
+        self.original = getattr(module, function_name)
+        self.count = 0
+
+    def __enter__(self):
+        def counting_wrapper(*args, **kwargs):
+            self.count += 1
+            return self.original(*args, **kwargs)
+
+        setattr(self.module, self.function_name, counting_wrapper)
+        return self
+
+    def __exit__(self, *exc):
+        setattr(self.module, self.function_name, self.original)
+        return False
+
+
+def run_frames(game, frame_count):
+    """
+    Run the real game loop for a number of frames without frame rate limiting.
+    :param game: The asteroids module.
+    :param frame_count: Number of frames to run.
+    :return: None
+    """
+    saved_fps = game.GAMESPEED_FPS
+    game.GAMESPEED_FPS = 0
+    try:
+        game.game_loop(max_frames=frame_count)
+    finally:
+        game.GAMESPEED_FPS = saved_fps
+
+
+def test_no_image_loads_after_warmup(game):
+    run_frames(game, WARMUP_FRAMES)
+    with CallCounter(pg.image, "load") as loads:
+        run_frames(game, 100)
+        game.create_asteroids(50)
+        for i in range(3):
+            Ship(0, 0)
+    assert loads.count <= BUDGET_IMAGE_LOADS_AFTER_WARMUP, "{} image loads after warm-up".format(loads.count)
+
+
+def test_no_sysfont_per_frame(game):
+    run_frames(game, WARMUP_FRAMES)
+    frames = 100
+    with CallCounter(pg.font, "SysFont") as sysfont, CallCounter(pg.font, "Font") as font:
+        run_frames(game, frames)
+    calls = (sysfont.count + font.count) / frames
+    assert calls <= BUDGET_SYSFONT_CALLS_PER_FRAME, "{:.2f} font constructions per frame".format(calls)
+
+
+def test_render_hud_constructs_nothing(game):
+    ship = Ship(*game.SHIP_START_LOCATION)
+    rocks = game.create_asteroids(10)
+    game.render_hud(game.hud_surface, game.map_surface, ship, rocks, game.gamedata)
+
+    frames = 100
+    ships_created = [0]
+    original_init = Ship.__init__
+
+    def counting_init(self, *args, **kwargs):
+        ships_created[0] += 1
+        original_init(self, *args, **kwargs)
+
+    Ship.__init__ = counting_init
+    try:
+        with CallCounter(pg.image, "load") as loads, CallCounter(pg.font, "SysFont") as sysfont, \
+                CallCounter(pg.font, "Font") as font:
+            for i in range(frames):
+                game.render_hud(game.hud_surface, game.map_surface, ship, rocks, game.gamedata)
+    finally:
+        Ship.__init__ = original_init
+
+    constructions = (loads.count + sysfont.count + font.count + ships_created[0]) / frames
+    assert constructions <= BUDGET_HUD_CONSTRUCTIONS_PER_FRAME, \
+        "render_hud constructs {:.2f} assets per frame".format(constructions)
+
+
+def test_deathblossom_allocates_nothing(game):
+    def fire_deathblossom(ship):
+        frames = 0
+        ship.shoot("deathblossom")
+        while ship.is_firing_deathblossom:
+            ship.render()
+            ship.render_effect()
+            frames += 1
+            get_animator().advance(Ship.ANIMATION_DEATHBLOSSOM_FRAME_TIME / 2)
+        return frames
+
+    # First firing builds the effect frames
+    ship = Ship(*game.SHIP_START_LOCATION)
+    fire_deathblossom(ship)
+
+    with CallCounter(pg, "Surface") as surfaces:
+        frames = fire_deathblossom(ship)
+    per_frame = surfaces.count / frames
+    assert per_frame <= BUDGET_DEATHBLOSSOM_SURFACES_PER_FRAME, \
+        "deathblossom allocates {:.2f} surfaces per frame".format(per_frame)
+
+
+def test_ship_render_reuses_sprite(game):
+    # Without the sprite atlas, so any sprite made per frame would come from pygame.transform.rotate
+    set_render_backend(RENDER_BACKEND_SPRITE)
+    try:
+        ship = Ship(*game.SHIP_START_LOCATION)
+        ship.rotate(30)
+
+        # Alternate idle and thrust sprites at a fixed heading; sprites are kept so their ids can't be reused
+        sprites = []
+        frames = 100
+        with CallCounter(pg.transform, "rotate") as rotations:
+            for i in range(frames):
+                if i % 2:
+                    ship.thrust(0)
+                sprites.append(ship.render())
+    finally:
+        if game.SPRITE_ATLAS_ENABLED:
+            build_sprite_atlas([Asteroid, Plasma_weapon, Ship], game.SPRITE_ATLAS_ROTATION_STEPS)
+
+    distinct = len(set(map(id, sprites)))
+    assert distinct <= 2 and rotations.count <= 2, \
+        "ship made {} sprites ({} rotations) for 2 (sprite, rotation) pairs".format(distinct, rotations.count)
+
+
+def test_split_screen_resolves_once(game):
+    viewports = game.create_viewports(game.VIEW_LAYOUT_SPLIT, game.viewport)
+    x, y = viewports[0].camera.x, viewports[0].camera.y
+
+    # Asteroids around the ship view's center are in both views
+    rocks = game.create_asteroids(20)
+    for i, rock in enumerate(rocks):
+        rock.coord_x = x - 100 + i * 10
+        rock.coord_y = y - 100 + i * 10
+
+    queue = game.RenderQueue(viewports)
+    frames = 10
+    with CallCounter(Asteroid, "render") as renders:
+        for i in range(frames):
+            queue.add_objects(rocks)
+            queue.flush()
+    assert queue.shared == len(rocks) * frames, "{} of {} sprites shown in both views".format(
+        queue.shared, len(rocks) * frames)
+    assert renders.count <= len(rocks) * frames, "{} sprites resolved for {} asteroids over {} frames".format(
+        renders.count, len(rocks), frames)
+
+
+def test_ship_weapons_not_shared(game):
+    first_ship = Ship(0, 0)
+    first_ship.set_move_bounds(game.LEVEL_WIDTH, game.LEVEL_HEIGHT)
+    for i in range(Ship.WEAPON_PLASMA_MAXLIVE):
+        first_ship.shoot("plasma")
+
+    # A respawned ship must start with its full weapon capacity
+    second_ship = Ship(0, 0)
+    weapon = second_ship.shoot("plasma")
+    assert weapon is not None, "new ship cannot fire; weapon storage is shared between ship instances"
+
+
+def test_bounded_memory_growth(game):
+    ship = Ship(*game.SHIP_START_LOCATION)
+    ship.set_move_bounds(game.LEVEL_WIDTH, game.LEVEL_HEIGHT, edge_bounce=True)
+    rocks = game.create_asteroids(20)
+    weapons = []
+
+    def tick(i):
+        nonlocal ship, weapons
+        for rock in rocks:
+            rock.update()
+        ship.rotate(6)
+        ship.thrust(.5)
+        if i % 5 == 0:
+            weapon = ship.shoot("plasma")
+            if weapon:
+                weapon.set_move_bounds(edge_bounce=False)
+                # Expire immediately so the scenario does not depend on wall clock time
+                weapon.life_timeout = 0
+                weapons.append(weapon)
+        for weapon in weapons:
+            weapon.update()
+        weapons = [w for w in weapons if w.is_alive]
+        ship.update()
+
+        # Respawn a new ship periodically
+        if i % 500 == 0:
+            ship = Ship(*game.SHIP_START_LOCATION)
+            ship.set_move_bounds(game.LEVEL_WIDTH, game.LEVEL_HEIGHT, edge_bounce=True)
+
+    for i in range(1000):
+        tick(i)
+
+    tracemalloc.start()
+    start_size, start_peak = tracemalloc.get_traced_memory()
+    for i in range(BUDGET_TRACEMALLOC_TICKS):
+        tick(i)
+    end_size, end_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    growth = end_size - start_size
+    assert growth <= BUDGET_TRACEMALLOC_GROWTH_BYTES, \
+        "memory grew {} bytes over {} ticks".format(growth, BUDGET_TRACEMALLOC_TICKS)
+
+
+def worst_time_ms(function, repeat=100):
+    """
+    :param function: Function to time.
+    :param repeat: Number of calls.
+    :return: Longest call in milliseconds.
+    """
+    worst = 0
+    for i in range(repeat):
+        t0 = time.perf_counter()
+        function()
+        worst = max(worst, time.perf_counter() - t0)
+    return worst * 1000
+
+
+@pytest.mark.perf
+def test_update_1000_asteroids(game):
+    rocks = game.create_asteroids(1000)
+
+    def update():
+        for rock in rocks:
+            rock.update()
+
+    worst_ms = worst_time_ms(update)
+    assert worst_ms <= BUDGET_UPDATE_1000_ASTEROIDS_MS, "worst tick {:.2f} ms".format(worst_ms)
+
+
+@pytest.mark.perf
+def test_update_batch_asteroids(game):
+    rocks = game.create_asteroids(BUDGET_UPDATE_BATCH_ASTEROIDS)
+    worst_ms = worst_time_ms(lambda: update_batch(rocks))
+    assert worst_ms <= BUDGET_UPDATE_BATCH_MS, "worst tick {:.2f} ms for {} asteroids".format(
+        worst_ms, BUDGET_UPDATE_BATCH_ASTEROIDS)
+
+
+@pytest.mark.perf
+def test_spawn_placement(game):
+    spawner = game.spawner
+    ship_x, ship_y = game.SHIP_START_LOCATION
+    crowded = spawner.crowded
+    t0 = time.perf_counter()
+    points = spawner.place(BUDGET_SPAWN_ASTEROIDS, game.SPAWN_MIN_SEPARATION,
+                           [(ship_x, ship_y, game.SPAWN_SHIP_CLEARANCE)])
+    spawn_ms = (time.perf_counter() - t0) * 1000
+
+    # Separation used for this many asteroids in the level
+    separation = min(game.SPAWN_MIN_SEPARATION, spawner.PACKING * np.sqrt(
+        game.LEVEL_WIDTH * game.LEVEL_HEIGHT / BUDGET_SPAWN_ASTEROIDS))
+
+    x, y = np.array(points, dtype=float).T
+    distances = np.sqrt((x[:, None] - x[None, :]) ** 2 + (y[:, None] - y[None, :]) ** 2)
+    np.fill_diagonal(distances, np.inf)
+    ship_distance = np.sqrt((x - ship_x) ** 2 + (y - ship_y) ** 2).min()
+    assert spawner.crowded == crowded, "{} asteroids placed too close".format(spawner.crowded - crowded)
+    assert distances.min() >= separation, "asteroids placed {:.0f} px apart".format(distances.min())
+    assert ship_distance >= game.SPAWN_SHIP_CLEARANCE, "asteroid placed {:.0f} px from the ship".format(
+        ship_distance)
+    assert spawn_ms <= BUDGET_SPAWN_MS, "{:.2f} ms to place {} asteroids".format(spawn_ms, BUDGET_SPAWN_ASTEROIDS)
+
+
+def count_weapon_misses(game):
+    """
+    Fire diagonal shots at the fastest plasma speed past a small asteroid, on every line through its hitbox and
+    starting at every offset within one tick's movement.  Shots clipping a corner of the hitbox are the ones a
+    discrete hitbox test can miss.
+    :param game: The asteroids module.
+    :return: (shots that passed through the asteroid, shots fired)
+    """
+    speed = int(Ship.WEAPON_PLASMA_SPEED * np.cos(np.radians(45)) + Ship.MAX_SPEEDX)
+    rock = Asteroid(500, 300, 0, 0)
+    rock.select_size(0)
+    rock.set_move_bounds(game.LEVEL_WIDTH, game.LEVEL_HEIGHT, edge_bounce=False)
+    rock.rotate(0)
+    weapon = Plasma_weapon(0, 0)
+    reach = (rock.sprite_width + weapon.sprite_width) // 2 + (rock.sprite_height + weapon.sprite_height) // 2
+
+    misses = 0
+    shots = 0
+    for lateral in range(-reach // 2 + 1, reach // 2):
+        for offset in range(speed):
+            weapon = Plasma_weapon(400 + offset + lateral, 200 + offset - lateral, speed, speed)
+            weapon.set_move_bounds(game.LEVEL_WIDTH, game.LEVEL_HEIGHT, edge_bounce=False)
+            weapon.rotate(0)
+            while weapon.coord_x < 600 and not game.find_weapon_hits([weapon], [rock]):
+                update_batch([weapon])
+            if weapon.coord_x >= 600:
+                misses += 1
+            shots += 1
+    return misses, shots
+
+
+def test_swept_weapon_hits(game, monkeypatch):
+    monkeypatch.setattr(game, "WEAPON_SWEPT_COLLISIONS", False)
+    discrete_misses, shots = count_weapon_misses(game)
+    monkeypatch.setattr(game, "WEAPON_SWEPT_COLLISIONS", True)
+    swept_misses, shots = count_weapon_misses(game)
+
+    assert discrete_misses > 0
+    assert swept_misses == 0, "{} of {} fast shots passed through an asteroid".format(swept_misses, shots)
+
+
+@pytest.mark.perf
+def test_swept_weapon_hit_time(game, monkeypatch):
+    monkeypatch.setattr(game, "WEAPON_SWEPT_COLLISIONS", True)
+    rocks = game.create_asteroids(BUDGET_WEAPON_HIT_ASTEROIDS)
+    weapons = rocks[:Ship.WEAPON_PLASMA_MAXLIVE]
+    worst_ms = worst_time_ms(lambda: game.find_weapon_hits(weapons, rocks))
+    assert worst_ms <= BUDGET_WEAPON_HIT_MS, "worst tick {:.2f} ms for {} asteroids".format(
+        worst_ms, BUDGET_WEAPON_HIT_ASTEROIDS)
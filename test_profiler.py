@@ -0,0 +1,35 @@
+# Frame profiler tests: the disabled no-op hooks and turning recording on from the overlay
+
+from profiler import FrameProfiler
+
+
+def record_frame(profiler):
+    profiler.begin_frame()
+    profiler.mark("update")
+    profiler.mark("draw")
+    profiler.end_frame(asteroids=3)
+
+
+def test_disabled_profiler_records_nothing():
+    profiler = FrameProfiler(enabled=False)
+    assert profiler.begin_frame == profiler.mark == profiler.end_frame == profiler._noop
+
+    record_frame(profiler)
+    assert not profiler.frames
+    assert not profiler._marks
+
+
+def test_showing_the_overlay_turns_recording_on():
+    profiler = FrameProfiler(enabled=False)
+    profiler.toggle_overlay()
+    assert profiler.is_overlay_visible and profiler.enabled
+    record_frame(profiler)
+
+    # Hiding the overlay keeps recording for the trace export
+    profiler.toggle_overlay()
+    assert not profiler.is_overlay_visible and profiler.enabled
+    record_frame(profiler)
+
+    assert len(profiler.frames) == 2
+    assert list(profiler.stage_averages()) == ["update", "draw"]
+    assert profiler.counts == {"asteroids": 3}
@@ -0,0 +1,59 @@
+# Spawn placement tests: separation between new points and from occupied points, keep out circles and the area
+
+import math
+import random
+
+from spawn import SpawnPlacer
+
+
+def nearest(point, others):
+    return min(math.hypot(point[0] - x, point[1] - y) for x, y in others)
+
+
+def test_points_keep_the_separation_and_stay_out_of_keep_out_circles():
+    placer = SpawnPlacer(2000, 1500, rng=random.Random(1))
+    keep_out = [(1000, 750, 300), (100, 100, 150)]
+    points = placer.place(40, 80, keep_out)
+
+    assert len(points) == placer.placed == 40
+    assert placer.crowded == 0
+    for i, point in enumerate(points):
+        assert 0 <= point[0] <= 2000 and 0 <= point[1] <= 1500
+        assert all(isinstance(value, int) for value in point)
+        assert nearest(point, points[:i] + points[i + 1:]) >= 80
+        for x, y, radius in keep_out:
+            assert math.hypot(point[0] - x, point[1] - y) >= radius
+
+
+def test_points_keep_the_separation_from_occupied_points():
+    placer = SpawnPlacer(2000, 1500, rng=random.Random(2))
+    occupied = SpawnPlacer(2000, 1500, rng=random.Random(3)).place(60, 80)
+    points = placer.place(30, 80, occupied=occupied)
+
+    assert placer.crowded == 0
+    for point in points:
+        assert nearest(point, occupied) >= 80
+
+
+def test_points_in_an_area_keep_clear_of_occupied_points_around_it():
+    placer = SpawnPlacer(2000, 1500, rng=random.Random(4))
+    area = (500, 500, 120)
+
+    # One rock inside the area and a ring of rocks just outside it, and one far away that does not count
+    occupied = [(500, 500)] + [(round(500 + 150 * math.cos(angle)), round(500 + 150 * math.sin(angle)))
+                               for angle in [i * math.pi / 4 for i in range(8)]] + [(1800, 1400)]
+    points = placer.place(4, 40, area=area, occupied=occupied)
+
+    assert placer.crowded == 0
+    for point in points:
+        assert math.hypot(point[0] - 500, point[1] - 500) <= 121
+        assert nearest(point, occupied) >= 40
+        assert nearest(point, [p for p in points if p is not point]) >= 40
+
+
+def test_crowded_points_are_placed_and_counted():
+    placer = SpawnPlacer(200, 200, max_attempts=5, rng=random.Random(5))
+    points = placer.place(10, 500, keep_out=[(100, 100, 1000)])
+
+    assert len(points) == 10
+    assert placer.crowded == 10
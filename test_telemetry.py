@@ -0,0 +1,71 @@
+# Telemetry endpoint tests: command parsing, replies and queued commands
+
+import json
+import socket
+
+import pytest
+
+from telemetry import TelemetryServer, int_range, parse_bool
+
+
+@pytest.fixture
+def server():
+    server = TelemetryServer({"fps": int, "lod_enabled": parse_bool, "spawn": int_range(0, 100)}, 0,
+                             stream_interval=60)
+    yield server
+    server.close()
+
+
+def request(server, *lines):
+    """
+    Send lines to the endpoint and read a reply line per line sent.
+    :return: List of replies.
+    """
+    with socket.create_connection((server.host, server.port), timeout=5) as sock:
+        sock.sendall(b"".join(lines))
+        replies = sock.makefile("r")
+        return [json.loads(replies.readline()) for line in lines]
+
+
+def test_commands_are_queued_in_order(server):
+    replies = request(server, b"fps 60\n", b"lod_enabled off\n", b"spawn 100\n")
+
+    assert replies == [{"queued": "fps", "value": 60}, {"queued": "lod_enabled", "value": False},
+                       {"queued": "spawn", "value": 100}]
+    assert server.poll() == [("fps", 60), ("lod_enabled", False), ("spawn", 100)]
+    assert server.poll() == []
+
+
+def test_bad_commands_get_an_error_reply(server):
+    replies = request(server, b"warp 9\n", b"fps\n", b"fps fast\n", b"spawn 99999999\n")
+
+    assert [sorted(reply) for reply in replies] == [["error"]] * 4
+    assert replies[3] == {"error": "spawn: expected 0 to 100"}
+    assert server.poll() == []
+
+
+def test_line_over_the_buffer_limit_is_skipped(server):
+    long_line = b"fps " + b"9" * 200000 + b"\n"
+    replies = request(server, long_line, b"fps 45\n")
+
+    assert replies == [{"error": "line too long"}, {"queued": "fps", "value": 45}]
+    assert server.poll() == [("fps", 45)]
+
+
+def test_fps_command_retargets_dynamic_resolution(game, monkeypatch):
+    monkeypatch.setattr(game, "GAMESPEED_FPS", 30)
+    viewport = game.viewport
+    resolution = game.DynamicResolution([viewport], game.GAMESPEED_FPS)
+    try:
+        # 25 ms frames fit the 30 fps budget
+        for i in range(100):
+            resolution.update(0.025)
+        assert viewport.render_scale == 1
+
+        game.apply_command("fps", 60, None, resolution)
+        assert game.GAMESPEED_FPS == 60
+        for i in range(100):
+            resolution.update(0.025)
+        assert viewport.render_scale < 1
+    finally:
+        viewport.set_render_scale(1.0)
@@ -0,0 +1,133 @@
+# Chunked world tests: chunk activation, the resident chunk budget, sleep/wake round trips and the minimap
+
+import random
+
+import pytest
+
+from lod import LodScheduler
+from world import ChunkedWorld
+
+LEVEL_WIDTH = 4000
+LEVEL_HEIGHT = 3000
+CHUNK_SIZE = 1000
+
+
+@pytest.fixture
+def camera(game):
+    def make_camera(x, y, width=800, height=600):
+        return game.Viewport.Camera(width, height, LEVEL_WIDTH, LEVEL_HEIGHT, x, y)
+    return make_camera
+
+
+def make_rock(x, y, speed_x=0, speed_y=0):
+    from spaceobjects.Spaceobjects import Asteroid
+
+    rock = Asteroid(x, y, speed_x, speed_y)
+    rock.spin = 0
+    rock.set_move_bounds(LEVEL_WIDTH, LEVEL_HEIGHT, edge_bounce=False)
+    return rock
+
+
+def rock_state(rock):
+    return rock.coord_x, rock.coord_y, rock.speed_x, rock.speed_y, rock.size
+
+
+def one_rock_per_chunk(world):
+    for cy in range(world.chunks_y):
+        for cx in range(world.chunks_x):
+            world.add(make_rock(cx * CHUNK_SIZE + 500, cy * CHUNK_SIZE + 500))
+
+
+def active_chunks(world):
+    return {world.chunk_of(rock.coord_x, rock.coord_y) for rock in world.active}
+
+
+def test_chunks_around_the_camera_are_active(camera):
+    world = ChunkedWorld(LEVEL_WIDTH, LEVEL_HEIGHT, CHUNK_SIZE, CHUNK_SIZE)
+    one_rock_per_chunk(world)
+    assert world.active == [] and world.sleeping_count() == 12
+
+    world.update_residency([camera(500, 500)], 0)
+    assert world.resident_chunks == {(0, 0), (1, 0), (0, 1), (1, 1)}
+    assert active_chunks(world) == world.resident_chunks
+    assert world.sleeping_count() == 8 and world.wake_count == 4
+
+    # Moving to the opposite corner puts the first chunks back to sleep
+    world.update_residency([camera(3500, 2500)], 0)
+    assert world.resident_chunks == {(2, 1), (3, 1), (2, 2), (3, 2)}
+    assert active_chunks(world) == world.resident_chunks
+    assert world.sleep_count == 12 + 4 and world.wake_count == 8
+    assert world.count() == 12
+
+    # Asteroids added in a resident chunk are active, others sleep
+    world.add(make_rock(3900, 2900))
+    world.add(make_rock(100, 100))
+    assert len(world.active) == 5 and world.sleeping_count() == 9
+
+
+def test_resident_chunks_stay_within_the_budget(camera):
+    world = ChunkedWorld(LEVEL_WIDTH, LEVEL_HEIGHT, CHUNK_SIZE, CHUNK_SIZE, max_resident_chunks=3)
+    one_rock_per_chunk(world)
+
+    world.update_residency([camera(1500, 1500)], 0)
+    assert len(world.resident_chunks) == 3
+    assert (1, 1) in world.resident_chunks
+    assert active_chunks(world) == world.resident_chunks
+
+    # The main camera's chunk wins over the chunks around it, and a zoomed out camera over the budget
+    world.update_residency([camera(1500, 1500), camera(3500, 2500, LEVEL_WIDTH, LEVEL_HEIGHT)], 0)
+    assert len(world.resident_chunks) == 3
+    assert {(1, 1), (3, 2)} <= world.resident_chunks
+    assert len(world.active) == 3
+
+
+def test_sleep_and_wake_match_the_full_rate_simulation(camera):
+    world = ChunkedWorld(LEVEL_WIDTH, LEVEL_HEIGHT, CHUNK_SIZE, CHUNK_SIZE)
+    lod = LodScheduler(enabled=False)
+    rng = random.Random(7)
+
+    # Reference asteroids are stepped one tick at a time with the object update
+    references = []
+    for i in range(40):
+        x, y = rng.randint(0, LEVEL_WIDTH), rng.randint(0, LEVEL_HEIGHT)
+        speed_x, speed_y = rng.randint(-40, 40), rng.randint(-40, 40)
+        references.append(make_rock(x, y, speed_x, speed_y))
+        world.add(make_rock(x, y, speed_x, speed_y))
+
+    # The camera jumps between the corners so the asteroids sleep and wake several times
+    cameras = [camera(500, 500), camera(3500, 2500), camera(3500, 500)]
+    for tick in range(300):
+        if tick % 3 == 0:
+            world.update_residency([cameras[tick // 40 % len(cameras)]], lod.tick)
+        lod.update(world.active, [], [])
+        for rock in references:
+            rock.update()
+
+    assert world.sleep_count > 40 and world.wake_count > 40
+
+    # Zoomed out over the whole level, everything wakes at the current tick
+    world.update_residency([camera(2000, 1500, LEVEL_WIDTH, LEVEL_HEIGHT)], lod.tick)
+    assert world.sleeping_count() == 0
+    assert sorted(map(rock_state, world.active)) == sorted(map(rock_state, references))
+
+
+def test_minimap_shows_sleeping_asteroids(game, camera):
+    import pygame as pg
+    from spaceobjects.Spaceobjects import Ship
+
+    world = ChunkedWorld(LEVEL_WIDTH, LEVEL_HEIGHT, CHUNK_SIZE, CHUNK_SIZE)
+    world.add(make_rock(3600, 2700, speed_x=10))
+    world.add(make_rock(200, 300))
+    world.update_residency([camera(500, 500)], 0)
+    assert len(world.active) == 1 and world.sleeping_count() == 1
+
+    scale = 0.05
+    surface = pg.Surface((int(LEVEL_WIDTH * scale), int(LEVEL_HEIGHT * scale)))
+    ship = Ship(2000, 1500)
+    white = surface.map_rgb(game.colormap["white"])
+
+    # The sleeping asteroid is drawn where it is at the tick, not where it fell asleep
+    game.render_map(surface, ship, world.active, scale, sleeping=world.sleeping_positions(20))
+    assert surface.get_at_mapped((10, 15)) == white
+    assert surface.get_at_mapped((190, 135)) == white
+    assert surface.get_at_mapped((180, 135)) != white
@@ -0,0 +1,288 @@
+# Chunked world
+#
+# Divides the level into chunks so very large levels can be played.  Only chunks near the camera hold live
+# Asteroid objects; all other asteroids sleep in a compact NumPy array.
+
+import math
+
+import numpy as np
+from spaceobjects.Ecs import advance_wrapped
+from spaceobjects.Spaceobjects import Asteroid
+
+
+def chunk_ids(x, y, chunk_width, chunk_height, chunks_x, chunks_y):
+    """
+    :return: Array of the ids (cy * chunks_x + cx) of the chunks containing arrays of world coordinates.
+    """
+    cx = np.clip((x // chunk_width).astype(np.int64), 0, chunks_x - 1)
+    cy = np.clip((y // chunk_height).astype(np.int64), 0, chunks_y - 1)
+    return cy * chunks_x + cx
+
+
+class ChunkedWorld:
+    """
+    Holds the level's asteroids.  Resident chunks (those around the camera, up to a budget) have their asteroids in
+    the 'active' list, which the game loop simulates and draws like a normal asteroid list.  Asteroids outside the
+    resident chunks sleep as rows of one compact array and are not simulated per tick.  Each residency update
+    computes the sleeping asteroids' current positions analytically in one batch and wakes those that have entered a
+    resident chunk, so the world matches a full-rate simulation.
+    """
+
+    # Columns of the sleeping asteroid array
+    COL_X, COL_Y, COL_SPEED_X, COL_SPEED_Y, COL_HEADING, COL_SPIN, COL_SIZE, COL_TICK = range(8)
+    COLUMNS = 8
+
+    def __init__(self, level_width, level_height, chunk_width, chunk_height, active_radius=1, max_resident_chunks=16,
+                 enabled=True):
+        """
+        :param level_width: Width of the level.
+        :param level_height: Height of the level.
+        :param chunk_width: Width of a chunk.
+        :param chunk_height: Height of a chunk.
+        :param active_radius: Chunks within this many chunks of the camera's chunk are resident.
+        :param max_resident_chunks: Memory budget: the most chunks that can be resident at once.
+        :param enabled: True/False - If False every asteroid stays active and chunks are not used.
+        """
+        self.level_width = level_width
+        self.level_height = level_height
+        self.chunk_width = chunk_width
+        self.chunk_height = chunk_height
+        self.chunks_x = -(-level_width // chunk_width)
+        self.chunks_y = -(-level_height // chunk_height)
+        self.active_radius = active_radius
+        self.max_resident_chunks = max_resident_chunks
+        self.enabled = enabled
+
+        # Live asteroids in resident chunks.  The game loop uses (and may add to or remove from) this list.
+        self.active = []
+
+        self.resident_chunks = set()
+
+        # Sleeping asteroids, one row each, plus rows added since the last residency update
+        self._sleeping = np.zeros((0, self.COLUMNS))
+        self._pending_rows = []
+
+        # Number of asteroids woken and put to sleep
+        self.wake_count = 0
+        self.sleep_count = 0
+
+
+    def chunk_of(self, x, y):
+        """
+        :return: (chunk x, chunk y) containing a world coordinate.
+        """
+        cx = min(max(int(x // self.chunk_width), 0), self.chunks_x - 1)
+        cy = min(max(int(y // self.chunk_height), 0), self.chunks_y - 1)
+        return cx, cy
+
+
+    def add(self, asteroid, tick=0):
+        """
+        Add an asteroid to the world.
+        :param asteroid: Asteroid to add.
+        :param tick: Tick the asteroid is up to date with.
+        :return: None
+        """
+        self.extend([asteroid], tick)
+
+
+    def extend(self, asteroids, tick=0):
+        """
+        Add asteroids to the world.  Those outside the resident chunks go to sleep in one batch.
+        :param asteroids: List of asteroids to add.
+        :param tick: Tick the asteroids are up to date with.
+        :return: None
+        """
+        if not self.enabled:
+            self.active.extend(asteroids)
+            return
+
+        to_sleep = []
+        for asteroid in asteroids:
+            if self.chunk_of(asteroid.coord_x, asteroid.coord_y) in self.resident_chunks:
+                self.active.append(asteroid)
+            else:
+                to_sleep.append(asteroid)
+        self._sleep(to_sleep, tick)
+
+
+    def sleeping_count(self):
+        return len(self._sleeping) + len(self._pending_rows)
+
+
+    def count(self):
+        """
+        :return: Number of asteroids in the world (active and sleeping).
+        """
+        return len(self.active) + self.sleeping_count()
+
+
+    def positions(self, tick):
+        """
+        :param tick: Tick the world is up to date with.
+        :return: List of (x, y) positions of every asteroid in the world (active and sleeping).
+        """
+        points = [(rock.coord_x, rock.coord_y) for rock in self.active if rock.is_alive]
+        points.extend(map(tuple, self.sleeping_positions(tick).tolist()))
+        return points
+
+
+    def sleeping_positions(self, tick):
+        """
+        :param tick: Tick the world is up to date with.
+        :return: Array of shape (sleeping count, 2) of the (x, y) positions of the sleeping asteroids at the tick.
+        """
+        self._advance_sleeping(tick)
+        return self._sleeping[:, [self.COL_X, self.COL_Y]]
+
+
+    def _wanted_chunks(self, cameras):
+        """
+        Chunks that should be resident for the camera positions, nearest to a camera first (the earlier camera wins
+        ties) and limited to the resident chunk budget.
+        """
+        # A camera in a corner of the level has the fewest chunks around it; the budget never reaches past that
+        reach = math.ceil(math.sqrt(self.max_resident_chunks))
+
+        ranks = {}
+        for index, camera in enumerate(cameras):
+            ccx, ccy = self.chunk_of(camera.x, camera.y)
+
+            # A zoomed out camera may see further than the active radius
+            radius_x = min(max(self.active_radius, -(-camera.view_width // (2 * self.chunk_width))), reach)
+            radius_y = min(max(self.active_radius, -(-camera.view_height // (2 * self.chunk_height))), reach)
+            for cy in range(max(ccy - radius_y, 0), min(ccy + radius_y, self.chunks_y - 1) + 1):
+                for cx in range(max(ccx - radius_x, 0), min(ccx + radius_x, self.chunks_x - 1) + 1):
+                    rank = (max(abs(cx - ccx), abs(cy - ccy)), index)
+                    if rank < ranks.get((cx, cy), (float("inf"), 0)):
+                        ranks[(cx, cy)] = rank
+        return set(sorted(ranks, key=lambda chunk: (ranks[chunk], chunk))[:self.max_resident_chunks])
+
+
+    def update_residency(self, cameras, tick):
+        """
+        Update the resident chunks for the camera positions.  Active asteroids outside them go to sleep and sleeping
+        asteroids that are now inside them wake.
+        :param cameras: List of Viewport.Camera of every view of the world, the main view first.
+        :param tick: Tick the world is up to date with (the level of detail scheduler's tick).
+        :return: None
+        """
+        if not self.enabled:
+            return
+
+        wanted = self._wanted_chunks(cameras)
+
+        # Sleep active asteroids that are no longer in a wanted chunk
+        keep = []
+        to_sleep = []
+        for rock in self.active:
+            if not rock.is_alive:
+                continue
+            if self.chunk_of(rock.coord_x, rock.coord_y) in wanted:
+                keep.append(rock)
+            else:
+                to_sleep.append(rock)
+        self._sleep(to_sleep, tick)
+
+        keep.extend(self._wake_in(np.array([y * self.chunks_x + x for x, y in wanted]), tick))
+        self.resident_chunks = wanted
+
+        # Update in place since the game loop holds a reference to the list
+        self.active[:] = keep
+
+
+    def _wake_in(self, wanted_ids, tick):
+        """
+        Bring every sleeping asteroid up to date and wake those in the wanted chunks.
+        :param wanted_ids: Array of the ids of the wanted chunks.
+        :param tick: Tick the world is up to date with.
+        :return: List of the woken asteroids.
+        """
+        self._advance_sleeping(tick)
+        rows = self._sleeping
+        if not len(rows):
+            return []
+        waking = np.isin(chunk_ids(rows[:, self.COL_X], rows[:, self.COL_Y], self.chunk_width, self.chunk_height,
+                                   self.chunks_x, self.chunks_y), wanted_ids)
+        if not waking.any():
+            return []
+        self._sleeping = rows[~waking]
+        return self._wake(rows[waking], tick)
+
+
+    def begin_tick(self, weapons, tick):
+        """
+        Start simulating the sleeping asteroids for the tick.  Sleeping asteroids here are only advanced when needed,
+        so there is nothing to do; a world that simulates them every tick (see parallel.py) starts here and finishes
+        in end_tick(), so the work can overlap the rest of the frame.
+        :param weapons: Weapons in flight, which have moved this tick.
+        :param tick: Tick the world is up to date with after this tick (the level of detail scheduler's tick).
+        :return: None
+        """
+        pass
+
+
+    def end_tick(self):
+        """
+        Finish simulating the sleeping asteroids for the tick.
+        :return: List of (weapon, asteroid) hits of weapons on sleeping asteroids.  The asteroids have been woken and
+        have left the world.
+        """
+        return []
+
+
+    def close(self):
+        """
+        Release the world's resources.
+        :return: None
+        """
+        pass
+
+
+    def _sleep(self, rocks, tick):
+        """
+        Store asteroids as sleeping rows and release their entity rows.
+        """
+        for rock in rocks:
+            # Asteroids held back by the level of detail scheduler are only up to date as of their last LOD tick
+            rock_tick = rock.lod_tick if rock.lod_tick is not None else tick
+            self._pending_rows.append((rock.coord_x, rock.coord_y, rock.speed_x, rock.speed_y, rock.heading,
+                                       rock.spin, rock.size, rock_tick))
+            rock.release()
+        self.sleep_count += len(rocks)
+
+
+    def _advance_sleeping(self, tick):
+        """
+        Advance all sleeping rows to a tick in one batch.
+        """
+        if self._pending_rows:
+            self._sleeping = np.concatenate((self._sleeping, np.array(self._pending_rows, dtype=float)))
+            self._pending_rows = []
+
+        rows = self._sleeping
+        if not len(rows):
+            return
+
+        elapsed = tick - rows[:, self.COL_TICK]
+        rows[:, self.COL_X] = advance_wrapped(rows[:, self.COL_X], rows[:, self.COL_SPEED_X], 0, self.level_width, elapsed)
+        rows[:, self.COL_Y] = advance_wrapped(rows[:, self.COL_Y], rows[:, self.COL_SPEED_Y], 0, self.level_height, elapsed)
+        rows[:, self.COL_HEADING] = np.fmod(rows[:, self.COL_HEADING] + rows[:, self.COL_SPIN] * elapsed, 360)
+        rows[:, self.COL_TICK] = tick
+
+
+    def _wake(self, rows, tick):
+        """
+        Create Asteroid objects from sleeping rows that are up to date with the tick.
+        """
+        rocks = []
+        for row in rows.tolist():
+            a = Asteroid(row[self.COL_X], row[self.COL_Y], row[self.COL_SPEED_X], row[self.COL_SPEED_Y],
+                         row[self.COL_HEADING])
+            a.spin = row[self.COL_SPIN]
+            a.select_size(int(row[self.COL_SIZE]))
+            a.set_move_bounds(self.level_width, self.level_height, edge_bounce=False)
+            a.lod_tick = tick
+            rocks.append(a)
+        self.wake_count += len(rocks)
+        return rocks